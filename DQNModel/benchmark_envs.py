@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+from argparse import ArgumentParser
+from time import perf_counter
+
+import numpy as np
+
+from src.env_manager import PyEnvManager, ShardedPyEnvManager, StepBuffers
+from src.sim import VALID_ACTION_MASKS, Move
+
+
+def random_actions(valid_moves: np.ndarray) -> np.ndarray:
+    masks = VALID_ACTION_MASKS[valid_moves & 0xF]
+    choices = np.argmax(np.where(masks, np.random.random(masks.shape), -1.0), axis=1)
+    actions = (1 << choices).astype(np.uint8)
+    actions[~masks.any(axis=1)] = Move.NOMOVE.value
+    return actions
+
+
+def benchmark(env_manager, steps: int) -> float:
+    """
+    Steps every environment with random valid moves, returns environment steps per second
+    Finished games are left in place and keep stepping with NOMOVE
+    """
+    buffers = StepBuffers(env_manager.num_envs)
+    env_manager.reset_all()
+    env_manager.poll_results(buffers)
+    start = perf_counter()
+    for _ in range(steps):
+        env_manager.write_actions(random_actions(buffers.moves))
+        env_manager.poll_results(buffers)
+    return steps * env_manager.num_envs / (perf_counter() - start)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--num-env", type=int, required=False, default=4096)
+    parser.add_argument("--steps", type=int, required=False, default=200)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        required=False,
+        default=[1, 2, 4, 8],
+        help="Worker counts of the sharded environment manager to measure",
+    )
+    parser.add_argument("--pin-workers", action="store_true")
+    args = parser.parse_args()
+
+    env_man = PyEnvManager(args.num_env)
+    print(f"single process : {benchmark(env_man, args.steps):12.0f} steps/s")
+    for num_workers in args.workers:
+        env_man = ShardedPyEnvManager(args.num_env, num_workers, args.pin_workers)
+        try:
+            steps_per_sec = benchmark(env_man, args.steps)
+        finally:
+            env_man.close()
+        print(f"{num_workers:3d} workers    : {steps_per_sec:12.0f} steps/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,31 @@
 #!/usr/bin/env python3
 
+import hashlib
+import json
+import os
 from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
 
+import matplotlib
+
+matplotlib.use(
+    "Agg"
+)  # NOTE: non-interactive backend, figures are only ever saved to file
 import matplotlib.pyplot as plt
 import numpy as np
 
+from src.codec import unpack_boards
+from src.results import is_results_file, read_results
+
 
 def read_file(file_name: str) -> tuple[list[int], list[int], list[list[int]]]:
+    if is_results_file(file_name):
+        records = read_results(file_name)
+        return (
+            np.asarray(records["score"]),
+            np.asarray(records["max_tile"]),
+            unpack_boards(np.asarray(records["board"])),
+        )
     with open(file_name, "r", encoding="utf-8") as f:
         lines = f.readlines()
         lines = [line.rstrip("\n") for line in lines[1:]]
@@ -20,6 +39,74 @@ def read_file(file_name: str) -> tuple[list[int], list[int], list[list[int]]]:
         return (np.array(scores), np.array(max_tiles), np.array(board_states))
 
 
+PARSED_CACHE_DIR = os.path.join("cache", "parsed_data")
+RENDER_MANIFEST = os.path.join(PARSED_CACHE_DIR, "rendered.json")
+
+
+def file_digest(file_name: str) -> str:
+    sha = hashlib.sha256()
+    with open(file_name, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def load_data(file_name: str) -> tuple[np.ndarray, np.ndarray, np.ndarray, str]:
+    """
+    Returns (scores, max_tiles, board_states, digest) of a data file, parsing it only if the cached columns are stale
+    The cache is checked by size and mtime first and by content hash if those changed
+    """
+    stat = os.stat(file_name)
+    cache_file = os.path.join(PARSED_CACHE_DIR, os.path.basename(file_name) + ".npz")
+    if os.path.exists(cache_file):
+        with np.load(cache_file) as cached:
+            unchanged = (
+                cached["size"] == stat.st_size
+                and cached["mtime_ns"] == stat.st_mtime_ns
+            )
+            digest = str(cached["digest"]) if unchanged else file_digest(file_name)
+            if digest == str(cached["digest"]):
+                columns = (
+                    cached["scores"],
+                    cached["max_tiles"],
+                    cached["board_states"],
+                )
+                if not unchanged:
+                    # touched but not modified, refresh the stat so the next run skips hashing
+                    save_cache(cache_file, columns, stat, digest)
+                return (*columns, digest)
+
+    digest = file_digest(file_name)
+    columns = read_file(file_name)
+    save_cache(cache_file, columns, stat, digest)
+    return (*columns, digest)
+
+
+def save_cache(cache_file: str, columns, stat: os.stat_result, digest: str) -> None:
+    os.makedirs(PARSED_CACHE_DIR, exist_ok=True)
+    scores, max_tiles, board_states = columns
+    tmp_file = cache_file + ".tmp.npz"
+    np.savez(
+        tmp_file,
+        scores=scores,
+        max_tiles=max_tiles,
+        board_states=board_states,
+        size=stat.st_size,
+        mtime_ns=stat.st_mtime_ns,
+        digest=digest,
+    )
+    os.replace(tmp_file, cache_file)
+
+
+def graph_file_names(data_set_name: str) -> list[str]:
+    base = data_set_name.replace(" ", "_").lower()
+    return [
+        f"graphs/{base}_score.png",
+        f"graphs/{base}_max_tiles.png",
+        f"graphs/{base}_tile_reach_prob.png",
+    ]
+
+
 def generate_graphs(data_set_name, scores, max_tiles, board_states):
     # Score histogram
     plt.figure()
@@ -76,6 +163,18 @@ def reconstruct_board_state(board_str: str) -> list[int]:
 def main():
     parser = ArgumentParser()
     parser.add_argument("--file-name", required=True, type=str)
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only re-render checkpoint graphs whose data changed since they were last rendered",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        required=False,
+        default=None,
+        help="Processes rendering checkpoint graphs, defaults to the cpu count",
+    )
     args = parser.parse_args()
     step_counts = [0, 10, 20, 30, 40, 50, 60, 72]
     average_scores = []
@@ -83,19 +182,43 @@ def main():
     high_scores = []
     median_max_tiles = []
     highest_tiles = []
-    for step_count in step_counts:
-        file_base = args.file_name
-        file_name = f"raw_data/{step_count}_{file_base}"
-        scores, max_tiles, board_states = read_file(file_name)
-        generate_graphs(
-            f"{step_count} Million Step Trained", scores, max_tiles, board_states
-        )
 
-        average_scores.append(np.average(scores))
-        median_scores.append(np.median(scores))
-        high_scores.append(np.max(scores))
-        median_max_tiles.append(np.median(max_tiles))
-        highest_tiles.append(np.max(max_tiles))
+    rendered = {}
+    if args.incremental and os.path.exists(RENDER_MANIFEST):
+        with open(RENDER_MANIFEST, "r", encoding="utf-8") as f:
+            rendered = json.load(f)
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        renders = {}
+        for step_count in step_counts:
+            file_base = args.file_name
+            file_name = f"raw_data/{step_count}_{file_base}"
+            scores, max_tiles, board_states, digest = load_data(file_name)
+            data_set_name = f"{step_count} Million Step Trained"
+            up_to_date = rendered.get(data_set_name) == digest and all(
+                os.path.exists(graph) for graph in graph_file_names(data_set_name)
+            )
+            if not up_to_date:
+                future = pool.submit(
+                    generate_graphs, data_set_name, scores, max_tiles, board_states
+                )
+                renders[data_set_name] = (future, digest)
+
+            average_scores.append(np.average(scores))
+            median_scores.append(np.median(scores))
+            high_scores.append(np.max(scores))
+            median_max_tiles.append(np.median(max_tiles))
+            highest_tiles.append(np.max(max_tiles))
+
+        for data_set_name, (future, digest) in renders.items():
+            future.result()
+            rendered[data_set_name] = digest
+        print(
+            f"Rendered {len(renders)} of {len(step_counts)} checkpoints, the rest were up to date"
+        )
+    os.makedirs(PARSED_CACHE_DIR, exist_ok=True)
+    with open(RENDER_MANIFEST, "w", encoding="utf-8") as f:
+        json.dump(rendered, f, indent=2)
 
     plt.figure()
     plt.plot(step_counts, average_scores)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+from argparse import ArgumentParser
+from time import perf_counter
+
+import numpy as np
+import tensorflow as tf
+
+from src.inference import QUANTIZE_TYPES, NumpyDuelingDQN, export_dueling_dqn
+from src.model import DuelingDQN
+
+
+def time_calls(forward, states: np.ndarray) -> float:
+    """
+    Returns the mean seconds of forward(state[None]) over every state
+    """
+    start = perf_counter()
+    for state in states:
+        forward(state[None])
+    return (perf_counter() - start) / len(states)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--network",
+        type=str,
+        required=False,
+        help="Path to the common base of the network weights files, the q-network is exported",
+    )
+    parser.add_argument(
+        "--q-network",
+        type=str,
+        required=False,
+        help="Path to the q-network file, not compatible with --network",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        required=True,
+        help="File the weights are written to, play them with run_model.py --input network --network <output>.npz",
+    )
+    parser.add_argument(
+        "--quantize",
+        type=str,
+        required=False,
+        default="float32",
+        help="Storage type of the dense kernels, valid options: float32, float16, int8",
+    )
+    parser.add_argument(
+        "--check-states",
+        type=int,
+        required=False,
+        default=4096,
+        help="Random boards the numpy network is compared with the keras network on, 0 skips the check",
+    )
+    args = parser.parse_args()
+
+    if bool(args.network) == bool(args.q_network):
+        print("error: exactly one of --network and --q-network required")
+        return 1
+    if args.quantize not in QUANTIZE_TYPES:
+        print(
+            f"error: quantize type {args.quantize} not recognized, valid options: float32, float16, int8"
+        )
+        return 1
+
+    STATE_DIM = 16
+    ACTION_DIM = 4
+
+    q_network = args.q_network or args.network + "_policy.weights.h5"
+    model = DuelingDQN(STATE_DIM, ACTION_DIM)
+    model(tf.zeros((1, STATE_DIM), dtype=tf.float32))
+    print(f"Loading Q-Network: {q_network}")
+    model.load_weights(q_network)
+
+    output = args.output if args.output.endswith(".npz") else args.output + ".npz"
+    export_dueling_dqn(model, output, args.quantize)
+    print(f"Exported {args.quantize} weights to {output}")
+    if args.check_states <= 0:
+        return 0
+
+    # boards with the tiles of a typical game, every cell empty or up to 2^11
+    rng = np.random.default_rng(0)
+    states = rng.integers(0, 12, (args.check_states, STATE_DIM)).astype(np.float32)
+    states[rng.random(states.shape) < 0.4] = 0
+    expected = model(tf.convert_to_tensor(states)).numpy()
+    network = NumpyDuelingDQN.load(output, max_batch=len(states))
+    q_values = network(states).copy()
+
+    error = np.abs(q_values - expected).max()
+    scale = np.abs(expected).max()
+    agreement = np.mean(np.argmax(q_values, axis=1) == np.argmax(expected, axis=1))
+    keras_time = time_calls(
+        lambda s: model(tf.convert_to_tensor(s)).numpy(), states[:256]
+    )
+    numpy_time = time_calls(network, states[:256])
+    print(f"MAX ERROR  : {error:.3g} ({error / scale:.3g} of the largest q-value)")
+    print(f"SAME MOVE  : {agreement:.2%} of {len(states)} states")
+    print(f"KERAS CALL : {keras_time * 1e6:.0f} us per state")
+    print(f"NUMPY CALL : {numpy_time * 1e6:.0f} us per state")
+
+    # float32 only reorders the float sums, quantized kernels are expected to move the q-values a little
+    if args.quantize == "float32" and error > 1e-4 * max(scale, 1):
+        print("error: numpy q-values differ from the keras network")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -2,12 +2,48 @@
 
 from argparse import ArgumentParser
 
-import tensorflow as tf
 import numpy as np
 
-from src.agent import DQNAgent, RandomAgent, UserAgent
-from src.env_manager import CPPEnvManager, PyEnvManager, WebEnvManager
-from src.play import play_dqn, play_py_dqn, play_web_dqn
+from src.agent import (
+    ExpectimaxAgent,
+    NumpyDQNAgent,
+    RandomAgent,
+    RolloutAgent,
+    UserAgent,
+)
+from src.env_manager import CPPEnvManager, WebEnvManager
+from src.play import evaluate, play_dqn, play_py_dqn, play_web_dqn
+from src.results import ResultsWriter
+from src.sim import LookupTable, Simulator
+
+
+def load_keras_agent(args, state_dim: int, action_dim: int):
+    """
+    Returns a DQNAgent holding the networks passed in args, tensorflow is only imported here
+    so every other input plays without it
+    """
+    import tensorflow as tf
+
+    from src.dqn_agent import DQNAgent
+
+    gpus = tf.config.list_physical_devices("GPU")
+    if gpus:
+        tf.config.experimental.set_memory_growth(gpus[0], True)
+        print("Using GPU")
+    else:
+        print("GPU not detected")
+
+    agent = DQNAgent(state_dim, action_dim)
+    if args.network:
+        q_network = args.network + "_policy.weights.h5"
+        target_network = args.network + "_target.weights.h5"
+    else:
+        q_network = args.q_network
+        target_network = args.target_network
+    print(f"Loading Q-Network: {q_network}")
+    print(f"Loading Target-Network: {target_network}")
+    agent.load_weights(q_network, target_network)
+    return agent
 
 
 def main():
@@ -17,14 +53,15 @@ def main():
         type=str,
         required=True,
         default=False,
-        help="Method of providing input, valid options: network, random, user",
+        help="Method of providing input, valid options: network, random, user, expectimax, rollout",
     )
     parser.add_argument("--env-type", type=str, required=False, default="py")
     parser.add_argument(
         "--network",
         type=str,
         required=False,
-        help="Path to the common base of the network weights files, only valid if input type is network",
+        help="Path to the common base of the network weights files, or to weights exported with export_model.py "
+        "ending in .npz to play with numpy and without tensorflow, only valid if input type is network",
     )
     parser.add_argument(
         "--q-network",
@@ -44,13 +81,57 @@ def main():
         required=False,
         help="Optionally run many runs and collect averages",
     )
+    parser.add_argument(
+        "--parallel-games",
+        type=int,
+        required=False,
+        default=64,
+        help="Games played at once with batched action selection, only valid with --average-runs",
+    )
+    parser.add_argument(
+        "--results-file",
+        type=str,
+        required=False,
+        default="results.bin",
+        help="Binary results file every finished game is appended to, only valid with --average-runs",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        required=False,
+        default=None,
+        help="Seed of the evaluation games, random if not passed and recorded with every result",
+    )
+    parser.add_argument(
+        "--depth",
+        type=int,
+        required=False,
+        default=None,
+        help="Moves searched ahead, the depth limit when --time-budget is passed for expectimax, "
+        "the moves per rollout for rollout, defaults to 3 and 20, only valid if input type is expectimax or rollout",
+    )
+    parser.add_argument(
+        "--time-budget",
+        type=float,
+        required=False,
+        default=None,
+        help="Seconds of search per move, deepening or playing more rollouts until it runs out, only valid if input type is expectimax or rollout",
+    )
+    parser.add_argument(
+        "--prob-cutoff",
+        type=float,
+        required=False,
+        default=1e-4,
+        help="Spawn sequences less likely than this are scored by the heuristic, only valid if input type is expectimax",
+    )
+    parser.add_argument(
+        "--rollouts",
+        type=int,
+        required=False,
+        default=64,
+        help="Rollouts per move and batch, only valid if input type is rollout",
+    )
     args = parser.parse_args()
-    gpus = tf.config.list_physical_devices("GPU")
-    if gpus:
-        tf.config.experimental.set_memory_growth(gpus[0], True)
-        print("Using GPU")
-    else:
-        print("GPU not detected")
 
     STATE_DIM = 16
     ACTION_DIM = 4
@@ -64,6 +145,30 @@ def main():
         case "user":
             print("Playing with user input")
             agent = UserAgent()
+        case "expectimax":
+            depth = args.depth if args.depth is not None else 3
+            if depth < 1:
+                print("error: --depth must be at least 1")
+                return
+            print(
+                f"Playing with expectimax search, depth {depth}"
+                + (f", {args.time_budget}s per move" if args.time_budget else "")
+            )
+            agent = ExpectimaxAgent(
+                LookupTable(), depth, args.time_budget, args.prob_cutoff
+            )
+        case "rollout":
+            depth = args.depth if args.depth is not None else 20
+            if depth < 1 or args.rollouts < 1:
+                print("error: --depth and --rollouts must be at least 1")
+                return
+            print(
+                f"Playing with {args.rollouts} random rollouts of {depth} moves per move"
+                + (f", {args.time_budget}s per move" if args.time_budget else "")
+            )
+            agent = RolloutAgent(
+                LookupTable(), args.rollouts, depth, args.time_budget, seed=args.seed
+            )
         case "network":
             if not args.network and not (args.q_network and args.target_network):
                 print(
@@ -75,24 +180,20 @@ def main():
                     "error: --network not compatible with --q-network or --target-network"
                 )
                 return
-            agent = DQNAgent(STATE_DIM, ACTION_DIM)
-            if args.network:
-                q_network = args.network + "_policy.weights.h5"
-                target_network = args.network + "_target.weights.h5"
+            if args.network and args.network.endswith(".npz"):
+                print(f"Loading exported network: {args.network}")
+                agent = NumpyDQNAgent(args.network)
             else:
-                q_network = args.q_network
-                target_network = args.target_network
-            print(f"Loading Q-Network: {q_network}")
-            print(f"Loading Target-Network: {target_network}")
-            agent.load_weights(q_network, target_network)
+                agent = load_keras_agent(args, STATE_DIM, ACTION_DIM)
         case _:
-            print("error: invalid input method, valid options: network, random, user")
+            print(
+                "error: invalid input method, valid options: network, random, user, expectimax, rollout"
+            )
             return
 
     match (args.env_type):
         case "py":
-            env_man = PyEnvManager(1)
-            env = env_man.envs[0]
+            env = Simulator(0, LookupTable())
             if not args.average_runs:
                 play_py_dqn(agent, env)
                 print("RESULTS")
@@ -100,18 +201,22 @@ def main():
                 env.print_board(False)
                 print(f"SCORE: {env.score}")
             else:
-                print(f"Averaging across {args.average_runs}")
-                scores = []
-                max_tiles = []
-                end_states = []
-                for i in range(args.average_runs):
-                    print(f"Game {i} in progress...")
-                    env.reset()
-                    play_py_dqn(agent, env)
-                    unpacked_board = env.get_board(packed=False)
-                    scores.append(env.score)
-                    max_tiles.append(1 << unpacked_board[np.argmax(unpacked_board)])
-                    end_states.append(unpacked_board.copy())
+                if isinstance(agent, UserAgent):
+                    print("error: --average-runs not supported with user input")
+                    return
+                print(
+                    f"Averaging across {args.average_runs}, {args.parallel_games} games at a time"
+                )
+                seed = (
+                    args.seed
+                    if args.seed is not None
+                    else int(np.random.default_rng().integers(2**63))
+                )
+                print(f"Writing results to {args.results_file} with seed {seed}")
+                with ResultsWriter(args.results_file, seed) as writer:
+                    scores, max_tiles, end_states = evaluate(
+                        agent, args.average_runs, args.parallel_games, seed, writer
+                    )
                 avg_score = np.mean(scores)
                 highest_score = np.max(scores)
                 median_max_tile = np.median(max_tiles)
@@ -121,10 +226,6 @@ def main():
                 print(f"HIGH SCORE : {highest_score}")
                 print(f"MEDIAN TILE: {median_max_tile}")
                 print(f"MAX TILE   : {highest_max_tile}")
-                with open("output.txt", "a", encoding="utf-8") as f:
-                    f.write("score,max_tile,board_state\n")
-                    for i in range(args.average_runs):
-                        f.write(f"{scores[i]},{max_tiles[i]},{end_states[i]}\n")
         case "cpp":
             # TODO: Implement averaging, API is different between the two ENVs so its not trivial to just replace the env
             env_man = CPPEnvManager(1)
@@ -136,6 +237,20 @@ def main():
             print(
                 f'Environment type {args.env_type} not recognized, valid options: "py" and "cpp"'
             )
+            return
+
+    if isinstance(agent, ExpectimaxAgent):
+        engine = agent.engine
+        print(
+            f"SEARCH     : {engine.searches} searches, {engine.nodes} nodes, "
+            f"{engine.nodes_per_sec():.0f} nodes/sec"
+        )
+    elif isinstance(agent, RolloutAgent):
+        engine = agent.engine
+        print(
+            f"SEARCH     : {engine.searches} searches, {engine.rollouts_played} rollouts, "
+            f"{engine.rollouts_per_sec():.0f} rollouts/sec"
+        )
 
 
 if __name__ == "__main__":
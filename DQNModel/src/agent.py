@@ -1,186 +1,162 @@
 import numpy as np
-import tensorflow as tf
-from tensorflow.keras import optimizers  # type: ignore
 
-from src.model import DQN, DuelingDQN
-from src.buffer import ReplayBuffer
-from src.utils import unpack_64bit_state
-from src.sim import Move
+from src.codec import pack_boards
+from src.inference import NumpyDuelingDQN
+from src.search import Expectimax, MonteCarlo
+from src.sim import VALID_ACTION_MASKS, LookupTable, Move
 
 
-class DQNAgent:
-    def __init__(
-        self,
-        state_dim: int,
-        action_dim: int,
-        lr: float = 1e-3,
-        gamma: float = 0.99,
-        buffer_capacity: int = 100000,
-        batch_size: int = 64,
-    ) -> None:
-        self.action_dim: int = action_dim
-        self.gamma: float = gamma
-        self.batch_size: int = batch_size
-        self.loss_fn = tf.keras.losses.Huber(delta=1.0)
-        self.decay_steps = 2_000_000
-
-        with tf.device("/GPU:0"):
-            self.q_network: DuelingDQN = DuelingDQN(state_dim, action_dim)
-            self.target_network: DuelingDQN = DuelingDQN(state_dim, action_dim)
-            # NOTE: use a dummy to preload the networks on GPU, since they build lazily
-            dummy = tf.zeros((1, state_dim), dtype=tf.float32)
-            self.q_network(dummy)
-            self.target_network(dummy)
-
-        self.optimizer: optimizers.Optimizer = optimizers.Adam(
-            learning_rate=lr, clipnorm=5.0
-        )
-        self.replay_buffer: ReplayBuffer = ReplayBuffer(buffer_capacity, (state_dim,))
+class NumpyDQNAgent:
+    """
+    Agent that plays the greedy moves of a DuelingDQN exported with src.inference.export_dueling_dqn,
+    running the network in numpy so playing needs no tensorflow
+    """
 
-    def load_weights(self, q_net_path: str, target_net_path: str) -> None:
-        with tf.device("/GPU:0"):
-            self.q_network.load_weights(q_net_path)
-            self.target_network.load_weights(target_net_path)
+    def __init__(self, weights_path: str):
+        self.network = NumpyDuelingDQN.load(weights_path)
 
     def select_action(
         self, state: np.ndarray, epsilon: float, valid_actions: int
     ) -> int:
         """
-        Epsilon-greedy action selection using valid_actions bitflags.
+        Epsilon-greedy action selection using valid_actions bitflags, NOMOVE if there are none
         """
-        if (
-            valid_actions == 0
-        ):  # no valid moves, game ended, shouldn't ever happen because ended games will restart before calling this
-            raise ValueError("HOW")
-
-        valid_actions_arr = np.flatnonzero(
-            [(valid_actions >> i) & 1 for i in range(self.action_dim)]
-        )
-
+        mask = VALID_ACTION_MASKS[valid_actions & 0xF]
+        if not mask.any():
+            return Move.NOMOVE.value
         if np.random.rand() < epsilon:
-            return 1 << np.random.choice(valid_actions_arr)
-
-        state_tensor = tf.convert_to_tensor(state[None, :], dtype=tf.float32)
-        with tf.device("/GPU:0"):
-            q_values = self.q_network(state_tensor)[0].numpy()
-
-        mask = np.full_like(q_values, -np.inf)
-        mask[valid_actions_arr] = q_values[valid_actions_arr]
-
-        # Return as bitflag
-        return 1 << int(np.argmax(mask))
+            keys = np.where(mask, np.random.random(mask.shape), -1.0)
+            return 1 << int(np.argmax(keys))
+        q_values = self.network(np.asarray(state)[None, :])[0]
+        return 1 << int(np.argmax(np.where(mask, q_values, -np.inf)))
 
     def select_actions_batch(
         self, states: np.ndarray, epsilon: float, valid_actions_list: np.ndarray
     ) -> np.ndarray:
         """
-        Batch epsilon-greedy action selection.
-        states: shape (num_envs, state_dim)
-        valid_actions_list: array of int bitflags, shape (num_envs,)
-        Returns: array of actions as bitflags, shape (num_envs,)
+        Batch epsilon-greedy action selection, returns actions as bitflags, NOMOVE for envs without valid moves
         """
-        num_envs = states.shape[0]
-        actions = np.zeros(num_envs, dtype=np.uint8)
+        states = np.asarray(states)
+        masks = VALID_ACTION_MASKS[np.asarray(valid_actions_list) & 0xF]
+        no_move = ~masks.any(axis=1)
+        keys = np.where(masks, np.random.random(masks.shape), -1.0)
+        choices = np.argmax(keys, axis=1)
+        greedy = (np.random.random(len(states)) >= epsilon) & ~no_move
+        if greedy.any():
+            q_values = self.network(states[greedy])
+            choices[greedy] = np.argmax(
+                np.where(masks[greedy], q_values, -np.inf), axis=1
+            )
+        actions = (1 << choices).astype(np.uint8)
+        actions[no_move] = Move.NOMOVE.value
+        return actions
 
-        # forward pass for all states at once
-        state_tensor = tf.convert_to_tensor(
-            np.stack(states).astype(np.float32), dtype=tf.float32
-        )
-        with tf.device("/GPU:0"):
-            q_values_batch = self.q_network(
-                state_tensor
-            ).numpy()  # shape: (num_envs, action_dim)
 
-        for i in range(num_envs):
-            valid_actions = valid_actions_list[i]
+class RandomAgent:
+    """
+    Agent that supplies random moves
+    """
 
-            if valid_actions == Move.NOMOVE.value:
-                actions[i] = Move.NOMOVE.value
-                continue
+    def __init__(self, state_dim: int, action_dim: int):
+        self.action_dim = action_dim
+        self.state_dim = state_dim
 
-            # convert bitflags to indices
-            valid_indices = np.flatnonzero(
-                [(valid_actions >> j) & 1 for j in range(self.action_dim)]
-            )
+    def select_action(
+        self, state: np.ndarray, epsilon: float, valid_actions: int
+    ) -> int:
+        if (valid_actions & 0b00010000) > 0:  # no valid moves, game is ended
+            return 0b00010000
+        valid_actions_arr = [
+            i for i in range(self.action_dim) if (valid_actions >> i) & 1
+        ]
+        return 1 << np.random.choice(valid_actions_arr)
 
-            if np.random.rand() < epsilon:
-                actions[i] = 1 << np.random.choice(valid_indices)
-                continue
+    def select_actions_batch(
+        self, states: np.ndarray, epsilon: float, valid_actions_list: np.ndarray
+    ) -> np.ndarray:
+        """
+        Random valid action for every env as bitflags, NOMOVE for envs without valid moves
+        """
+        masks = VALID_ACTION_MASKS[np.asarray(valid_actions_list) & 0xF]
+        keys = np.where(masks, np.random.random(masks.shape), -1.0)
+        actions = (1 << np.argmax(keys, axis=1)).astype(np.uint8)
+        actions[~masks.any(axis=1)] = Move.NOMOVE.value
+        return actions
 
-            mask = np.full_like(q_values_batch[i], -np.inf)
-            mask[valid_indices] = q_values_batch[i, valid_indices]
 
-            actions[i] = 1 << int(np.argmax(mask))
+class SearchAgent:
+    """
+    Agent that plays the best move of a search engine, engine.search(board) returns the value of every move
+    """
 
-        return actions
+    def __init__(self, engine: Expectimax | MonteCarlo):
+        self.engine = engine
 
-    def update(self) -> bool:
+    def select_action(
+        self, state: np.ndarray, epsilon: float, valid_actions: int
+    ) -> int:
         """
-        Updates the model gradients
+        state: unpacked board of shape (16,), or a packed np.uint64 board
+        epsilon is ignored, the search always plays its best move
         """
-        if self.replay_buffer.size < self.batch_size:
-            return False
+        mask = VALID_ACTION_MASKS[valid_actions & 0xF]
+        if not mask.any():
+            return Move.NOMOVE.value
+        state = np.asarray(state)
+        board = int(state) if state.dtype == np.uint64 else int(pack_boards(state))
+        values = self.engine.search(board)
+        return 1 << int(np.argmax(np.where(mask, values, -np.inf)))
 
-        states, actions, rewards, next_states, dones = self.replay_buffer.sample(
-            self.batch_size
-        )
-        actions_idx = tf.cast(
-            tf.math.log(tf.cast(actions, tf.float32)) / tf.math.log(2.0), tf.int32
-        )
-        self.__update_step(
-            tf.convert_to_tensor(states, tf.float32),
-            tf.convert_to_tensor(next_states, tf.float32),
-            tf.convert_to_tensor(actions_idx, tf.int32),
-            tf.convert_to_tensor(rewards, tf.float32),
-            tf.convert_to_tensor(dones, tf.float32),
-        )
-        return True
-
-    @tf.function
-    def __update_step(self, states, next_states, actions, rewards, dones) -> None:
+    def select_actions_batch(
+        self, states: np.ndarray, epsilon: float, valid_actions_list: np.ndarray
+    ) -> np.ndarray:
         """
-        Helper function for gradient updates, separates all tensorflow functions into a single function for GPU utilization
+        Searches every env in turn, returns actions as bitflags, NOMOVE for envs without valid moves
         """
-        next_action = tf.cast(tf.argmax(self.q_network(next_states), axis=1), tf.int32)
-        next_q_target = tf.gather(
-            self.target_network(next_states), next_action, batch_dims=1
+        return np.array(
+            [
+                self.select_action(state, epsilon, int(valid_actions))
+                for state, valid_actions in zip(states, valid_actions_list)
+            ],
+            dtype=np.uint8,
         )
 
-        target = rewards + self.gamma * (1.0 - dones) * next_q_target
-
-        with tf.GradientTape() as tape:
-            q = self.q_network(states)
-            q_selected = tf.gather(q, actions, batch_dims=1)
-            loss = self.loss_fn(target, q_selected)
 
-        grads = tape.gradient(loss, self.q_network.trainable_variables)
-        self.optimizer.apply_gradients(zip(grads, self.q_network.trainable_variables))
+class ExpectimaxAgent(SearchAgent):
+    """
+    Agent that plays the best move of an expectimax search, see src.search.Expectimax
+    """
 
-    def sync_target_network(self) -> None:
-        """
-        Syncs the model's target network with its q-network
-        """
-        self.target_network.set_weights(self.q_network.get_weights())
+    def __init__(
+        self,
+        look_up_table: LookupTable,
+        depth: int = 3,
+        time_budget: float | None = None,
+        prob_cutoff: float = 1e-4,
+        table_size: int = 1 << 20,
+    ):
+        super().__init__(
+            Expectimax(look_up_table, depth, time_budget, prob_cutoff, table_size)
+        )
 
 
-class RandomAgent:
+class RolloutAgent(SearchAgent):
     """
-    Agent that supplies random moves
+    Agent that plays the move whose Monte Carlo rollouts gain the most score, see src.search.MonteCarlo
     """
 
-    def __init__(self, state_dim: int, action_dim: int):
-        self.action_dim = action_dim
-        self.state_dim = state_dim
-
-    def select_action(
-        self, state: np.ndarray, epsilon: float, valid_actions: int
-    ) -> int:
-        if (valid_actions & 0b00010000) > 0:  # no valid moves, game is ended
-            return 0b00010000
-        valid_actions_arr = [
-            i for i in range(self.action_dim) if (valid_actions >> i) & 1
-        ]
-        return 1 << np.random.choice(valid_actions_arr)
+    def __init__(
+        self,
+        look_up_table: LookupTable,
+        rollouts: int = 64,
+        depth: int = 20,
+        time_budget: float | None = None,
+        policy=None,
+        seed: int | None = None,
+    ):
+        super().__init__(
+            MonteCarlo(look_up_table, rollouts, depth, time_budget, policy, seed)
+        )
 
 
 class UserAgent:
@@ -0,0 +1,152 @@
+from typing import Tuple
+
+import numpy as np
+from numpy.typing import NDArray
+
+from src.codec import ROW_MASK, ROW_SHIFTS
+
+
+def reverse_boards(boards: NDArray[np.uint64]) -> NDArray[np.uint64]:
+    """
+    boards: np.ndarray of shape (...), dtype=np.uint64
+    Returns the boards with every row reversed, also reverses 16-bit rows stored in a uint64
+    """
+    r = ((boards & np.uint64(0x00FF00FF00FF00FF)) << np.uint64(8)) | (
+        (boards >> np.uint64(8)) & np.uint64(0x00FF00FF00FF00FF)
+    )
+    return ((r & np.uint64(0x0F0F0F0F0F0F0F0F)) << np.uint64(4)) | (
+        (r >> np.uint64(4)) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    )
+
+
+def transpose_boards(boards: NDArray[np.uint64]) -> NDArray[np.uint64]:
+    """
+    boards: np.ndarray of shape (...), dtype=np.uint64
+    Returns the transposed boards, swaps 4-bit cells in two passes of masked shifts
+    """
+    a = (
+        (boards & np.uint64(0xF0F00F0FF0F00F0F))
+        | ((boards & np.uint64(0x0000F0F00000F0F0)) << np.uint64(12))
+        | ((boards & np.uint64(0x0F0F00000F0F0000)) >> np.uint64(12))
+    )
+    return (
+        (a & np.uint64(0xFF00FF0000FF00FF))
+        | ((a & np.uint64(0x00FF00FF00000000)) >> np.uint64(24))
+        | ((a & np.uint64(0x00000000FF00FF00)) << np.uint64(24))
+    )
+
+
+def flip_boards(boards: NDArray[np.uint64]) -> NDArray[np.uint64]:
+    """
+    boards: np.ndarray of shape (...), dtype=np.uint64
+    Returns the boards upside down, their rows in reverse order
+    """
+    return (
+        (boards << np.uint64(48))
+        | ((boards << np.uint64(16)) & np.uint64(0x0000FFFF00000000))
+        | ((boards >> np.uint64(16)) & np.uint64(0x00000000FFFF0000))
+        | (boards >> np.uint64(48))
+    )
+
+
+# The 8 symmetries of the board: symmetry k transposes the board if bit 2 is set, then reverses its rows
+# if bit 0 is set, then flips it upside down if bit 1 is set, symmetry 0 is the identity
+SYMMETRY_COUNT = 8
+
+
+def _symmetry_directions(symmetry: int) -> list[int]:
+    """
+    Returns the direction every direction (LEFT, RIGHT, UP, DOWN) becomes under symmetry
+    """
+    directions = [0, 1, 2, 3]
+    if symmetry & 4:
+        directions = [[2, 3, 0, 1][d] for d in directions]
+    if symmetry & 1:
+        directions = [[1, 0, 2, 3][d] for d in directions]
+    if symmetry & 2:
+        directions = [[0, 1, 3, 2][d] for d in directions]
+    return directions
+
+
+# Symmetry, uint8 of Move bitflags -> the bitflags of the same moves on the transformed board
+# every direction bit is moved, higher bits such as the C++ no moves flag are kept as is
+SYMMETRY_ACTIONS = np.array(
+    [
+        [
+            (flags & ~0xF)
+            | sum(
+                1 << d for i, d in enumerate(_symmetry_directions(k)) if flags >> i & 1
+            )
+            for flags in range(256)
+        ]
+        for k in range(SYMMETRY_COUNT)
+    ],
+    dtype=np.uint8,
+)
+
+
+def symmetric_boards(
+    boards: NDArray[np.uint64], symmetries: NDArray[np.intp]
+) -> NDArray[np.uint64]:
+    """
+    boards: np.ndarray of shape (N,), dtype=np.uint64
+    symmetries: np.ndarray of shape (N,) of symmetry indices in [0, SYMMETRY_COUNT)
+    Returns every board under its symmetry, pair with SYMMETRY_ACTIONS to transform the moves played on them
+    """
+    boards = np.where(symmetries & 4, transpose_boards(boards), boards)
+    boards = np.where(symmetries & 1, reverse_boards(boards), boards)
+    return np.where(symmetries & 2, flip_boards(boards), boards)
+
+
+def rows_to_columns(rows: NDArray[np.uint16]) -> NDArray[np.uint64]:
+    """
+    rows: np.ndarray of shape (...), dtype=np.uint16
+    Returns each row laid out as column 0 of an otherwise empty board, first cell on top
+    """
+    rows = rows.astype(np.uint64)
+    return (
+        (((rows >> np.uint64(12)) & np.uint64(0xF)) << np.uint64(60))
+        | (((rows >> np.uint64(8)) & np.uint64(0xF)) << np.uint64(44))
+        | (((rows >> np.uint64(4)) & np.uint64(0xF)) << np.uint64(28))
+        | ((rows & np.uint64(0xF)) << np.uint64(12))
+    )
+
+
+def afterstates(
+    boards: NDArray[np.uint64], look_up_table
+) -> Tuple[NDArray[np.uint64], NDArray[np.int64], NDArray[np.bool_]]:
+    """
+    boards: np.uint64 or np.ndarray of shape (...), dtype=np.uint64
+    look_up_table: LookupTable providing the row and column tables
+    Returns the afterstates, score gains and legality of every move, each of shape (..., 4)
+    and ordered LEFT, RIGHT, UP, DOWN like the Move bits
+    Columns are read from a single transpose of the input, the column tables write
+    the results straight into place so no afterstate is ever transposed back
+    """
+    boards = np.asarray(boards, dtype=np.uint64)
+    shape = boards.shape
+    boards = boards.reshape(-1)
+    columns = transpose_boards(boards)
+
+    moved = np.zeros((boards.size, 4), dtype=np.uint64)
+    scores = np.zeros((boards.size, 4), dtype=np.int64)
+    for i, shift in enumerate(ROW_SHIFTS):
+        row = (boards >> shift) & ROW_MASK
+        moved[:, 0] |= look_up_table.moves[row].astype(np.uint64) << shift
+        moved[:, 1] |= look_up_table.moves_right[row].astype(np.uint64) << shift
+        scores[:, 0] += look_up_table.scores[row]
+        scores[:, 1] += look_up_table.scores_right[row]
+
+        # row i of the transposed board is column i, top cell first
+        column = (columns >> shift) & ROW_MASK
+        moved[:, 2] |= look_up_table.col_up[column] >> np.uint64(4 * i)
+        moved[:, 3] |= look_up_table.col_down[column] >> np.uint64(4 * i)
+        scores[:, 2] += look_up_table.scores[column]
+        scores[:, 3] += look_up_table.scores_right[column]
+
+    legal = moved != boards[:, None]
+    return (
+        moved.reshape(shape + (4,)),
+        scores.reshape(shape + (4,)),
+        legal.reshape(shape + (4,)),
+    )
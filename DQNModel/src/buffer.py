@@ -1,14 +1,42 @@
+import os
+
 import numpy as np
 from typing import Tuple
 
+from src.board import SYMMETRY_ACTIONS, SYMMETRY_COUNT, symmetric_boards
+from src.codec import pack_boards, unpack_boards
+
+
+def augment_transitions(
+    boards: np.ndarray, actions: np.ndarray, next_boards: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    boards, next_boards: np.ndarray of shape (N,), dtype=np.uint64
+    actions: np.ndarray of shape (N,) of Move bitflags
+    Returns every transition under a random one of the 8 board symmetries, 2048 plays the same on all of them,
+    so the board, its successor and the action are transformed together and the reward stays as is
+    """
+    symmetries = np.random.randint(0, SYMMETRY_COUNT, len(boards))
+    return (
+        symmetric_boards(boards, symmetries),
+        SYMMETRY_ACTIONS[symmetries, actions],
+        symmetric_boards(next_boards, symmetries),
+    )
+
 
 class ReplayBuffer:
     """
     Buffer for sampling previous experiences
+    With augment, sampled transitions are returned under random board symmetries, states must be (16,) boards
     """
 
-    def __init__(self, capacity: int, state_shape: Tuple[int, ...]) -> None:
+    def __init__(
+        self, capacity: int, state_shape: Tuple[int, ...], augment: bool = False
+    ) -> None:
+        if augment and tuple(state_shape) != (16,):
+            raise ValueError("Symmetry augmentation needs (16,) board states")
         self.capacity: int = capacity
+        self.augment: bool = augment
         self.state_shape: Tuple[int, ...] = state_shape
         self.states: np.ndarray = np.zeros((capacity, *state_shape), dtype=np.ndarray)
         self.next_states: np.ndarray = np.zeros(
@@ -36,8 +64,47 @@ class ReplayBuffer:
         self.idx = (self.idx + 1) % self.capacity
         self.size = min(self.size + 1, self.capacity)
 
+    def add_batch(
+        self,
+        states: np.ndarray,
+        actions: np.ndarray,
+        rewards: np.ndarray,
+        next_states: np.ndarray,
+        dones: np.ndarray,
+    ) -> None:
+        """
+        Adds consecutive transitions in one write per column
+        """
+        slots = (self.idx + np.arange(len(states))) % self.capacity
+        self.states[slots] = states
+        self.actions[slots] = actions
+        self.rewards[slots] = rewards
+        self.next_states[slots] = next_states
+        self.dones[slots] = dones
+        self.idx = (self.idx + len(states)) % self.capacity
+        self.size = min(self.size + len(states), self.capacity)
+
     def sample(self, batch_size: int) -> np.ndarray:
         idxs = np.random.choice(self.size, batch_size, replace=False)
+        return self.gather(idxs)
+
+    def gather(self, idxs: np.ndarray) -> np.ndarray:
+        """
+        Returns the transitions stored at idxs
+        """
+        if self.augment:
+            boards, actions, next_boards = augment_transitions(
+                pack_boards(self.states[idxs]),
+                self.actions[idxs],
+                pack_boards(self.next_states[idxs]),
+            )
+            return (
+                unpack_boards(boards).astype(np.float32),
+                actions,
+                self.rewards[idxs],
+                unpack_boards(next_boards).astype(np.float32),
+                self.dones[idxs],
+            )
         return (
             self.states[idxs],
             self.actions[idxs],
@@ -45,3 +112,434 @@ class ReplayBuffer:
             self.next_states[idxs],
             self.dones[idxs],
         )
+
+    def flush(self) -> None:
+        """
+        Nothing to write back, the buffer only lives in memory
+        """
+
+
+class PackedReplayBuffer:
+    """
+    Buffer for sampling previous experiences, stored as packed 64-bit boards
+    Each transition takes a uint64 board, uint8 action, float32 reward, one done bit and a uint64
+    terminal board, about 21 bytes
+    Transitions are written in lanes, one per environment, added in environment order every step.
+    Within a trajectory the next state of a transition is the state of the following transition in
+    its lane, so it is only stored once. A done transition is followed by the start of the next game,
+    so its next state is kept in terminal_boards instead. Boards are unpacked to float32 only for the sampled batch, with augment
+    they are first moved to random board symmetries along with their actions.
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        state_shape: Tuple[int, ...],
+        num_lanes: int = 1,
+        augment: bool = False,
+    ) -> None:
+        if capacity < num_lanes:
+            raise ValueError("Capacity must hold at least one transition per lane")
+        self.capacity: int = capacity - capacity % num_lanes
+        self.augment: bool = augment
+        self.state_shape: Tuple[int, ...] = state_shape
+        self.num_lanes: int = num_lanes
+        self.boards: np.ndarray = np.zeros((self.capacity,), dtype=np.uint64)
+        self.actions: np.ndarray = np.zeros((self.capacity,), dtype=np.uint8)
+        self.rewards: np.ndarray = np.zeros((self.capacity,), dtype=np.float32)
+        self.dones: np.ndarray = np.zeros(((self.capacity + 7) // 8,), dtype=np.uint8)
+        # next states of done transitions, only read where the done bit is set
+        self.terminal_boards: np.ndarray = np.zeros((self.capacity,), dtype=np.uint64)
+        # next states of the newest transition in each lane, not yet followed by a state
+        self.next_boards: np.ndarray = np.zeros((num_lanes,), dtype=np.uint64)
+        self.next_dones: np.ndarray = np.ones((num_lanes,), dtype=np.bool_)
+        self.idx: int = 0
+        self.size: int = 0
+
+    def add(
+        self,
+        state: np.ndarray,
+        action: np.ndarray,
+        reward: np.ndarray,
+        next_state: np.ndarray,
+        done: np.ndarray,
+    ) -> None:
+        self.add_batch(
+            np.asarray(state)[None],
+            np.asarray(action)[None],
+            np.asarray(reward)[None],
+            np.asarray(next_state)[None],
+            np.asarray(done)[None],
+        )
+
+    def add_batch(
+        self,
+        states: np.ndarray,
+        actions: np.ndarray,
+        rewards: np.ndarray,
+        next_states: np.ndarray,
+        dones: np.ndarray,
+    ) -> None:
+        """
+        Adds consecutive transitions, states and next_states are unpacked of shape (N, 16)
+        Raises ValueError if a state does not continue the unfinished trajectory of its lane
+        """
+        n = len(states)
+        slots = (self.idx + np.arange(n)) % self.capacity
+        lanes = slots % self.num_lanes
+        packed = pack_boards(states)
+        packed_next = pack_boards(next_states)
+        dones = np.asarray(dones, dtype=np.bool_)
+
+        # previous transition of each lane, from the buffer or from earlier in this batch
+        head = min(n, self.num_lanes)
+        expected = np.concatenate(
+            [self.next_boards[lanes[:head]], packed_next[: n - head]]
+        )
+        prev_done = np.concatenate([self.next_dones[lanes[:head]], dones[: n - head]])
+        if np.any(~prev_done & (expected != packed)):
+            raise ValueError("Transition does not continue the trajectory of its lane")
+
+        self.boards[slots] = packed
+        self.actions[slots] = actions
+        self.rewards[slots] = rewards
+        bits = (slots & 7).astype(np.uint8)
+        np.bitwise_and.at(self.dones, slots >> 3, ~(np.uint8(1) << bits))
+        np.bitwise_or.at(self.dones, slots >> 3, dones.astype(np.uint8) << bits)
+        self.terminal_boards[slots[dones]] = packed_next[dones]
+        self.next_boards[lanes[-head:]] = packed_next[-head:]
+        self.next_dones[lanes[-head:]] = dones[-head:]
+
+        self.idx = (self.idx + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    def truncate(self) -> None:
+        """
+        Ends the unfinished trajectory of every lane by marking its newest transition done,
+        used when the environments restart without their previous states
+        """
+        if self.size == 0:
+            return
+        slots = (
+            self.idx - 1 - np.arange(min(self.num_lanes, self.size))
+        ) % self.capacity
+        slots = slots[~self.next_dones[slots % self.num_lanes]]
+        self.terminal_boards[slots] = self.next_boards[slots % self.num_lanes]
+        np.bitwise_or.at(
+            self.dones, slots >> 3, np.uint8(1) << (slots & 7).astype(np.uint8)
+        )
+        self.next_dones[:] = True
+
+    def sample(self, batch_size: int) -> np.ndarray:
+        idxs = np.random.randint(0, self.size, batch_size)
+        return self.gather(idxs)
+
+    def gather(self, idxs: np.ndarray) -> np.ndarray:
+        """
+        Returns the unpacked transitions stored at idxs
+        """
+        succ = (idxs + self.num_lanes) % self.capacity
+        newest = (self.idx - 1 - idxs) % self.capacity < self.num_lanes
+        dones = ((self.dones[idxs >> 3] >> (idxs & 7).astype(np.uint8)) & 1).astype(
+            np.bool_
+        )
+        next_boards = np.where(
+            newest, self.next_boards[idxs % self.num_lanes], self.boards[succ]
+        )
+        next_boards = np.where(dones, self.terminal_boards[idxs], next_boards)
+        boards, actions = self.boards[idxs], self.actions[idxs]
+        if self.augment:
+            boards, actions, next_boards = augment_transitions(
+                boards, actions, next_boards
+            )
+        return (
+            unpack_boards(boards).astype(np.float32),
+            actions,
+            self.rewards[idxs],
+            unpack_boards(next_boards).astype(np.float32),
+            dones,
+        )
+
+    def flush(self) -> None:
+        """
+        Nothing to write back, the buffer only lives in memory
+        """
+
+
+class MemmapReplayBuffer(PackedReplayBuffer):
+    """
+    Packed replay buffer whose columns live in memory-mapped .npy files under path
+    Capacity is bounded by disk instead of RAM, the buffer resumes at its saved idx/size after a
+    restart (ending the trajectories left unfinished), and other processes can open the same path read-only to sample from it without copying
+    """
+
+    VERSION = 2
+    # header of the meta column: version, capacity, lanes, idx, size
+    META_VERSION, META_CAPACITY, META_LANES, META_IDX, META_SIZE = range(5)
+
+    def __init__(
+        self,
+        path: str,
+        capacity: int,
+        state_shape: Tuple[int, ...],
+        num_lanes: int = 1,
+        readonly: bool = False,
+        augment: bool = False,
+    ) -> None:
+        if capacity < num_lanes:
+            raise ValueError("Capacity must hold at least one transition per lane")
+        self.path: str = path
+        self.readonly: bool = readonly
+        self.augment: bool = augment
+        self.state_shape: Tuple[int, ...] = state_shape
+        capacity -= capacity % num_lanes
+
+        exists = os.path.exists(os.path.join(path, "meta.npy"))
+        if not exists and readonly:
+            raise FileNotFoundError(f"No replay buffer at {path}")
+        os.makedirs(path, exist_ok=True)
+        mode = "r" if readonly else ("r+" if exists else "w+")
+
+        self.meta: np.ndarray = self.__open("meta", mode, np.int64, 5)
+        if exists:
+            if self.meta[self.META_VERSION] != self.VERSION:
+                raise ValueError(f"Replay buffer at {path} has an unsupported version")
+            if (
+                self.meta[self.META_CAPACITY] != capacity
+                or self.meta[self.META_LANES] != num_lanes
+            ):
+                raise ValueError(
+                    f"Replay buffer at {path} was created with capacity {self.meta[self.META_CAPACITY]} "
+                    f"and {self.meta[self.META_LANES]} lanes"
+                )
+        self.capacity: int = capacity
+        self.num_lanes: int = num_lanes
+        self.boards: np.ndarray = self.__open("boards", mode, np.uint64, capacity)
+        self.actions: np.ndarray = self.__open("actions", mode, np.uint8, capacity)
+        self.rewards: np.ndarray = self.__open("rewards", mode, np.float32, capacity)
+        self.dones: np.ndarray = self.__open(
+            "dones", mode, np.uint8, (capacity + 7) // 8
+        )
+        self.terminal_boards: np.ndarray = self.__open(
+            "terminal_boards", mode, np.uint64, capacity
+        )
+        self.next_boards: np.ndarray = self.__open(
+            "next_boards", mode, np.uint64, num_lanes
+        )
+        self.next_dones: np.ndarray = self.__open(
+            "next_dones", mode, np.bool_, num_lanes
+        )
+        if not exists:
+            self.next_dones[:] = True
+            self.meta[:] = [self.VERSION, capacity, num_lanes, 0, 0]
+            self.flush()
+        elif not readonly:
+            # the environments that produced the saved trajectories are gone
+            self.truncate()
+
+    @property
+    def idx(self) -> int:
+        return int(self.meta[self.META_IDX])
+
+    @idx.setter
+    def idx(self, value: int) -> None:
+        self.meta[self.META_IDX] = value
+
+    @property
+    def size(self) -> int:
+        return int(self.meta[self.META_SIZE])
+
+    @size.setter
+    def size(self, value: int) -> None:
+        self.meta[self.META_SIZE] = value
+
+    def add_batch(
+        self,
+        states: np.ndarray,
+        actions: np.ndarray,
+        rewards: np.ndarray,
+        next_states: np.ndarray,
+        dones: np.ndarray,
+    ) -> None:
+        if self.readonly:
+            raise ValueError("Replay buffer was opened read-only")
+        super().add_batch(states, actions, rewards, next_states, dones)
+
+    def flush(self) -> None:
+        """
+        Writes every column back to disk, idx and size are flushed last so a reopened
+        buffer never points past the data that was written
+        """
+        if self.readonly:
+            return
+        for column in (
+            self.boards,
+            self.actions,
+            self.rewards,
+            self.dones,
+            self.terminal_boards,
+            self.next_boards,
+            self.next_dones,
+            self.meta,
+        ):
+            column.flush()
+
+    def __open(self, name: str, mode: str, dtype, size: int) -> np.ndarray:
+        file_name = os.path.join(self.path, f"{name}.npy")
+        if mode == "w+":
+            return np.lib.format.open_memmap(
+                file_name, mode=mode, dtype=dtype, shape=(size,)
+            )
+        column = np.load(file_name, mmap_mode=mode)
+        if column.dtype != dtype or column.shape != (size,):
+            raise ValueError(
+                f"Replay buffer column {file_name} has the wrong dtype or shape"
+            )
+        return column
+
+
+class SumTree:
+    """
+    Array-based sum-tree, leaves hold priorities and every inner node the sum of its two children
+    Node 1 is the root, the children of node i are 2i and 2i+1, leaf j is node leaf_offset + j
+    Sampling and updates walk root-to-leaf paths, O(log N), vectorized over a whole batch
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity: int = capacity
+        self.depth: int = max(1, int(np.ceil(np.log2(capacity))))
+        self.leaf_offset: int = 1 << self.depth
+        self.tree: np.ndarray = np.zeros((2 * self.leaf_offset,), dtype=np.float64)
+
+    def total(self) -> float:
+        return float(self.tree[1])
+
+    def get(self, idxs: np.ndarray) -> np.ndarray:
+        return self.tree[self.leaf_offset + idxs]
+
+    def update(self, idxs: np.ndarray, priorities: np.ndarray) -> None:
+        """
+        Sets the priorities of the leaves at idxs, then recomputes each affected parent once per level
+        """
+        nodes = self.leaf_offset + np.asarray(idxs)
+        self.tree[nodes] = priorities
+        for _ in range(self.depth):
+            nodes = np.unique(nodes >> 1)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values: np.ndarray) -> np.ndarray:
+        """
+        values: np.ndarray of prefix sums in [0, total)
+        Returns the leaf whose priority interval contains each value
+        """
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(values.shape, dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            left_sum = self.tree[left]
+            # rounding can leave a value past the left sum with an empty right subtree
+            go_right = (values >= left_sum) & (self.tree[left + 1] > 0)
+            values -= left_sum * go_right
+            nodes = left + go_right
+        return nodes - self.leaf_offset
+
+
+class PrioritizedReplayBuffer:
+    """
+    Prioritized experience replay over any storage buffer, transitions are sampled proportionally
+    to priority**alpha through a SumTree and returned with importance-sampling weights
+    New transitions get the highest priority seen so far, so each is sampled at least once
+    """
+
+    def __init__(
+        self,
+        storage: ReplayBuffer | PackedReplayBuffer,
+        alpha: float = 0.6,
+        beta: float = 0.4,
+        beta_steps: int = 1_000_000,
+        eps: float = 1e-3,
+    ) -> None:
+        self.storage = storage
+        self.alpha: float = alpha
+        self.beta_start: float = beta
+        self.beta: float = beta
+        self.beta_steps: int = beta_steps
+        self.eps: float = eps
+        self.max_priority: float = 1.0
+        self.sample_count: int = 0
+        self.tree: SumTree = SumTree(storage.capacity)
+        # a resumed storage buffer starts with every stored transition at the same priority
+        if storage.size > 0:
+            self.tree.update(np.arange(storage.size), self.max_priority**self.alpha)
+
+    @property
+    def capacity(self) -> int:
+        return self.storage.capacity
+
+    @property
+    def size(self) -> int:
+        return self.storage.size
+
+    @property
+    def idx(self) -> int:
+        return self.storage.idx
+
+    def add(
+        self,
+        state: np.ndarray,
+        action: np.ndarray,
+        reward: np.ndarray,
+        next_state: np.ndarray,
+        done: np.ndarray,
+    ) -> None:
+        slot = self.storage.idx
+        self.storage.add(state, action, reward, next_state, done)
+        self.tree.update(np.array([slot]), self.max_priority**self.alpha)
+
+    def add_batch(
+        self,
+        states: np.ndarray,
+        actions: np.ndarray,
+        rewards: np.ndarray,
+        next_states: np.ndarray,
+        dones: np.ndarray,
+    ) -> None:
+        slots = (self.storage.idx + np.arange(len(states))) % self.storage.capacity
+        self.storage.add_batch(states, actions, rewards, next_states, dones)
+        self.tree.update(slots, self.max_priority**self.alpha)
+
+    def sample(self, batch_size: int) -> np.ndarray:
+        """
+        Returns (states, actions, rewards, next_states, dones, weights, idxs), pass idxs back to update_priorities
+        """
+        # stratified: one draw from each of batch_size equal slices of the total priority
+        total = self.tree.total()
+        values = (np.arange(batch_size) + np.random.random(batch_size)) * (
+            total / batch_size
+        )
+        idxs = np.minimum(self.tree.find(values), self.storage.size - 1)
+
+        self.sample_count += 1
+        self.beta = min(
+            1.0,
+            self.beta_start
+            + (1.0 - self.beta_start) * self.sample_count / self.beta_steps,
+        )
+        probs = self.tree.get(idxs) / total
+        weights = (self.storage.size * probs) ** -self.beta
+        weights /= weights.max()
+        return (*self.storage.gather(idxs), weights.astype(np.float32), idxs)
+
+    def flush(self) -> None:
+        """
+        Writes the storage back to disk if it is persistent
+        """
+        self.storage.flush()
+
+    def update_priorities(self, idxs: np.ndarray, td_errors: np.ndarray) -> None:
+        """
+        Sets the priorities of the sampled transitions from their new TD errors
+        """
+        priorities = np.abs(td_errors) + self.eps
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        self.tree.update(idxs, priorities**self.alpha)
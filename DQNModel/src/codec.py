@@ -0,0 +1,167 @@
+import numpy as np
+from numpy.typing import NDArray
+
+# Board layouts
+#
+# cells:       np.ndarray of shape (..., 16), the log2 of every tile (0 for empty), row-major, cell (r, c) at index 4r + c
+# packed:      np.uint64 with 4 bits per cell, row 0 and cell 0 most significant, cell (r, c) at bit 60 - 4(4r + c)
+#              Used by BatchSimulator, the replay buffers, the results file and the C++ convertBoardToPacked
+# rows:        np.ndarray of shape (..., 4), dtype=np.uint16, the 16-bit rows of the packed layout, row 0 first
+#              Used by Simulator and the C++ Simulator
+# lsb first:   np.uint64 with cell i at bit 4i, the nibble order utils.unpack_64bit_state reads
+# tile values: np.ndarray of shape (..., 16) holding the tile values themselves (2, 4, 8, ..., 0 for empty),
+#              row-major, as returned by the web game's getBoard
+ROW_SHIFTS = np.array([48, 32, 16, 0], dtype=np.uint64)
+CELL_SHIFTS = np.arange(60, -1, -4, dtype=np.uint64)
+ROW_MASK = np.uint64(0xFFFF)
+NIBBLE_MASK = np.uint64(0xF)
+
+# Cells of every possible 16-bit row, ROW_CELLS[row] = [cell 0, cell 1, cell 2, cell 3]
+ROW_CELLS = (
+    (np.arange(1 << 16, dtype=np.uint32)[:, None] >> np.array([12, 8, 4, 0])) & 0xF
+).astype(np.uint8)
+# ROW_CELLS with each row viewed as a single uint32, one take gathers all four cells of a row
+ROW_CELLS_WORDS = ROW_CELLS.view(np.uint32).ravel()
+# ROW_CELLS as float32, lets unpack_boards_into gather straight into network input buffers
+ROW_CELLS_FLOAT = ROW_CELLS.astype(np.float32)
+
+
+def unpack_boards(boards: NDArray[np.uint64]) -> NDArray[np.uint8]:
+    """
+    boards: np.ndarray of shape (...), dtype=np.uint64
+    Returns the cells of the packed boards as a np.ndarray of shape (..., 16), dtype=np.uint8
+    Reads whole rows through ROW_CELLS, four lookups per board instead of sixteen shifts
+    """
+    boards = np.asarray(boards, dtype=np.uint64)
+    # the little-endian 16-bit words of a board are its rows, last row first
+    rows = boards.reshape(-1).astype("<u8").view("<u2").reshape(-1, 4)[:, ::-1]
+    cells = np.take(ROW_CELLS_WORDS, rows).view(np.uint8)
+    return cells.reshape(boards.shape + (16,))
+
+
+def row_indices(boards: NDArray[np.uint64]) -> NDArray[np.intp]:
+    """
+    boards: np.ndarray of shape (N,), dtype=np.uint64
+    Returns the 16-bit rows of the packed boards as table indices of shape (N, 4), row 0 first
+    """
+    boards = np.ascontiguousarray(boards, dtype="<u8")
+    # the little-endian 16-bit words of a board are its rows, last row first
+    return boards.view("<u2").reshape(-1, 4)[:, ::-1].astype(np.intp)
+
+
+def unpack_boards_into(boards: NDArray[np.uint64], out: np.ndarray) -> np.ndarray:
+    """
+    boards: np.ndarray of shape (N,), dtype=np.uint64
+    out: C-contiguous np.ndarray of shape (N, 16), dtype=np.uint8 or np.float32
+    Writes the cells of the packed boards into out without allocating a result, returns out
+    """
+    rows = row_indices(boards)
+    # clip never triggers on 16-bit rows, it only spares take a buffered copy of out
+    if out.dtype == np.uint8:
+        np.take(ROW_CELLS_WORDS, rows, out=out.view(np.uint32), mode="clip")
+    else:
+        np.take(ROW_CELLS_FLOAT, rows, axis=0, out=out.reshape(-1, 4, 4), mode="clip")
+    return out
+
+
+def pack_boards(cells: NDArray) -> NDArray[np.uint64]:
+    """
+    cells: np.ndarray of shape (..., 16) holding the log2 value of every tile, row-major
+    Returns the packed boards as a np.ndarray of shape (...), dtype=np.uint64
+    """
+    cells = np.asarray(cells).astype(np.uint64) << CELL_SHIFTS
+    return np.bitwise_or.reduce(cells, axis=-1)
+
+
+def unpack_rows(rows: NDArray[np.uint16]) -> NDArray[np.uint8]:
+    """
+    rows: np.ndarray of shape (..., 4), dtype=np.uint16
+    Returns the cells of the boards as a np.ndarray of shape (..., 16), dtype=np.uint8
+    """
+    rows = np.asarray(rows)
+    cells = np.take(ROW_CELLS_WORDS, rows.reshape(-1, 4)).view(np.uint8)
+    return cells.reshape(rows.shape[:-1] + (16,))
+
+
+def rows_to_boards(rows: NDArray[np.uint16]) -> NDArray[np.uint64]:
+    """
+    rows: np.ndarray of shape (..., 4), dtype=np.uint16
+    Returns the packed boards as a np.ndarray of shape (...), dtype=np.uint64
+    """
+    rows = np.asarray(rows).astype(np.uint64) << ROW_SHIFTS
+    return np.bitwise_or.reduce(rows, axis=-1)
+
+
+def boards_to_rows(boards: NDArray[np.uint64]) -> NDArray[np.uint16]:
+    """
+    boards: np.ndarray of shape (...), dtype=np.uint64
+    Returns the 16-bit rows of the packed boards as a np.ndarray of shape (..., 4), dtype=np.uint16
+    """
+    boards = np.asarray(boards, dtype=np.uint64)
+    return ((boards[..., None] >> ROW_SHIFTS) & ROW_MASK).astype(np.uint16)
+
+
+def one_hot(boards: NDArray[np.uint64], dtype=np.float32) -> np.ndarray:
+    """
+    boards: np.ndarray of shape (...), dtype=np.uint64
+    Returns the boards one-hot encoded as a np.ndarray of shape (..., 16, 16), [cell, log2 value]
+    """
+    return np.eye(16, dtype=dtype)[unpack_boards(boards)]
+
+
+def log_values(
+    boards: NDArray[np.uint64], scale: float = 1.0, dtype=np.float32
+) -> np.ndarray:
+    """
+    boards: np.ndarray of shape (...), dtype=np.uint64
+    Returns the log2 value of every cell times scale as a np.ndarray of shape (..., 16), the DQN input encoding
+    """
+    return unpack_boards(boards).astype(dtype) * dtype(scale)
+
+
+def reverse_cells(boards: NDArray[np.uint64]) -> NDArray[np.uint64]:
+    """
+    boards: np.ndarray of shape (...), dtype=np.uint64
+    Returns the boards with the order of all 16 nibbles reversed, converts between the packed and lsb first layouts
+    """
+    swapped = np.asarray(boards, dtype=np.uint64).byteswap()
+    return ((swapped & np.uint64(0x0F0F0F0F0F0F0F0F)) << np.uint64(4)) | (
+        (swapped >> np.uint64(4)) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    )
+
+
+def lsb_first_to_boards(packed: NDArray[np.uint64]) -> NDArray[np.uint64]:
+    """
+    packed: np.ndarray of shape (...) of boards in the lsb first layout
+    Returns the boards in the packed layout
+    """
+    return reverse_cells(packed)
+
+
+def boards_to_lsb_first(boards: NDArray[np.uint64]) -> NDArray[np.uint64]:
+    """
+    boards: np.ndarray of shape (...) of boards in the packed layout
+    Returns the boards in the lsb first layout
+    """
+    return reverse_cells(boards)
+
+
+def tile_values_to_cells(values: NDArray) -> NDArray[np.uint8]:
+    """
+    values: np.ndarray of shape (..., 16) of tile values, 0 for empty
+    Returns the log2 of every tile as a np.ndarray of shape (..., 16), dtype=np.uint8
+    """
+    values = np.asarray(values, dtype=np.int64)
+    cells = np.zeros(values.shape, dtype=np.uint8)
+    filled = values > 0
+    cells[filled] = np.log2(values[filled]).round().astype(np.uint8)
+    return cells
+
+
+def cells_to_tile_values(cells: NDArray) -> NDArray[np.int64]:
+    """
+    cells: np.ndarray of shape (..., 16) holding the log2 value of every tile
+    Returns the tile values as a np.ndarray of shape (..., 16), dtype=np.int64, 0 for empty
+    """
+    cells = np.asarray(cells, dtype=np.int64)
+    return np.where(cells > 0, np.left_shift(1, cells), 0)
@@ -0,0 +1,187 @@
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import optimizers  # type: ignore
+
+from src.model import DQN, DuelingDQN
+from src.buffer import PackedReplayBuffer, PrioritizedReplayBuffer, ReplayBuffer
+from src.sim import VALID_ACTION_MASKS, Move
+
+
+class DQNAgent:
+    def __init__(
+        self,
+        state_dim: int,
+        action_dim: int,
+        lr: float = 1e-3,
+        gamma: float = 0.99,
+        buffer_capacity: int = 100000,
+        batch_size: int = 64,
+        replay_buffer: (
+            ReplayBuffer | PackedReplayBuffer | PrioritizedReplayBuffer | None
+        ) = None,
+    ) -> None:
+        self.action_dim: int = action_dim
+        self.gamma: float = gamma
+        self.batch_size: int = batch_size
+        self.loss_fn = tf.keras.losses.Huber(delta=1.0)
+        self.decay_steps = 2_000_000
+
+        with tf.device("/GPU:0"):
+            self.q_network: DuelingDQN = DuelingDQN(state_dim, action_dim)
+            self.target_network: DuelingDQN = DuelingDQN(state_dim, action_dim)
+            # NOTE: use a dummy to preload the networks on GPU, since they build lazily
+            dummy = tf.zeros((1, state_dim), dtype=tf.float32)
+            self.q_network(dummy)
+            self.target_network(dummy)
+
+        self.optimizer: optimizers.Optimizer = optimizers.Adam(
+            learning_rate=lr, clipnorm=5.0
+        )
+        if replay_buffer is None:
+            replay_buffer = ReplayBuffer(buffer_capacity, (state_dim,))
+        self.replay_buffer: (
+            ReplayBuffer | PackedReplayBuffer | PrioritizedReplayBuffer
+        ) = replay_buffer
+
+    def load_weights(self, q_net_path: str, target_net_path: str) -> None:
+        with tf.device("/GPU:0"):
+            self.q_network.load_weights(q_net_path)
+            self.target_network.load_weights(target_net_path)
+
+    def select_action(
+        self, state: np.ndarray, epsilon: float, valid_actions: int
+    ) -> int:
+        """
+        Epsilon-greedy action selection using valid_actions bitflags.
+        """
+        mask = VALID_ACTION_MASKS[valid_actions & 0xF]
+        if not mask.any():
+            # no valid moves, game ended, shouldn't ever happen because ended games will restart before calling this
+            raise ValueError("HOW")
+
+        if np.random.rand() < epsilon:
+            keys = np.where(mask, np.random.random(mask.shape), -1.0)
+            return 1 << int(np.argmax(keys))
+
+        state_tensor = tf.convert_to_tensor(state[None, :], dtype=tf.float32)
+        with tf.device("/GPU:0"):
+            q_values = self.q_network(state_tensor)[0].numpy()
+
+        # Return as bitflag
+        return 1 << int(np.argmax(np.where(mask, q_values, -np.inf)))
+
+    def select_actions_batch(
+        self, states: np.ndarray, epsilon: float, valid_actions_list: np.ndarray
+    ) -> np.ndarray:
+        """
+        Batch epsilon-greedy action selection.
+        states: shape (num_envs, state_dim)
+        valid_actions_list: array of int bitflags, shape (num_envs,)
+        Returns: array of actions as bitflags, shape (num_envs,), NOMOVE for envs without valid moves
+        """
+        states = np.asarray(states, dtype=np.float32)
+        num_envs = states.shape[0]
+        masks = VALID_ACTION_MASKS[np.asarray(valid_actions_list) & 0xF]
+        no_move = ~masks.any(axis=1)
+
+        # random valid action: argmax of random keys with the invalid actions masked out
+        keys = np.where(masks, np.random.random(masks.shape), -1.0)
+        choices = np.argmax(keys, axis=1)
+
+        # forward pass only for the envs acting greedily
+        greedy = (np.random.random(num_envs) >= epsilon) & ~no_move
+        if greedy.any():
+            state_tensor = tf.convert_to_tensor(states[greedy], dtype=tf.float32)
+            with tf.device("/GPU:0"):
+                q_values = self.q_network(state_tensor).numpy()
+            choices[greedy] = np.argmax(
+                np.where(masks[greedy], q_values, -np.inf), axis=1
+            )
+
+        actions = (1 << choices).astype(np.uint8)
+        actions[no_move] = Move.NOMOVE.value
+        return actions
+
+    def update(self) -> bool:
+        """
+        Updates the model gradients
+        """
+        if self.replay_buffer.size < self.batch_size:
+            return False
+
+        batch, idxs = self.sample_batch()
+        td_errors = self.apply_batch(self.stage_batch(batch))
+        if idxs is not None:
+            self.replay_buffer.update_priorities(idxs, td_errors.numpy())
+        return True
+
+    def sample_batch(self) -> tuple[tuple[np.ndarray, ...], np.ndarray | None]:
+        """
+        Samples a training batch from the replay buffer as numpy arrays
+        Returns ((states, next_states, action indices, rewards, dones, weights), idxs), idxs is None unless the buffer is prioritized
+        """
+        idxs = None
+        if isinstance(self.replay_buffer, PrioritizedReplayBuffer):
+            states, actions, rewards, next_states, dones, weights, idxs = (
+                self.replay_buffer.sample(self.batch_size)
+            )
+        else:
+            states, actions, rewards, next_states, dones = self.replay_buffer.sample(
+                self.batch_size
+            )
+            weights = np.ones(self.batch_size, dtype=np.float32)
+        actions_idx = np.log2(np.asarray(actions, dtype=np.float32)).astype(np.int32)
+        return (states, next_states, actions_idx, rewards, dones, weights), idxs
+
+    def stage_batch(self, batch: tuple[np.ndarray, ...]) -> tuple[tf.Tensor, ...]:
+        """
+        Copies a batch from sample_batch onto the GPU as tensors ready for apply_batch
+        """
+        states, next_states, actions_idx, rewards, dones, weights = batch
+        with tf.device("/GPU:0"):
+            return (
+                tf.convert_to_tensor(np.asarray(states, np.float32), tf.float32),
+                tf.convert_to_tensor(np.asarray(next_states, np.float32), tf.float32),
+                tf.convert_to_tensor(actions_idx, tf.int32),
+                tf.convert_to_tensor(np.asarray(rewards, np.float32), tf.float32),
+                tf.convert_to_tensor(np.asarray(dones, np.float32), tf.float32),
+                tf.convert_to_tensor(weights, tf.float32),
+            )
+
+    def apply_batch(self, tensors: tuple[tf.Tensor, ...]) -> tf.Tensor:
+        """
+        Runs a gradient step on a batch from stage_batch, returns the TD errors
+        """
+        return self.__update_step(*tensors)
+
+    @tf.function
+    def __update_step(
+        self, states, next_states, actions, rewards, dones, weights
+    ) -> tf.Tensor:
+        """
+        Helper function for gradient updates, separates all tensorflow functions into a single function for GPU utilization
+        weights are the importance-sampling weights of the batch, returns the TD errors
+        """
+        next_action = tf.cast(tf.argmax(self.q_network(next_states), axis=1), tf.int32)
+        next_q_target = tf.gather(
+            self.target_network(next_states), next_action, batch_dims=1
+        )
+
+        target = rewards + self.gamma * (1.0 - dones) * next_q_target
+
+        with tf.GradientTape() as tape:
+            q = self.q_network(states)
+            q_selected = tf.gather(q, actions, batch_dims=1)
+            loss = self.loss_fn(
+                target[:, None], q_selected[:, None], sample_weight=weights
+            )
+
+        grads = tape.gradient(loss, self.q_network.trainable_variables)
+        self.optimizer.apply_gradients(zip(grads, self.q_network.trainable_variables))
+        return target - q_selected
+
+    def sync_target_network(self) -> None:
+        """
+        Syncs the model's target network with its q-network
+        """
+        self.target_network.set_weights(self.q_network.get_weights())
@@ -1,7 +1,10 @@
+import os
 import threading
 import time
 import http.server
+import multiprocessing as mp
 import socketserver
+from multiprocessing import shared_memory
 
 import numpy as np
 from numpy.typing import NDArray
@@ -10,8 +13,10 @@ from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 
-from src.sim import Simulator, LookupTable, Move
-from src.PySharedMemoryInterface import SharedMemoryInterface  # type: ignore
+from src.codec import unpack_boards, unpack_boards_into
+from src.reward import RewardSpec
+from src.sim import BatchSimulator, LookupTable, Move
+from src.PySharedMemoryInterface import SharedMemoryInterface, Transport  # type: ignore
 
 message_dtype = np.dtype(
     [
@@ -19,14 +24,15 @@ message_dtype = np.dtype(
         ("board", np.uint64),
         ("moves", np.uint8),
         ("reward", np.float64),
+        ("score", np.int32),
     ]
 )
 
 pymessage_dtype = np.dtype(
     [
         ("id", np.uint16),
-        ("state", np.ndarray),
-        ("prev_state", np.ndarray),
+        ("state", np.float32, (16,)),
+        ("prev_state", np.float32, (16,)),
         ("moves", np.int64),
         ("reward", np.float64),
         ("is_terminated", np.bool),
@@ -42,24 +48,49 @@ class CPPEnvManager:
     def __init__(self, num_envs: int):
         self.num_envs = num_envs
         self.shm = SharedMemoryInterface()
-
-    def write_actions(self, actions):
+        self.slab = self.shm.transport == Transport.Slab
+        if self.slab:
+            # read-only views straight into the shared slab, entry i belongs to env i
+            self.boards = self.shm.boards
+            self.moves = self.shm.moves
+            self.rewards = self.shm.rewards
+            self.scores = self.shm.scores
+            self.ready_ids = np.zeros(num_envs, dtype=np.uint8)
+
+    def write_actions(self, actions: NDArray[np.int32]):
         """
-        Sends valid actions to their respective environments
+        actions: np.ndarray of shape (N,), dtype=np.int32
+        Sends valid actions to their respective environments in a single call
         Marks each action as sent by setting it to negative
         """
-        for i, a in enumerate(actions):
-            if a > 0:
-                self.shm.putResponse(i, a)
-                actions[i] = -a
+        self.shm.putResponses(actions)
+
+    def poll_ready(self) -> NDArray[np.uint8]:
+        """
+        Returns the ids of the environments with a new message, slab transport only
+        Their boards, moves and rewards can be read from the slab views until their next action is sent
+        """
+        count = self.shm.takeReady(self.ready_ids)
+        return self.ready_ids[:count]
 
     def poll_results(self) -> np.ndarray:
         """
-        Returns the entire message array
+        Returns every new message
         """
-        return np.frombuffer(self.shm.getMessageBatch(), dtype=message_dtype)
+        if not self.slab:
+            return np.frombuffer(self.shm.getMessageBatch(), dtype=message_dtype)
+        ids = self.poll_ready()
+        results = np.zeros(len(ids), dtype=message_dtype)
+        results["id"] = ids
+        results["board"] = self.boards[ids]
+        results["moves"] = self.moves[ids]
+        results["reward"] = self.rewards[ids]
+        results["score"] = self.scores[ids]
+        return results
 
     def pop_results(self) -> np.ndarray:
+        if self.slab:
+            return self.poll_results()
         res = self.shm.getMessage()
         if not res:
             return np.zeros(0, dtype=message_dtype)
@@ -68,6 +99,7 @@ class CPPEnvManager:
         arr[0]["board"] = res.board
         arr[0]["moves"] = res.moves
         arr[0]["reward"] = res.reward
+        arr[0]["score"] = res.score
         return arr
 
     def get_initial_states(self) -> np.ndarray:
@@ -85,48 +117,486 @@ class CPPEnvManager:
         Reset all environments by clearing the queue and sending reset signal to all envs
         """
         self.poll_results()
-        self.write_actions([0b00010000] * self.num_envs)  # send kys signal to all
+        self.write_actions(
+            np.full(self.num_envs, 0b00010000, dtype=np.int32)
+        )  # send kys signal to all
+
+
+class StepBuffers:
+    """
+    Caller-owned experience arrays, poll_results and step fill them in place, row i belongs to environment i
+    states, prev_states, moves, rewards and dones hold the transitions of the last step, terminal ones included,
+    current_states and current_moves the states to act on next, where step already restarted finished games
+    """
+
+    def __init__(self, num_envs: int):
+        self.states = np.zeros((num_envs, 16), dtype=np.float32)
+        self.prev_states = np.zeros((num_envs, 16), dtype=np.float32)
+        self.moves = np.zeros(num_envs, dtype=np.uint8)
+        self.rewards = np.zeros(num_envs, dtype=np.float64)
+        self.dones = np.zeros(num_envs, dtype=np.bool_)
+        self.current_states = np.zeros((num_envs, 16), dtype=np.float32)
+        self.current_moves = np.zeros(num_envs, dtype=np.uint8)
+
+    def fill(self, boards, prev_boards, moves, rewards, dones) -> None:
+        """
+        Unpacks one packed result per environment into the buffers, current states start as the new states
+        """
+        unpack_boards_into(boards, self.states)
+        unpack_boards_into(prev_boards, self.prev_states)
+        self.moves[:] = moves
+        self.rewards[:] = rewards
+        self.dones[:] = dones
+        self.current_states[:] = self.states
+        self.current_moves[:] = self.moves
+
+
+class EpisodeStats:
+    """
+    Score, length and max tile (log2) of the last `capacity` finished episodes, kept in ring buffers
+    """
+
+    def __init__(self, capacity: int = 1000):
+        self.capacity = capacity
+        self.scores = np.zeros(capacity, dtype=np.int64)
+        self.lengths = np.zeros(capacity, dtype=np.int64)
+        self.max_tiles = np.zeros(capacity, dtype=np.uint8)
+        self.count = 0  # episodes recorded so far, including the ones overwritten
+
+    def record(
+        self, scores: np.ndarray, lengths: np.ndarray, max_tiles: np.ndarray
+    ) -> None:
+        """
+        Appends a batch of finished episodes, overwriting the oldest ones once the buffers are full
+        """
+        n = len(scores)
+        kept = min(n, self.capacity)
+        slots = (self.count + np.arange(n - kept, n)) % self.capacity
+        self.scores[slots] = scores[n - kept :]
+        self.lengths[slots] = lengths[n - kept :]
+        self.max_tiles[slots] = max_tiles[n - kept :]
+        self.count += n
+
+    def summary(self) -> dict:
+        """
+        Returns the mean score, mean length and best max tile value of the episodes in the buffers
+        """
+        filled = min(self.count, self.capacity)
+        if filled == 0:
+            return {"episodes": 0, "mean_score": 0.0, "mean_length": 0.0, "max_tile": 0}
+        return {
+            "episodes": self.count,
+            "mean_score": float(self.scores[:filled].mean()),
+            "mean_length": float(self.lengths[:filled].mean()),
+            "max_tile": 1 << int(self.max_tiles[:filled].max()),
+        }
 
 
 # A smarter man would make these two classes inherit an interface or something
 class PyEnvManager:
     """
-    Environment manager running serial python simulations
+    Environment manager running vectorized python simulations
     """
 
-    def __init__(self, num_envs: int):
+    def __init__(
+        self,
+        num_envs: int,
+        stats_capacity: int = 1000,
+        reward_spec: RewardSpec | None = None,
+    ):
         self.num_envs = num_envs
         self.look_up_table = LookupTable()
-        self.envs = np.empty(num_envs, dtype=object)
-        for i in range(self.num_envs):
-            self.envs[i] = Simulator(i, self.look_up_table)
+        self.sim = BatchSimulator(num_envs, self.look_up_table, reward_spec=reward_spec)
+        self.stats = EpisodeStats(stats_capacity)
+
+    def step(self, actions, out: StepBuffers) -> StepBuffers:
+        """
+        actions: np.ndarray of shape (N,) of Move bitflags
+        Steps every environment and resets the finished ones in the same call, recording them in self.stats
+        Fills out with the transitions of this step and the states to act on next, returns out
+        """
+        self.sim.step(actions)
+        self.poll_results(out)
+        done = out.dones
+        if np.any(done):
+            self.stats.record(
+                self.sim.scores[done],
+                self.sim.move_counts[done],
+                out.states[done].max(axis=1),
+            )
+            self.sim.reset(done)
+            out.current_states[done] = unpack_boards(self.sim.boards[done])
+            out.current_moves[done] = self.sim.valid_moves[done]
+        return out
 
     def write_actions(self, actions):
         """
         Sends valid actions to the environments
         """
-        for env, action in zip(self.envs, actions):
-            env.make_move(action)
+        self.sim.step(actions)
 
-    def poll_results(self) -> np.ndarray:
+    def poll_results(self, out: StepBuffers | None = None) -> np.ndarray | StepBuffers:
         """
-        Returns an array of experiences from the environments
+        Returns an array of experiences from the environments, or fills and returns out if given
         """
-        return np.array(
-            [env.get_experience() for env in self.envs], dtype=pymessage_dtype
+        if out is not None:
+            sim = self.sim
+            out.fill(
+                sim.boards,
+                sim.prev_boards,
+                sim.valid_moves,
+                sim.rewards,
+                sim.is_terminated,
+            )
+            return out
+        results = np.zeros(self.num_envs, dtype=pymessage_dtype)
+        results["id"] = np.arange(self.num_envs)
+        results["state"] = unpack_boards(self.sim.boards)
+        results["prev_state"] = unpack_boards(self.sim.prev_boards)
+        results["moves"] = self.sim.valid_moves
+        results["reward"] = self.sim.rewards
+        results["is_terminated"] = self.sim.is_terminated
+        return results
+
+    def reset_all(self) -> np.ndarray:
+        """
+        Reset all environments
+        """
+        self.sim.reset()
+        return self.poll_results()
+
+    def reset(self, idx: int) -> np.ndarray:
+        mask = np.zeros(self.num_envs, dtype=np.bool_)
+        mask[idx] = True
+        self.sim.reset(mask)
+        return self.poll_results()[idx]
+
+
+class CPPBatchEnvManager:
+    """
+    Environment manager stepping C++ simulators inside this process through the PyBatchSimulator module
+    Same interface as PyEnvManager, the C++ step releases the GIL and can spread across num_threads threads
+    Without a seed every manager draws a fresh one, so separate runs play different spawns
+    """
+
+    def __init__(
+        self,
+        num_envs: int,
+        num_threads: int = 1,
+        seed: int | None = None,
+        stats_capacity: int = 1000,
+        reward_spec: RewardSpec | None = None,
+    ):
+        # imported here so the python managers work without the extension built
+        from src.PyBatchSimulator import BatchSimulator as CPPBatchSimulator  # type: ignore
+        from src.PyBatchSimulator import RewardSpec as CPPRewardSpec  # type: ignore
+
+        self.num_envs = num_envs
+        reward_spec = CPPRewardSpec(**vars(reward_spec or RewardSpec()))
+        if seed is None:
+            seed = int(np.random.SeedSequence().generate_state(1)[0])
+        self.sim = CPPBatchSimulator(num_envs, seed, num_threads, reward_spec)
+        # the module hands back the same result arrays on every call
+        self.boards, self.moves, self.rewards, self.dones = self.sim.reset()
+        self.prev_boards = self.boards.copy()
+        self.restart = np.zeros(num_envs, dtype=np.uint8)
+        self.move_counts = np.zeros(num_envs, dtype=np.int64)
+        self.stats = EpisodeStats(stats_capacity)
+
+    def write_actions(self, actions):
+        """
+        Sends valid actions to the environments, NOMOVE leaves an environment untouched
+        """
+        self.prev_boards[:] = self.boards
+        self.sim.step(actions)
+
+    def step(self, actions, out: StepBuffers) -> StepBuffers:
+        """
+        Same as PyEnvManager.step, the recorded scores are the ones the C++ simulators kept
+        """
+        self.write_actions(actions)
+        self.move_counts += np.asarray(actions) != Move.NOMOVE.value
+        self.poll_results(out)
+        done = out.dones
+        if np.any(done):
+            cells = out.states[done].astype(np.intp)
+            self.stats.record(
+                self.sim.scores()[done],
+                self.move_counts[done],
+                cells.max(axis=1),
+            )
+            self.move_counts[done] = 0
+            self.restart[done] = 0b00010000  # restart signal of the C++ simulator
+            self.sim.step(self.restart)
+            self.restart[done] = Move.NOMOVE.value
+            self.prev_boards[done] = self.boards[done]
+            out.current_states[done] = unpack_boards(self.boards[done])
+            out.current_moves[done] = self.moves[done] & 0xF
+        return out
+
+    def poll_results(self, out: StepBuffers | None = None) -> np.ndarray | StepBuffers:
+        """
+        Returns an array of experiences from the environments, or fills and returns out if given
+        """
+        if out is not None:
+            # the C++ no moves flag is NOMOVE here
+            out.fill(
+                self.boards,
+                self.prev_boards,
+                self.moves & 0xF,
+                self.rewards,
+                self.dones,
+            )
+            return out
+        results = np.zeros(self.num_envs, dtype=pymessage_dtype)
+        results["id"] = np.arange(self.num_envs)
+        results["state"] = unpack_boards(self.boards)
+        results["prev_state"] = unpack_boards(self.prev_boards)
+        results["moves"] = self.moves & 0xF  # the C++ no moves flag is NOMOVE here
+        results["reward"] = self.rewards
+        results["is_terminated"] = self.dones
+        return results
+
+    def reset_all(self) -> np.ndarray:
+        """
+        Reset all environments
+        """
+        self.sim.reset()
+        self.prev_boards[:] = self.boards
+        self.move_counts[:] = 0
+        return self.poll_results()
+
+    def reset(self, idx: int) -> np.ndarray:
+        self.restart[idx] = 0b00010000  # restart signal of the C++ simulator
+        self.sim.step(self.restart)
+        self.restart[idx] = Move.NOMOVE.value
+        self.prev_boards[idx] = self.boards[idx]
+        self.move_counts[idx] = 0
+        return self.poll_results()[idx]
+
+
+# Arrays shared between a ShardedPyEnvManager and its workers, laid out back to back in one segment
+sharded_layout = [
+    ("boards", np.uint64),
+    ("prev_boards", np.uint64),
+    ("rewards", np.float64),
+    ("scores", np.int64),
+    ("move_counts", np.uint32),
+    ("valid_moves", np.uint8),
+    ("is_terminated", np.bool_),
+    ("actions", np.uint8),
+    ("reset_mask", np.bool_),
+]
+
+COMMAND_STEP = 0
+COMMAND_RESET = 1
+COMMAND_STOP = 2
+
+
+def sharded_arrays(buffer, num_envs: int) -> dict:
+    """
+    Returns NumPy views of every array in sharded_layout over a shared memory buffer,
+    plus a one element "command" array
+    """
+    arrays = {}
+    offset = 0
+    for name, dtype in sharded_layout:
+        arrays[name] = np.ndarray(
+            (num_envs,), dtype=dtype, buffer=buffer, offset=offset
         )
+        # keep every array 8-byte aligned
+        offset += -(-num_envs * np.dtype(dtype).itemsize // 8) * 8
+    arrays["command"] = np.ndarray((1,), dtype=np.int64, buffer=buffer, offset=offset)
+    return arrays
+
+
+def sharded_size(num_envs: int) -> int:
+    return (
+        sum(-(-num_envs * np.dtype(d).itemsize // 8) * 8 for _, d in sharded_layout) + 8
+    )
+
+
+def sharded_worker(
+    shm_name: str,
+    num_envs: int,
+    start: int,
+    stop: int,
+    barrier,
+    core: int | None,
+    seed: np.random.SeedSequence,
+    reward_spec: RewardSpec | None = None,
+) -> None:
+    """
+    Worker process of a ShardedPyEnvManager, steps the environments [start, stop) in lock-step:
+    wait on the barrier for a command, run it on its slice, wait on the barrier again when done
+    """
+    if core is not None and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {core})
+    shm = shared_memory.SharedMemory(name=shm_name)
+    arrays = sharded_arrays(shm.buf, num_envs)
+    sim = BatchSimulator(
+        stop - start, LookupTable(), seed=seed, reward_spec=reward_spec
+    )
+
+    def publish():
+        arrays["boards"][start:stop] = sim.boards
+        arrays["prev_boards"][start:stop] = sim.prev_boards
+        arrays["rewards"][start:stop] = sim.rewards
+        arrays["scores"][start:stop] = sim.scores
+        arrays["move_counts"][start:stop] = sim.move_counts
+        arrays["valid_moves"][start:stop] = sim.valid_moves
+        arrays["is_terminated"][start:stop] = sim.is_terminated
+
+    publish()
+    barrier.wait()
+    while True:
+        barrier.wait()
+        command = arrays["command"][0]
+        if command == COMMAND_STOP:
+            break
+        if command == COMMAND_STEP:
+            sim.step(arrays["actions"][start:stop])
+        elif command == COMMAND_RESET:
+            sim.reset(arrays["reset_mask"][start:stop].copy())
+        publish()
+        barrier.wait()
+    del arrays
+    shm.close()
+
+
+class ShardedPyEnvManager:
+    """
+    Environment manager splitting vectorized python simulations across worker processes
+    Boards, rewards, valid moves and done flags live in shared memory, so results are read
+    without copies, and every worker steps its slice in lock-step with the learner
+    """
+
+    def __init__(
+        self,
+        num_envs: int,
+        num_workers: int,
+        pin_workers: bool = False,
+        stats_capacity: int = 1000,
+        reward_spec: RewardSpec | None = None,
+    ):
+        self.num_envs = num_envs
+        self.num_workers = min(num_workers, num_envs)
+        self.stats = EpisodeStats(stats_capacity)
+        self.shm = shared_memory.SharedMemory(create=True, size=sharded_size(num_envs))
+        self.arrays = sharded_arrays(self.shm.buf, num_envs)
+
+        # spawn, forking a process that already started TensorFlow is unsafe
+        ctx = mp.get_context("spawn")
+        self.barrier = ctx.Barrier(self.num_workers + 1)
+        bounds = np.linspace(0, num_envs, self.num_workers + 1).astype(int)
+        seeds = np.random.SeedSequence().spawn(self.num_workers)
+        cores = os.cpu_count() or 1
+        self.workers = []
+        for i in range(self.num_workers):
+            worker = ctx.Process(
+                target=sharded_worker,
+                args=(
+                    self.shm.name,
+                    num_envs,
+                    bounds[i],
+                    bounds[i + 1],
+                    self.barrier,
+                    i % cores if pin_workers else None,
+                    seeds[i],
+                    reward_spec,
+                ),
+                daemon=True,
+            )
+            worker.start()
+            self.workers.append(worker)
+        # every worker published its initial boards, a worker that died on startup breaks the barrier
+        self.barrier.wait(timeout=120)
+
+    def write_actions(self, actions):
+        """
+        Sends valid actions to the environments
+        """
+        self.arrays["actions"][:] = actions
+        self.__run(COMMAND_STEP)
+
+    def step(self, actions, out: StepBuffers) -> StepBuffers:
+        """
+        Same as PyEnvManager.step, finished environments are reset by their workers in one extra round
+        """
+        self.write_actions(actions)
+        self.poll_results(out)
+        done = out.dones
+        if np.any(done):
+            self.stats.record(
+                self.arrays["scores"][done],
+                self.arrays["move_counts"][done],
+                out.states[done].max(axis=1),
+            )
+            self.arrays["reset_mask"][:] = done
+            self.__run(COMMAND_RESET)
+            out.current_states[done] = unpack_boards(self.arrays["boards"][done])
+            out.current_moves[done] = self.arrays["valid_moves"][done]
+        return out
+
+    def poll_results(self, out: StepBuffers | None = None) -> np.ndarray | StepBuffers:
+        """
+        Returns an array of experiences from the environments, or fills and returns out if given
+        """
+        a = self.arrays
+        if out is not None:
+            out.fill(
+                a["boards"],
+                a["prev_boards"],
+                a["valid_moves"],
+                a["rewards"],
+                a["is_terminated"],
+            )
+            return out
+        results = np.zeros(self.num_envs, dtype=pymessage_dtype)
+        results["id"] = np.arange(self.num_envs)
+        results["state"] = unpack_boards(self.arrays["boards"])
+        results["prev_state"] = unpack_boards(self.arrays["prev_boards"])
+        results["moves"] = self.arrays["valid_moves"]
+        results["reward"] = self.arrays["rewards"]
+        results["is_terminated"] = self.arrays["is_terminated"]
+        return results
 
     def reset_all(self) -> np.ndarray:
         """
         Reset all environments
         """
-        for env in self.envs:
-            env.reset()
+        self.arrays["reset_mask"][:] = True
+        self.__run(COMMAND_RESET)
         return self.poll_results()
 
     def reset(self, idx: int) -> np.ndarray:
-        self.envs[idx].reset()
-        return self.envs[idx].get_experience()
+        self.arrays["reset_mask"][:] = False
+        self.arrays["reset_mask"][idx] = True
+        self.__run(COMMAND_RESET)
+        return self.poll_results()[idx]
+
+    def close(self) -> None:
+        """
+        Stops the workers and releases the shared memory
+        """
+        if not self.workers:
+            return
+        self.arrays["command"][0] = COMMAND_STOP
+        self.barrier.wait()
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+        self.arrays = {}
+        self.shm.close()
+        self.shm.unlink()
+
+    def __run(self, command: int) -> None:
+        """
+        Releases the workers on a command and waits until every slice is done
+        """
+        self.arrays["command"][0] = command
+        self.barrier.wait()
+        self.barrier.wait()
 
 
 class WebEnvManager:
@@ -0,0 +1,201 @@
+import numpy as np
+from numpy.typing import NDArray
+
+# Format of the exported weights, bumped whenever the layout of the .npz changes
+WEIGHTS_VERSION = 1
+
+# Dense layers of DuelingDQN in the order of its forward pass, under the names they are exported with
+HIDDEN_LAYERS = ("hidden_0", "hidden_1")
+VALUE_LAYERS = ("value_0", "value_1", "value_2")
+ADV_LAYERS = ("adv_0", "adv_1", "adv_2")
+DENSE_LAYERS = HIDDEN_LAYERS + VALUE_LAYERS + ADV_LAYERS
+NORM_LAYER = "hidden_norm"
+
+QUANTIZE_TYPES = ("float32", "float16", "int8")
+
+
+def export_dueling_dqn(model, path: str, quantize: str = "float32") -> None:
+    """
+    Writes the weights of a built DuelingDQN to a flat .npz readable without tensorflow
+    model: src.model.DuelingDQN, called at least once so its layers hold weights
+    path: file the weights are written to, numpy appends .npz if it is missing
+    quantize: storage type of the dense kernels, float32, float16, or int8 with a float32 scale per output unit,
+    biases and the layer norm are always float32
+    """
+    if quantize not in QUANTIZE_TYPES:
+        raise ValueError(
+            f"Quantize type {quantize} not recognized, valid options: {QUANTIZE_TYPES}"
+        )
+    dense_0, norm, dense_1 = model.hidden.layers
+    dense = [dense_0, dense_1, *model.value_stream.layers, *model.adv_stream.layers]
+    gamma, beta = norm.get_weights()
+    weights = {
+        "version": np.array(WEIGHTS_VERSION),
+        "quantize": np.array(quantize),
+        f"{NORM_LAYER}/gamma": gamma.astype(np.float32),
+        f"{NORM_LAYER}/beta": beta.astype(np.float32),
+        f"{NORM_LAYER}/epsilon": np.array(norm.epsilon, dtype=np.float32),
+    }
+    for name, layer in zip(DENSE_LAYERS, dense):
+        kernel, bias = layer.get_weights()
+        weights[f"{name}/bias"] = bias.astype(np.float32)
+        match (quantize):
+            case "float32":
+                weights[f"{name}/kernel"] = kernel.astype(np.float32)
+            case "float16":
+                weights[f"{name}/kernel"] = kernel.astype(np.float16)
+            case "int8":
+                scale = np.abs(kernel).max(axis=0) / 127
+                scale[scale == 0] = 1
+                weights[f"{name}/kernel"] = np.round(kernel / scale).astype(np.int8)
+                weights[f"{name}/scale"] = scale.astype(np.float32)
+    np.savez(path, **weights)
+
+
+def load_dueling_dqn(path: str) -> dict[str, NDArray[np.float32]]:
+    """
+    Returns the weights exported by export_dueling_dqn with every kernel dequantized back to float32
+    Raises ValueError if the file was written by an unsupported version of the exporter
+    """
+    with np.load(path) as data:
+        if int(data["version"]) != WEIGHTS_VERSION:
+            raise ValueError(f"Weights at {path} have an unsupported version")
+        weights = {}
+        for name in DENSE_LAYERS:
+            kernel = data[f"{name}/kernel"].astype(np.float32)
+            if f"{name}/scale" in data:
+                kernel *= data[f"{name}/scale"]
+            weights[f"{name}/kernel"] = kernel
+            weights[f"{name}/bias"] = data[f"{name}/bias"].astype(np.float32)
+        for key in ("gamma", "beta", "epsilon"):
+            weights[f"{NORM_LAYER}/{key}"] = data[f"{NORM_LAYER}/{key}"].astype(
+                np.float32
+            )
+    return weights
+
+
+class NumpyDuelingDQN:
+    """
+    CPU forward pass of DuelingDQN in numpy, for playing without tensorflow
+    The layers are fused when loading so a forward pass is five matrix products:
+      - the layer norm's gamma and beta are folded into the following dense layer
+      - the first layers of the value and advantage streams run as one wider layer, the second as one
+        block diagonal layer
+      - the last layers and the dueling merge v + (a - mean(a)) collapse into one linear layer
+    Activations are written into buffers preallocated for the largest batch seen so far
+    """
+
+    def __init__(self, weights: dict[str, NDArray[np.float32]], max_batch: int = 1):
+        """
+        weights: the layers of a DuelingDQN as returned by load_dueling_dqn
+        max_batch: batch size the buffers are first allocated for, they grow on larger batches
+        """
+        w = {name: weights[f"{name}/kernel"] for name in DENSE_LAYERS}
+        b = {name: weights[f"{name}/bias"] for name in DENSE_LAYERS}
+        gamma = weights[f"{NORM_LAYER}/gamma"]
+        beta = weights[f"{NORM_LAYER}/beta"]
+        self.epsilon = np.float32(weights[f"{NORM_LAYER}/epsilon"])
+
+        value_1, adv_1 = w["value_1"], w["adv_1"]
+        streams_1 = np.zeros(
+            (value_1.shape[0] + adv_1.shape[0], value_1.shape[1] + adv_1.shape[1]),
+            dtype=np.float32,
+        )
+        streams_1[: value_1.shape[0], : value_1.shape[1]] = value_1
+        streams_1[value_1.shape[0] :, value_1.shape[1] :] = adv_1
+
+        value_2, adv_2 = w["value_2"], w["adv_2"]
+        action_dim = adv_2.shape[1]
+        centered = adv_2 - adv_2.mean(axis=1, keepdims=True)
+        out = np.concatenate([np.repeat(value_2, action_dim, axis=1), centered])
+        out_bias = b["value_2"] + b["adv_2"] - b["adv_2"].mean()
+
+        # (kernel, bias, elu) of every fused layer, the layer norm normalizes the output of the first
+        layers = [
+            (w["hidden_0"], b["hidden_0"], True),
+            (
+                gamma[:, None] * w["hidden_1"],
+                beta @ w["hidden_1"] + b["hidden_1"],
+                True,
+            ),
+            (
+                np.concatenate([w["value_0"], w["adv_0"]], axis=1),
+                np.concatenate([b["value_0"], b["adv_0"]]),
+                True,
+            ),
+            (streams_1, np.concatenate([b["value_1"], b["adv_1"]]), True),
+            (out, out_bias, False),
+        ]
+        self.layers: list[tuple[NDArray[np.float32], NDArray[np.float32], bool]] = [
+            (
+                np.ascontiguousarray(kernel, np.float32),
+                np.asarray(bias, np.float32),
+                elu,
+            )
+            for kernel, bias, elu in layers
+        ]
+        units = self.layers[0][0].shape[1]
+        self.averager = np.full((units, 1), 1 / units, dtype=np.float32)
+        self.state_dim: int = self.layers[0][0].shape[0]
+        self.action_dim: int = action_dim
+        self.capacity: int = 0
+        self.__allocate(max_batch)
+
+    @classmethod
+    def load(cls, path: str, max_batch: int = 1) -> "NumpyDuelingDQN":
+        """
+        Loads the weights exported by export_dueling_dqn
+        """
+        return cls(load_dueling_dqn(path), max_batch)
+
+    def __call__(self, states: NDArray) -> NDArray[np.float32]:
+        """
+        states: np.ndarray of shape (N, state_dim)
+        Returns the q-values of every state, shape (N, action_dim), as a view of an internal buffer
+        that the next call overwrites, copy it to keep it
+        """
+        n = len(states)
+        if n > self.capacity:
+            self.__allocate(n)
+        x = np.asarray(states, dtype=np.float32)
+        for i, (kernel, bias, elu) in enumerate(self.layers):
+            out = self.outputs[i][:n]
+            np.matmul(x, kernel, out=out)
+            out += bias
+            if elu:
+                # elu(x) = max(x, 0) + expm1(min(x, 0))
+                scratch = self.scratch[i][:n]
+                np.minimum(out, 0, out=scratch)
+                np.expm1(scratch, out=scratch)
+                np.maximum(out, 0, out=out)
+                out += scratch
+            if i == 0:
+                self.__normalize(out)
+            x = out
+        return x
+
+    def __normalize(self, x: NDArray[np.float32]) -> None:
+        """
+        Layer norm without its gamma and beta, in place
+        The means are products with a column of 1 / units, much faster than np.mean on a few rows
+        """
+        n = len(x)
+        mean, var = self.mean[:n], self.var[:n]
+        np.matmul(x, self.averager, out=mean)
+        x -= mean
+        scratch = self.scratch[0][:n]
+        np.square(x, out=scratch)
+        np.matmul(scratch, self.averager, out=var)
+        var += self.epsilon
+        np.sqrt(var, out=var)
+        x /= var
+
+    def __allocate(self, batch: int) -> None:
+        self.capacity = batch
+        self.outputs = [
+            np.empty((batch, kernel.shape[1]), dtype=np.float32)
+            for kernel, _, _ in self.layers
+        ]
+        self.scratch = [np.empty_like(out) for out in self.outputs]
+        self.mean = np.empty((batch, 1), dtype=np.float32)
+        self.var = np.empty((batch, 1), dtype=np.float32)
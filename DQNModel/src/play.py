@@ -1,25 +1,34 @@
 from time import sleep
+from typing import TYPE_CHECKING
 
-from src.agent import DQNAgent
+import numpy as np
+
+from src.codec import tile_values_to_cells, unpack_boards
 from src.env_manager import CPPEnvManager, PyEnvManager, WebEnvManager
-from src.sim import Simulator, LookupTable, Move
+from src.results import ResultsWriter
+from src.sim import BatchSimulator, Simulator, LookupTable, Move
+
+if TYPE_CHECKING:  # playing never imports tensorflow
+    from src.dqn_agent import DQNAgent
 
 
-def play_dqn(agent: DQNAgent, env_manager: CPPEnvManager):
+def play_dqn(agent: "DQNAgent", env_manager: CPPEnvManager):
     env_manager.reset_all()  # reset all environments at episode start
     while True:
         state = env_manager.pop_results()
         if state.size == 0:
             continue
-        action = [agent.select_action(state["board"], 0, state["moves"])]
+        action = np.array(
+            [agent.select_action(state["board"], 0, state["moves"])], dtype=np.int32
+        )
         env_manager.write_actions(action)
-        if action == 0b00010000:
+        if -action[0] == 0b00010000:  # sent actions are negated by write_actions
             break
 
     print(state)
 
 
-def play_py_dqn(agent: DQNAgent, env: PyEnvManager):
+def play_py_dqn(agent: "DQNAgent", env: PyEnvManager):
     action_count = 0
     while True:
         action = agent.select_action(
@@ -33,6 +42,56 @@ def play_py_dqn(agent: DQNAgent, env: PyEnvManager):
             break
 
 
+def evaluate(
+    agent: "DQNAgent",
+    game_count: int,
+    parallel_games: int = 64,
+    seed: int | None = None,
+    writer: ResultsWriter | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Plays game_count greedy games, parallel_games at a time on a BatchSimulator, with one batched action selection per move
+    Finished games are replaced by fresh ones until game_count games have ended, and streamed to writer as they end
+    Returns (scores, max_tiles, end_states), end_states are the unpacked final boards of shape (game_count, 16)
+    """
+    parallel_games = min(parallel_games, game_count)
+    sim = BatchSimulator(parallel_games, LookupTable(), seed=seed)
+    scores = np.zeros(game_count, dtype=np.int64)
+    end_states = np.zeros((game_count, 16), dtype=np.uint8)
+    active = np.ones(parallel_games, dtype=np.bool_)
+    started = parallel_games
+    finished = 0
+    while finished < game_count:
+        actions = agent.select_actions_batch(
+            sim.get_boards(packed=False), 0, sim.valid_moves
+        )
+        actions[~active] = Move.NOMOVE.value
+        sim.step(actions)
+
+        ended = np.flatnonzero(sim.is_terminated & active)
+        if ended.size == 0:
+            continue
+        slots = np.arange(finished, finished + ended.size)
+        scores[slots] = sim.scores[ended]
+        end_states[slots] = unpack_boards(sim.boards[ended])
+        if writer is not None:
+            writer.add(sim.scores[ended], sim.boards[ended], sim.move_counts[ended])
+        finished += ended.size
+        print(f"{finished}/{game_count} games finished")
+
+        # replace finished games while there are games left to start, retire the rest
+        restart = ended[: max(0, game_count - started)]
+        started += restart.size
+        active[ended] = False
+        active[restart] = True
+        reset_mask = np.zeros(parallel_games, dtype=np.bool_)
+        reset_mask[restart] = True
+        sim.reset(reset_mask)
+
+    max_tiles = 1 << end_states.max(axis=1).astype(np.int64)
+    return scores, max_tiles, end_states
+
+
 def play_user_dqn():
     look_up_table = LookupTable()
     sim = Simulator(0, look_up_table)
@@ -68,7 +127,7 @@ def play_user_dqn():
     sim.print_board()
 
 
-def play_web_dqn(agent: DQNAgent, env: WebEnvManager):
+def play_web_dqn(agent: "DQNAgent", env: WebEnvManager):
     action_count = 0
     while True:
         try:
@@ -76,7 +135,9 @@ def play_web_dqn(agent: DQNAgent, env: WebEnvManager):
             moves = env.get_valid_moves()
             print(board.reshape(4, 4))
             print(format(moves, "04b"))
-            action = agent.select_action(env.get_board(), 0, env.get_valid_moves())
+            action = agent.select_action(
+                tile_values_to_cells(board), 0, env.get_valid_moves()
+            )
             print(f"Sending {format(action, "05b")}")
             env.write_action(action)
             action_count += 1
@@ -0,0 +1,152 @@
+import os
+
+import numpy as np
+from numpy.typing import NDArray
+
+from src.codec import pack_boards, unpack_boards
+
+# File layout: a 16 byte header (magic, format version, record size) followed by fixed-width little-endian records
+RESULTS_MAGIC = b"2048RSLT"
+RESULTS_VERSION = 1
+RESULT_DTYPE = np.dtype(
+    [
+        ("game_id", "<u8"),
+        ("seed", "<i8"),
+        ("score", "<i8"),
+        ("max_tile", "<u4"),
+        ("move_count", "<u4"),
+        ("board", "<u8"),
+    ]
+)
+HEADER_DTYPE = np.dtype([("magic", "S8"), ("version", "<u4"), ("record_size", "<u4")])
+
+
+class ResultsWriter:
+    """
+    Streams evaluation results to a binary file of fixed-width RESULT_DTYPE records
+    Records are buffered and appended chunk_size at a time, every chunk is flushed and fsynced so a crash loses at most
+    the unwritten chunk. Reopening an existing file drops a torn trailing record and continues its game ids
+    """
+
+    def __init__(self, path: str, seed: int, chunk_size: int = 64):
+        self.path = path
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.pending = np.zeros(0, dtype=RESULT_DTYPE)
+
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            read_header(path)
+            record_count = (
+                os.path.getsize(path) - HEADER_DTYPE.itemsize
+            ) // RESULT_DTYPE.itemsize
+            self.file = open(path, "r+b")
+            self.file.truncate(
+                HEADER_DTYPE.itemsize + record_count * RESULT_DTYPE.itemsize
+            )
+            self.file.seek(0, os.SEEK_END)
+        else:
+            record_count = 0
+            self.file = open(path, "wb")
+            header = np.array(
+                [(RESULTS_MAGIC, RESULTS_VERSION, RESULT_DTYPE.itemsize)],
+                dtype=HEADER_DTYPE,
+            )
+            self.file.write(header.tobytes())
+            self.__sync()
+        self.next_game_id = record_count
+
+    def add(
+        self,
+        scores: NDArray[np.int64],
+        boards: NDArray,
+        move_counts: NDArray[np.uint32],
+    ) -> None:
+        """
+        scores: np.ndarray of shape (N,), final score of every game
+        boards: np.ndarray of shape (N,) of packed 64-bit boards or (N, 16) of unpacked boards, final board of every game
+        move_counts: np.ndarray of shape (N,), moves made in every game
+        """
+        boards = np.asarray(boards)
+        if boards.ndim == 2:
+            boards = pack_boards(boards)
+        records = np.zeros(len(scores), dtype=RESULT_DTYPE)
+        records["game_id"] = self.next_game_id + np.arange(len(scores))
+        records["seed"] = self.seed
+        records["score"] = scores
+        records["board"] = boards
+        records["move_count"] = move_counts
+        records["max_tile"] = 1 << unpack_boards(boards).max(axis=1).astype(np.uint32)
+        self.next_game_id += len(scores)
+
+        self.pending = np.concatenate((self.pending, records))
+        full = len(self.pending) - len(self.pending) % self.chunk_size
+        if full > 0:
+            self.__write(full)
+
+    def flush(self) -> None:
+        """
+        Appends every buffered record to the file and syncs it to disk
+        """
+        if len(self.pending) > 0:
+            self.__write(len(self.pending))
+
+    def close(self) -> None:
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __write(self, count: int) -> None:
+        self.file.write(self.pending[:count].tobytes())
+        self.pending = self.pending[count:]
+        self.__sync()
+
+    def __sync(self) -> None:
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+
+def read_header(path: str) -> np.void:
+    """
+    Returns the header of a results file, raises ValueError if it isn't a results file this version can read
+    """
+    header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+    if header.size == 0 or header[0]["magic"] != RESULTS_MAGIC:
+        raise ValueError(f"{path} is not a results file")
+    if (
+        header[0]["version"] != RESULTS_VERSION
+        or header[0]["record_size"] != RESULT_DTYPE.itemsize
+    ):
+        raise ValueError(
+            f"{path} has results format version {header[0]['version']}, expected {RESULTS_VERSION}"
+        )
+    return header[0]
+
+
+def is_results_file(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(RESULTS_MAGIC)) == RESULTS_MAGIC
+
+
+def read_results(path: str) -> np.ndarray:
+    """
+    Returns the records of a results file as a read-only memory-mapped array of RESULT_DTYPE
+    A torn trailing record left by a crash mid-write is ignored
+    """
+    read_header(path)
+    record_count = (
+        os.path.getsize(path) - HEADER_DTYPE.itemsize
+    ) // RESULT_DTYPE.itemsize
+    if record_count == 0:
+        return np.zeros(0, dtype=RESULT_DTYPE)
+    return np.memmap(
+        path,
+        dtype=RESULT_DTYPE,
+        mode="r",
+        offset=HEADER_DTYPE.itemsize,
+        shape=(record_count,),
+    )
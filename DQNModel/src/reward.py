@@ -0,0 +1,117 @@
+import math
+from typing import Callable
+
+import numpy as np
+from numpy.typing import NDArray
+
+from src.codec import ROW_CELLS, row_indices
+
+# Merge score of every tile value: a tile of log2 value v took (v - 1) * 2^v in merges to build,
+# assuming every spawned tile was a 2, so the score of a game can be estimated from its board alone
+TILE_SCORES = np.array([0, 0] + [(v - 1) << v for v in range(2, 16)], dtype=np.int64)
+
+# Reward features of every possible 16-bit row, indexed by the row
+ROW_EMPTY = np.count_nonzero(ROW_CELLS == 0, axis=1).astype(np.int64)
+ROW_MAX = ROW_CELLS.max(axis=1)
+ROW_CORNER_MAX = np.maximum(
+    ROW_CELLS[:, 0], ROW_CELLS[:, 3]
+)  # larger of the row's first and last cell
+# max tile in the high nibble and corner max in the low one, so a board needs one lookup per row,
+# the max over four rows keeps the max tile on top
+ROW_MAX_CORNER = (ROW_MAX << 4) | ROW_CORNER_MAX
+
+# log2(1 + gained) for the usual score gains, through math.log2, the C library log2 the C++ kernel calls
+# np.log2 can differ from it in the last bit, which would break the exact agreement between the simulators
+SCORE_LOG_LIMIT = 1 << 16
+SCORE_LOGS = np.array([math.log2(1 + g) for g in range(SCORE_LOG_LIMIT)])
+
+RewardKernel = Callable[
+    [NDArray[np.uint64], NDArray[np.int64], NDArray[np.bool_]], NDArray[np.float64]
+]
+
+
+class RewardSpec:
+    """
+    Terms and scales of the training reward, shared by the python and C++ simulators:
+        score_scale * log2(1 + merge score of the move, read off the move table)
+      + max_tile_scale * log2(log2 value of the largest tile)
+      + corner_scale if the largest tile sits in a corner
+      + empty_scale * empty cells
+      - terminal_scale if the game is over
+    RewardSpec in DQNTrainer/include/reward.hpp has the same fields and defaults, and its RewardKernel
+    does the same arithmetic in the same order, so both simulators produce identical rewards
+    """
+
+    def __init__(
+        self,
+        score_scale: float = 1.0,
+        max_tile_scale: float = 0.2,
+        corner_scale: float = 0.1,
+        empty_scale: float = 0.1,
+        terminal_scale: float = 5.0,
+    ):
+        self.score_scale = score_scale
+        self.max_tile_scale = max_tile_scale
+        self.corner_scale = corner_scale
+        self.empty_scale = empty_scale
+        self.terminal_scale = terminal_scale
+
+    def compile(self) -> RewardKernel:
+        """
+        Returns kernel(boards, gained, terminated) computing the reward of a batch of packed boards
+        from the per-row features, four table lookups per board and table
+        boards are the boards after the move and its spawned tile, gained the merge scores of the moves alone,
+        so the spawned tile never counts towards the score term
+        """
+        score_scale = self.score_scale
+        corner_scale = self.corner_scale
+        empty_scale = self.empty_scale
+        terminal_scale = self.terminal_scale
+        max_tile_terms = self.max_tile_scale * np.array(
+            [math.log2(max(v, 1)) for v in range(16)]
+        )
+
+        def kernel(
+            boards: NDArray[np.uint64],
+            gained: NDArray[np.int64],
+            terminated: NDArray[np.bool_],
+        ) -> NDArray[np.float64]:
+            r0, r1, r2, r3 = row_indices(boards).T
+            empty = ROW_EMPTY[r0] + ROW_EMPTY[r1] + ROW_EMPTY[r2] + ROW_EMPTY[r3]
+            first, last = ROW_MAX_CORNER[r0], ROW_MAX_CORNER[r3]
+            largest = (
+                np.maximum(
+                    np.maximum(first, ROW_MAX_CORNER[r1]),
+                    np.maximum(ROW_MAX_CORNER[r2], last),
+                )
+                >> 4
+            )
+            in_corner = np.maximum(first & 0xF, last & 0xF) == largest
+
+            reward = score_scale * score_logs(np.asarray(gained, dtype=np.int64))
+            reward += max_tile_terms[largest]
+            reward += corner_scale * in_corner
+            reward += empty_scale * empty
+            reward -= terminal_scale * np.asarray(terminated, dtype=np.bool_)
+            return reward
+
+        return kernel
+
+    def __repr__(self) -> str:
+        terms = ", ".join(f"{name}={value}" for name, value in vars(self).items())
+        return f"RewardSpec({terms})"
+
+
+def score_logs(gained: NDArray[np.int64]) -> NDArray[np.float64]:
+    """
+    gained: np.ndarray of shape (N,) of score gains
+    Returns log2(1 + gained) for every gain, negative gains count as 0
+    """
+    gained = np.maximum(gained, 0)
+    logs = SCORE_LOGS[np.minimum(gained, SCORE_LOG_LIMIT - 1)]
+    large = np.flatnonzero(gained >= SCORE_LOG_LIMIT)
+    for (
+        i
+    ) in large:  # only merges into tiles of 2^15 and up gain this much in a single move
+        logs[i] = math.log2(1 + int(gained[i]))
+    return logs
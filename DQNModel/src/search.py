@@ -0,0 +1,370 @@
+import time
+from collections import OrderedDict
+
+import numpy as np
+from numpy.typing import NDArray
+
+from src.codec import ROW_CELLS
+from src.sim import MOVE_FLAGS, VALID_ACTION_MASKS, BatchSimulator, LookupTable, Move
+
+# Row heuristic weights, the usual expectimax evaluation: reward empty cells, merges and monotonic rows,
+# penalise large tiles away from the edges through the sum term, and offset everything so lost boards score 0
+LOST_PENALTY = 200000.0
+MONOTONICITY_POWER = 4.0
+MONOTONICITY_WEIGHT = 47.0
+SUM_POWER = 3.5
+SUM_WEIGHT = 11.0
+MERGES_WEIGHT = 700.0
+EMPTY_WEIGHT = 270.0
+
+# Row empty_mask -> offsets of its empty cells within the row, first cell first
+EMPTY_CELL_SHIFTS = tuple(
+    tuple(4 * (3 - c) for c in range(4) if mask >> c & 1) for mask in range(16)
+)
+# Packed board row index -> shift of the row, row 0 first
+BOARD_ROW_SHIFTS = (48, 32, 16, 0)
+# Probability of each spawned tile: log2 value, probability
+SPAWNS = ((1, 0.9), (2, 0.1))
+
+
+def row_heuristics() -> NDArray[np.float64]:
+    """
+    Returns the heuristic value of every possible 16-bit row, a board scores the sum over its rows and columns
+    """
+    cells = ROW_CELLS.astype(np.int64)
+    ranks = cells.astype(np.float64)
+    empty = np.count_nonzero(cells == 0, axis=1)
+
+    # merges: every run of equal tiles once the zeros are squeezed out counts its length
+    order = np.argsort(cells == 0, axis=1, kind="stable")
+    compact = np.take_along_axis(cells, order, axis=1)
+    equal = (compact[:, 1:] != 0) & (compact[:, 1:] == compact[:, :-1])
+    run_starts = equal & ~np.concatenate(
+        [np.zeros((len(cells), 1), np.bool_), equal[:, :-1]], axis=1
+    )
+    merges = equal.sum(axis=1) + run_starts.sum(axis=1)
+
+    powered = ranks**MONOTONICITY_POWER
+    step = powered[:, 1:] - powered[:, :-1]
+    decreasing = cells[:, :-1] > cells[:, 1:]
+    mono_left = np.where(decreasing, -step, 0.0).sum(axis=1)
+    mono_right = np.where(decreasing, 0.0, step).sum(axis=1)
+
+    return (
+        LOST_PENALTY
+        + EMPTY_WEIGHT * empty
+        + MERGES_WEIGHT * merges
+        - MONOTONICITY_WEIGHT * np.minimum(mono_left, mono_right)
+        - SUM_WEIGHT * (ranks**SUM_POWER).sum(axis=1)
+    )
+
+
+def transpose_board(board: int) -> int:
+    """
+    board: packed board as a python int
+    Returns the transposed board, the scalar form of src.board.transpose_boards
+    """
+    a = (
+        (board & 0xF0F00F0FF0F00F0F)
+        | ((board & 0x0000F0F00000F0F0) << 12)
+        | ((board & 0x0F0F00000F0F0000) >> 12)
+    )
+    return (
+        (a & 0xFF00FF0000FF00FF)
+        | ((a & 0x00FF00FF00000000) >> 24)
+        | ((a & 0x00000000FF00FF00) << 24)
+    )
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside a search once its time budget is spent
+    """
+
+
+class Expectimax:
+    """
+    Expectimax search over packed boards: max nodes pick a move, chance nodes average over every 2 and 4 spawn
+    Boards are python ints so every node is a handful of table lookups on the LookupTable move tables
+    Chance nodes reached with a probability below prob_cutoff, or with no depth left, are scored by the row heuristic
+    Chance node values are kept in a transposition table of at most table_size boards, each tagged with the depth
+    it was searched to. The table lives across deepening passes and moves, an entry answers any lookup that needs
+    at most its depth, and the least recently used entries are dropped first once it is full
+    """
+
+    def __init__(
+        self,
+        look_up_table: LookupTable,
+        depth: int = 3,
+        time_budget: float | None = None,
+        prob_cutoff: float = 1e-4,
+        table_size: int = 1 << 20,
+    ):
+        """
+        depth: moves searched ahead, the depth limit of the iterative deepening when time_budget is set
+        time_budget: optional seconds per search, deepens one move at a time and keeps the deepest finished result
+        """
+        if depth < 1:
+            raise ValueError("depth must be at least 1")
+        self.depth = depth
+        self.time_budget = time_budget
+        self.prob_cutoff = prob_cutoff
+        self.table_size = table_size
+        # python lists index faster than numpy arrays with python ints
+        self.moves_left = look_up_table.moves.tolist()
+        self.moves_right = look_up_table.moves_right.tolist()
+        self.col_up = look_up_table.col_up.tolist()
+        self.col_down = look_up_table.col_down.tolist()
+        self.empty_mask = look_up_table.empty_mask.tolist()
+        self.heuristics = row_heuristics().tolist()
+        self.table: OrderedDict[int, tuple[int, float]] = OrderedDict()
+        self.deadline = float("inf")
+        self.nodes = 0
+        self.search_time = 0.0
+        self.searches = 0
+        self.completed_depth = 0
+
+    def search(self, board: int) -> NDArray[np.float64]:
+        """
+        board: packed board as a python int
+        Returns the expected heuristic value of every move ordered LEFT, RIGHT, UP, DOWN, -inf for illegal moves
+        """
+        start = time.perf_counter()
+        self.searches += 1
+        values = np.full(4, -np.inf)
+        if self.time_budget is None:
+            values = self.__search_to(board, self.depth)
+            self.completed_depth = self.depth
+        else:
+            self.deadline = start + self.time_budget
+            for depth in range(1, self.depth + 1):
+                try:
+                    values = self.__search_to(board, depth)
+                except SearchTimeout:
+                    break
+                # depth 1 only scores afterstates and never checks the clock, so there is always a move to play
+                self.completed_depth = depth
+            self.deadline = float("inf")
+        self.search_time += time.perf_counter() - start
+        return values
+
+    def nodes_per_sec(self) -> float:
+        """
+        Returns the nodes visited per second over every search so far
+        """
+        return self.nodes / self.search_time if self.search_time > 0 else 0.0
+
+    def moves(self, board: int) -> tuple[int, int, int, int]:
+        """
+        board: packed board as a python int
+        Returns the afterstates of the four moves ordered LEFT, RIGHT, UP, DOWN
+        """
+        r0, r1, r2, r3 = (
+            board >> 48,
+            (board >> 32) & 0xFFFF,
+            (board >> 16) & 0xFFFF,
+            board & 0xFFFF,
+        )
+        left, right = self.moves_left, self.moves_right
+        t = transpose_board(board)
+        c0, c1, c2, c3 = t >> 48, (t >> 32) & 0xFFFF, (t >> 16) & 0xFFFF, t & 0xFFFF
+        up, down = self.col_up, self.col_down
+        return (
+            (left[r0] << 48) | (left[r1] << 32) | (left[r2] << 16) | left[r3],
+            (right[r0] << 48) | (right[r1] << 32) | (right[r2] << 16) | right[r3],
+            up[c0] | (up[c1] >> 4) | (up[c2] >> 8) | (up[c3] >> 12),
+            down[c0] | (down[c1] >> 4) | (down[c2] >> 8) | (down[c3] >> 12),
+        )
+
+    def heuristic(self, board: int) -> float:
+        """
+        board: packed board as a python int
+        Returns the heuristic value of the board, the row heuristic summed over its rows and columns
+        """
+        h = self.heuristics
+        t = transpose_board(board)
+        return (
+            h[board >> 48]
+            + h[(board >> 32) & 0xFFFF]
+            + h[(board >> 16) & 0xFFFF]
+            + h[board & 0xFFFF]
+            + h[t >> 48]
+            + h[(t >> 32) & 0xFFFF]
+            + h[(t >> 16) & 0xFFFF]
+            + h[t & 0xFFFF]
+        )
+
+    def __search_to(self, board: int, depth: int) -> NDArray[np.float64]:
+        """
+        Returns the move values of a search depth moves deep
+        Entries left by shallower passes or earlier moves are only reused where they were searched deep enough
+        """
+        values = np.full(4, -np.inf)
+        for i, moved in enumerate(self.moves(board)):
+            if moved != board:
+                values[i] = self.__chance(moved, depth - 1, 1.0)
+        return values
+
+    def __max(self, board: int, depth: int, prob: float) -> float:
+        """
+        Returns the value of the best move from board, 0 when no move is left
+        """
+        best = 0.0
+        for moved in self.moves(board):
+            if moved != board:
+                value = self.__chance(moved, depth, prob)
+                if value > best:
+                    best = value
+        return best
+
+    def __chance(self, board: int, depth: int, prob: float) -> float:
+        """
+        Returns the expected value of board over every tile spawn, depth moves left to search
+        """
+        self.nodes += 1
+        if depth == 0 or prob < self.prob_cutoff:
+            return self.heuristic(board)
+        if self.nodes & 0x3FF == 0 and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+        entry = self.table.get(board)
+        if entry is not None and entry[0] >= depth:
+            self.table.move_to_end(board)
+            return entry[1]
+
+        empty = []
+        for shift in BOARD_ROW_SHIFTS:
+            for offset in EMPTY_CELL_SHIFTS[self.empty_mask[(board >> shift) & 0xFFFF]]:
+                empty.append(shift + offset)
+        if not empty:
+            return self.heuristic(board)
+
+        total = 0.0
+        cell_prob = prob / len(empty)
+        for shift in empty:
+            for tile, tile_prob in SPAWNS:
+                total += tile_prob * self.__max(
+                    board | (tile << shift), depth - 1, cell_prob * tile_prob
+                )
+        value = total / len(empty)
+
+        if board in self.table:
+            self.table.move_to_end(board)
+        elif len(self.table) >= self.table_size:
+            self.table.popitem(last=False)
+        self.table[board] = (depth, value)
+        return value
+
+
+class MonteCarlo:
+    """
+    Monte Carlo move evaluation: every legal move from a board is played rollouts times, each followed by
+    depth - 1 random moves, or moves of policy, and scored by the mean score the rollouts gained
+    Every rollout of every legal move is a board of one BatchSimulator of legal moves * rollouts boards, so a batch
+    of rollouts takes depth vectorized steps whatever the number of rollouts and illegal moves take no boards
+    """
+
+    def __init__(
+        self,
+        look_up_table: LookupTable,
+        rollouts: int = 64,
+        depth: int = 20,
+        time_budget: float | None = None,
+        policy=None,
+        seed: int | None = None,
+    ):
+        """
+        rollouts: rollouts per move and batch
+        depth: moves per rollout, the first one being the move evaluated
+        time_budget: optional seconds per search, batches of rollouts are played until it runs out, at least one
+        policy: optional agent choosing the rollout moves through select_actions_batch, random moves if None
+        """
+        if rollouts < 1 or depth < 1:
+            raise ValueError("rollouts and depth must be at least 1")
+        self.look_up_table = look_up_table
+        self.rollouts = rollouts
+        self.depth = depth
+        self.time_budget = time_budget
+        self.policy = policy
+        self.seed_sequence = np.random.SeedSequence(seed)
+        # simulators by number of legal moves, created when a board first has that many
+        self.sims: dict[int, BatchSimulator] = {}
+        self.rollouts_played = 0
+        self.search_time = 0.0
+        self.searches = 0
+
+    def search(self, board: int) -> NDArray[np.float64]:
+        """
+        board: packed board as a python int
+        Returns the mean score gained by the rollouts of every move ordered LEFT, RIGHT, UP, DOWN, -inf for illegal moves
+        """
+        start = time.perf_counter()
+        self.searches += 1
+        legal = VALID_ACTION_MASKS[
+            self.look_up_table.valid_moves(np.array([board], dtype=np.uint64))[0]
+        ]
+        if not legal.any():
+            self.search_time += time.perf_counter() - start
+            return np.full(4, -np.inf)
+        totals = np.zeros(4)
+        batches = 0
+        while True:
+            totals += self.__rollout_batch(board, legal)
+            batches += 1
+            if (
+                self.time_budget is None
+                or time.perf_counter() - start >= self.time_budget
+            ):
+                break
+        self.rollouts_played += batches * self.rollouts * int(legal.sum())
+        self.search_time += time.perf_counter() - start
+        return np.where(legal, totals / (batches * self.rollouts), -np.inf)
+
+    def rollouts_per_sec(self) -> float:
+        """
+        Returns the rollouts played per second over every search so far
+        """
+        return self.rollouts_played / self.search_time if self.search_time > 0 else 0.0
+
+    def __rollout_batch(
+        self, board: int, legal: NDArray[np.bool_]
+    ) -> NDArray[np.float64]:
+        """
+        Plays one batch of rollouts from board, returns the total score gained by the rollouts of every move
+        """
+        first_moves = MOVE_FLAGS[legal]
+        sim = self.__simulator(len(first_moves))
+        sim.set_boards(np.uint64(board))
+        sim.step(np.repeat(first_moves, self.rollouts))
+        for _ in range(self.depth - 1):
+            if not sim.valid_moves.any():
+                break
+            sim.step(self.__rollout_actions(sim))
+        totals = np.zeros(4)
+        totals[legal] = sim.scores.reshape(-1, self.rollouts).sum(axis=1)
+        return totals
+
+    def __simulator(self, legal_moves: int) -> BatchSimulator:
+        """
+        Returns the simulator holding rollouts boards for each of legal_moves moves
+        """
+        sim = self.sims.get(legal_moves)
+        if sim is None:
+            seed = int(self.seed_sequence.spawn(1)[0].generate_state(1)[0])
+            sim = BatchSimulator(legal_moves * self.rollouts, self.look_up_table, seed)
+            self.sims[legal_moves] = sim
+        return sim
+
+    def __rollout_actions(self, sim: BatchSimulator) -> NDArray[np.uint8]:
+        """
+        Returns the next move of every rollout of sim, NOMOVE for the ones that ended
+        """
+        if self.policy is not None:
+            actions = self.policy.select_actions_batch(
+                sim.get_boards(), 0, sim.valid_moves
+            )
+        else:
+            masks = VALID_ACTION_MASKS[sim.valid_moves]
+            keys = np.where(masks, sim.rng.random(masks.shape), -1.0)
+            actions = (1 << np.argmax(keys, axis=1)).astype(np.uint8)
+        actions[sim.valid_moves == Move.NOMOVE.value] = Move.NOMOVE.value
+        return actions
@@ -1,10 +1,23 @@
+import hashlib
+import json
+import os
 import random
 from enum import Enum
-from typing import Tuple
+from typing import Dict, Tuple
 
 import numpy as np
 from numpy.typing import NDArray
 
+from src.board import afterstates, reverse_boards, rows_to_columns, transpose_boards
+from src.codec import (
+    CELL_SHIFTS,
+    row_indices,
+    rows_to_boards,
+    unpack_boards,
+    unpack_rows,
+)
+from src.reward import RewardSpec
+
 
 class Move(Enum):
     NOMOVE = 0b00000000
@@ -14,56 +27,220 @@ class Move(Enum):
     DOWN = 0b00001000
 
 
+LOOKUP_TABLE_VERSION = 3
+LOOKUP_TABLE_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, "cache"
+)
+
+
 class LookupTable:
     """
     Generates a look up table for 2048, pre-computing all moves left and their score increases
+    Right moves are stored per row, up and down moves as column tables that place the moved
+    column straight into column 0 of a packed board
+    Per-row features (legality, empty cells, max tile) answer board queries in four lookups per table
+    The table is cached on disk and memory-mapped, so every process shares the same physical pages
     """
 
-    def __init__(self):
-        move_count = 16**4
-        self.moves = np.zeros(move_count, dtype=np.uint16)
-        self.scores = np.zeros(move_count, dtype=int)
-        self.monotonicity = np.zeros(move_count, dtype=float)
-        for i in np.arange(move_count, dtype=np.uint16):
-            self.moves[i], self.scores[i], self.monotonicity[i] = self.__shift_row_left(
-                i
-            )
+    # Each tile can have 16 different values, 4 tiles per row = 65536 rows
+    MOVE_COUNT = 16**4
+    COLUMNS = {
+        "moves": np.uint16,
+        "scores": np.int64,
+        "monotonicity": np.float64,
+        "moves_right": np.uint16,
+        "scores_right": np.int64,
+        "col_up": np.uint64,
+        "col_down": np.uint64,
+        "can_move_left": np.bool_,
+        "can_move_right": np.bool_,
+        "empty_count": np.uint8,
+        "empty_mask": np.uint8,  # bit i set when cell i is empty, first cell in the LSB
+        "max_tile": np.uint8,
+    }
+
+    def __init__(self, cache_dir: str | None = LOOKUP_TABLE_CACHE_DIR):
+        """
+        cache_dir: directory holding the versioned table cache, None builds the table in memory only
+        """
+        columns = None
+        if cache_dir is not None:
+            path = os.path.join(cache_dir, f"look_up_table_v{LOOKUP_TABLE_VERSION}")
+            try:
+                columns = self.load_cache(path)
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError) as e:
+                print(f"Rebuilding look up table cache: {e}")
+        if columns is None:
+            columns = self.__generate()
+            if cache_dir is not None:
+                try:
+                    self.__save_cache(path, columns)
+                    columns = self.load_cache(path)
+                except OSError as e:
+                    print(f"Could not cache look up table: {e}")
+        self.moves: NDArray[np.uint16] = columns["moves"]
+        self.scores: NDArray[np.int64] = columns["scores"]
+        self.monotonicity: NDArray[np.float64] = columns["monotonicity"]
+        self.moves_right: NDArray[np.uint16] = columns["moves_right"]
+        self.scores_right: NDArray[np.int64] = columns["scores_right"]
+        self.col_up: NDArray[np.uint64] = columns["col_up"]
+        self.col_down: NDArray[np.uint64] = columns["col_down"]
+        self.can_move_left: NDArray[np.bool_] = columns["can_move_left"]
+        self.can_move_right: NDArray[np.bool_] = columns["can_move_right"]
+        self.empty_count: NDArray[np.uint8] = columns["empty_count"]
+        self.empty_mask: NDArray[np.uint8] = columns["empty_mask"]
+        self.max_tile: NDArray[np.uint8] = columns["max_tile"]
+
+    def valid_moves(self, boards: NDArray[np.uint64]) -> NDArray[np.uint8]:
+        """
+        boards: np.ndarray of shape (N,), dtype=np.uint64
+        Returns the valid Move bitflags of every board, NOMOVE once the game is over
+        """
+        left, right = self.can_move_left, self.can_move_right
+        r0, r1, r2, r3 = row_indices(boards).T
+        c0, c1, c2, c3 = row_indices(
+            transpose_boards(np.asarray(boards, dtype=np.uint64))
+        ).T
+        moves = (left[r0] | left[r1] | left[r2] | left[r3]).astype(np.uint8)
+        moves |= (right[r0] | right[r1] | right[r2] | right[r3]) << np.uint8(1)
+        moves |= (left[c0] | left[c1] | left[c2] | left[c3]) << np.uint8(2)
+        moves |= (right[c0] | right[c1] | right[c2] | right[c3]) << np.uint8(3)
+        return moves
 
-    def __shift_row_left(self, row: np.uint16) -> Tuple[np.uint16, int]:
-        r = np.array(
-            [(row >> 12) & 0xF, (row >> 8) & 0xF, (row >> 4) & 0xF, (row >> 0) & 0xF],
-            dtype=np.uint8,
+    def empty_cells(self, boards: NDArray[np.uint64]) -> NDArray[np.uint8]:
+        """
+        boards: np.ndarray of shape (N,), dtype=np.uint64
+        Returns the number of empty cells of every board
+        """
+        r0, r1, r2, r3 = row_indices(boards).T
+        empty = self.empty_count
+        return empty[r0] + empty[r1] + empty[r2] + empty[r3]
+
+    def max_tiles(self, boards: NDArray[np.uint64]) -> NDArray[np.uint8]:
+        """
+        boards: np.ndarray of shape (N,), dtype=np.uint64
+        Returns the log2 value of the largest tile of every board
+        """
+        r0, r1, r2, r3 = row_indices(boards).T
+        largest = self.max_tile
+        return np.maximum(
+            np.maximum(largest[r0], largest[r1]), np.maximum(largest[r2], largest[r3])
         )
-        diff = np.diff(r)
-        monotonicity = 1.0 if (np.all(diff >= 0) or np.all(diff <= 0)) else 0.0
-        nz = r[r != 0]
-        compact = np.zeros(4, np.uint8)
-        compact[: len(nz)] = nz
-        r = compact
 
-        score = 0
-        merged = np.zeros(4, np.bool_)
+    @classmethod
+    def load_cache(cls, path: str) -> Dict[str, np.ndarray]:
+        """
+        path: directory of a versioned table cache
+        Returns the read-only memory-mapped columns of the cache
+        Raises ValueError if the cache is stale or corrupt
+        """
+        with open(os.path.join(path, "manifest.json"), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") != LOOKUP_TABLE_VERSION:
+            raise ValueError(
+                f"stale cache version {manifest.get('version')}, expected {LOOKUP_TABLE_VERSION}"
+            )
+        columns = {}
+        for name, dtype in cls.COLUMNS.items():
+            column = np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            if column.dtype != dtype or column.shape != (cls.MOVE_COUNT,):
+                raise ValueError(f"column {name} has the wrong dtype or shape")
+            if hashlib.sha256(column).hexdigest() != manifest["sha256"].get(name):
+                raise ValueError(f"column {name} does not match its checksum")
+            columns[name] = np.asarray(column)
+        return columns
+
+    def __save_cache(self, path: str, columns: Dict[str, np.ndarray]) -> None:
+        """
+        Writes every column to the cache, the manifest is written last so a partial cache never validates
+        Files are renamed into place so concurrent processes never read a half written file
+        """
+        os.makedirs(path, exist_ok=True)
+        manifest = {"version": LOOKUP_TABLE_VERSION, "sha256": {}}
+        for name, column in columns.items():
+            tmp = os.path.join(path, f"{name}.npy.{os.getpid()}.tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, column)
+            os.replace(tmp, os.path.join(path, f"{name}.npy"))
+            manifest["sha256"][name] = hashlib.sha256(column).hexdigest()
+        tmp = os.path.join(path, f"manifest.json.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, os.path.join(path, "manifest.json"))
+
+    def __generate(self) -> Dict[str, np.ndarray]:
+        """
+        Shifts every possible row left at once, returns the table columns
+        """
+        rows = np.arange(self.MOVE_COUNT, dtype=np.uint32)
+        r = ((rows[:, None] >> np.array([12, 8, 4, 0])) & 0xF).astype(np.uint8)
+        empty = r == 0
+        max_tile = r.max(axis=1)
+
+        diff = np.diff(r.astype(np.int8), axis=1)
+        monotonicity = (np.all(diff >= 0, axis=1) | np.all(diff <= 0, axis=1)).astype(
+            np.float64
+        )
 
+        r = self.__compact_rows(r)
+        score = np.zeros(self.MOVE_COUNT, dtype=np.int64)
+        merged = np.zeros((self.MOVE_COUNT, 4), dtype=np.bool_)
         for i in range(1, 4):
-            if r[i] != 0 and r[i] == r[i - 1] and not merged[i - 1]:
-                r[i - 1] += 1
-                r[i] = 0
-                merged[i - 1] = True
-                score += 1 << int(r[i - 1])
-
-        nz = r[r != 0]
-        r2 = np.zeros(4, np.uint8)
-        r2[: len(nz)] = nz
-        r = r2
-
-        new_row = (
-            (r[0].astype(np.uint16) << 12)
-            | (r[1].astype(np.uint16) << 8)
-            | (r[2].astype(np.uint16) << 4)
-            | (r[3].astype(np.uint16) << 0)
+            merge = (r[:, i] != 0) & (r[:, i] == r[:, i - 1]) & ~merged[:, i - 1]
+            r[merge, i - 1] += 1
+            r[merge, i] = 0
+            merged[merge, i - 1] = True
+            score[merge] += np.int64(1) << r[merge, i - 1].astype(np.int64)
+        r = self.__compact_rows(r).astype(np.uint16)
+
+        moves = (r[:, 0] << 12) | (r[:, 1] << 8) | (r[:, 2] << 4) | (r[:, 3] << 0)
+
+        reversed_rows = reverse_boards(rows.astype(np.uint64)).astype(np.uint16)
+        moves_right = reverse_boards(moves[reversed_rows].astype(np.uint64)).astype(
+            np.uint16
         )
-
-        return new_row, int(score), monotonicity
+        return {
+            "moves": moves,
+            "scores": score,
+            "monotonicity": monotonicity,
+            "moves_right": moves_right,
+            "scores_right": score[reversed_rows],
+            "col_up": rows_to_columns(moves),
+            "col_down": rows_to_columns(moves_right),
+            "can_move_left": moves != rows,
+            "can_move_right": moves_right != rows,
+            "empty_count": empty.sum(axis=1, dtype=np.uint8),
+            "empty_mask": (empty << np.arange(4, dtype=np.uint8)).sum(
+                axis=1, dtype=np.uint8
+            ),
+            "max_tile": max_tile,
+        }
+
+    def __compact_rows(self, r: NDArray[np.uint8]) -> NDArray[np.uint8]:
+        """
+        r: np.ndarray of shape (N, 4) of unpacked rows
+        Returns the rows with every non-empty tile moved to the front, keeping their order
+        """
+        order = np.argsort(r == 0, axis=1, kind="stable")
+        return np.take_along_axis(r, order, axis=1)
+
+
+# Move bitflags indexed by direction, in the same order as the Move enum bits
+MOVE_FLAGS = np.array(
+    [Move.LEFT.value, Move.RIGHT.value, Move.UP.value, Move.DOWN.value], dtype=np.uint8
+)
+# Move bitflag -> direction index into MOVE_FLAGS, 0 for anything that is not a single direction
+MOVE_DIRECTIONS = np.zeros(256, dtype=np.intp)
+MOVE_DIRECTIONS[MOVE_FLAGS] = np.arange(4)
+# Valid move bitflags (LEFT, RIGHT, UP, DOWN from the LSB) -> boolean mask over the move directions
+VALID_ACTION_MASKS = ((np.arange(16)[:, None] >> np.arange(4)) & 1).astype(np.bool_)
+# Row empty_mask, k -> column of the k-th empty cell of the row, 0 past the last one
+NTH_EMPTY_CELL = np.array(
+    [([c for c in range(4) if mask >> c & 1] + [0] * 4)[:4] for mask in range(16)],
+    dtype=np.intp,
+)
 
 
 class Simulator:
@@ -71,9 +248,15 @@ class Simulator:
     Python-based 2048 simulator
     """
 
-    def __init__(self, idx: int, look_up_table: LookupTable):
+    def __init__(
+        self,
+        idx: int,
+        look_up_table: LookupTable,
+        reward_spec: RewardSpec | None = None,
+    ):
         self.idx = idx
         self.look_up_table = look_up_table
+        self.reward_kernel = (reward_spec or RewardSpec()).compile()
         self.prev_board = np.zeros(4, dtype=np.uint16)
         self.board = np.zeros(4, dtype=np.uint16)
         self.prev_score = 0
@@ -256,18 +439,18 @@ class Simulator:
         board: np.ndarray of shape (4,), dtype=np.uint16
         Selects an empty cell at random and sets it to 1 90% of the time and 2 10% of the time
         """
-        tiles = self.__unpack_board(board)
-        empty_mask = tiles == 0
-        empty_indices = np.flatnonzero(empty_mask)
-        count = empty_indices.size
+        counts = self.look_up_table.empty_count[board]
+        count = int(counts.sum())
         if count == 0:
             return
 
+        # walk the rows to the one holding the idx-th empty cell, cells are counted row-major
         idx = self.rng.randrange(count)
-        flat_pos = empty_indices[idx]
-
-        row = flat_pos // 4
-        col = flat_pos % 4
+        row = 0
+        while idx >= counts[row]:
+            idx -= int(counts[row])
+            row += 1
+        col = NTH_EMPTY_CELL[self.look_up_table.empty_mask[board[row]], idx]
 
         # NOTE: Varying the rng for tile spawn, randomly, to avoid overfitting to fixed spawn rates
         val = 2 if self.rng.random() < 0.88 + 0.04 * self.rng.random() else 4
@@ -278,77 +461,173 @@ class Simulator:
     def __unpack_board(self, board: NDArray[np.uint16]) -> NDArray[np.uint32]:
         """
         board: np.ndarray of shape (4,), dtype=np.uint16
-        Returns the unpacked form of a bit-packed board as a np.ndarray of shape (16,), dtype=np.uint8
+        Returns the unpacked form of a bit-packed board as a np.ndarray of shape (16,), dtype=np.uint32
         """
-        shifts = np.array([12, 8, 4, 0], dtype=np.uint16)  # bits per tile
-        unpacked = (board[:, None] >> shifts[None, :]) & 0xF  # shape (4,4)
-        return unpacked.ravel().astype(np.uint32)  # flatten to shape (16,)
+        return unpack_rows(board).astype(np.uint32)
 
     def __pack_board(self, board: NDArray[np.uint16]) -> np.uint64:
-        arr64 = board.astype(np.uint64)
-        return (arr64[0] << 48) | (arr64[1] << 32) | (arr64[2] << 16) | arr64[3]
+        return rows_to_boards(board)
 
     def __get_reward(self, current_board: NDArray[np.uint16]):
         """
         board: np.ndarray of shape (4,), dtype=np.uint16
-        Returns a reward value based on the current and previous board state
-        Currently values: score delta, empty tiles, largest tile, largest tile is in a corner
-        """
-        cells = self.__unpack_board(current_board)
-        empty_count = np.count_nonzero(cells == 0)
-        max_val = np.max(cells)
-
-        m_scale = 0.2  # scalar for max tile reward
-        c_scale = 0.1  # scalar for corner heuristic
-        e_scale = 0.1  # scalar for empty reward
-        t_scale = 5.0  # scalar for terminal states
-
-        reward = np.log2(1 + (self.score - self.prev_score))
-        reward += m_scale * np.log2(max_val)
-        reward += (
-            c_scale if np.any(max_val == cells[i] for i in [0, 3, 12, 15]) else 0.0
-        )
-        reward += e_scale * empty_count
-
-        if self.is_terminated:
-            reward -= t_scale
-        return reward
+        Returns the reward of the move from the previous board to current_board, see RewardSpec
+        """
+        return self.reward_kernel(
+            rows_to_boards(current_board[None]),
+            np.array([self.score - self.prev_score]),
+            np.array([self.is_terminated]),
+        )[0]
 
     def __get_valid_moves(self, board: np.ndarray) -> int:
         """
         board: shape (4,), dtype uint16
         Returns a bitpacking representing valid moves for a given board
         """
-        rev = self.__reverse_board(board)
         trans = self.__transpose_board(board)
 
-        left = self.__row_can_move_left(board).any()
-        right = self.__row_can_move_left(rev).any()
-        up = self.__row_can_move_left(trans).any()
-        down = self.__row_can_move_left(self.__reverse_board(trans)).any()
+        left = self.look_up_table.can_move_left[board].any()
+        right = self.look_up_table.can_move_right[board].any()
+        up = self.look_up_table.can_move_left[trans].any()
+        down = self.look_up_table.can_move_right[trans].any()
 
         moves = (left << 0) | (right << 1) | (up << 2) | (down << 3)
-        return moves
+        return int(moves)
+
+
+class BatchSimulator:
+    """
+    Vectorized 2048 simulator, steps every board of the batch at once
+    Boards are stored as a single np.ndarray of packed 64-bit boards, 4 bits per cell, row 0 first
+    """
+
+    def __init__(
+        self,
+        num_envs: int,
+        look_up_table: LookupTable,
+        seed: int | None = None,
+        reward_spec: RewardSpec | None = None,
+    ):
+        self.num_envs = num_envs
+        self.look_up_table = look_up_table
+        self.reward_kernel = (reward_spec or RewardSpec()).compile()
+        self.rng = np.random.default_rng(seed)
+        self.boards = np.zeros(num_envs, dtype=np.uint64)
+        self.prev_boards = np.zeros(num_envs, dtype=np.uint64)
+        self.scores = np.zeros(num_envs, dtype=np.int64)
+        self.prev_scores = np.zeros(num_envs, dtype=np.int64)
+        self.move_counts = np.zeros(num_envs, dtype=np.uint32)
+        self.rewards = np.zeros(num_envs, dtype=np.float64)
+        self.valid_moves = np.zeros(num_envs, dtype=np.uint8)
+        self.is_terminated = np.zeros(num_envs, dtype=np.bool_)
+        # afterstates of the current boards for every direction, cached between steps
+        self.afterstates = np.zeros((num_envs, 4), dtype=np.uint64)
+        self.afterstate_scores = np.zeros((num_envs, 4), dtype=np.int64)
+        self.reset()
 
-    def __row_can_move_left(self, row: NDArray[np.uint16]) -> NDArray[np.bool_]:
+    def step(self, actions: NDArray[np.uint8]) -> None:
+        """
+        actions: np.ndarray of shape (N,) of Move bitflags, one per environment
+        Applies every move, spawns a random tile on every moved board and updates the valid moves,
+        rewards and terminated flags. NOMOVE and moves that are not valid on their board leave it untouched.
+        Only the boards that move are gathered and recomputed, the reward is recomputed for all of them
+        """
+        actions = np.asarray(actions, dtype=np.uint8)
+        if np.any(actions & (actions - 1)) or np.any(actions > 0b1000):
+            raise ValueError("Actions must be a single Move bitflag")
+        self.prev_boards[:] = self.boards
+        self.prev_scores[:] = self.scores
+
+        acting = np.flatnonzero(actions & self.valid_moves)
+        direction = MOVE_DIRECTIONS[actions[acting]]
+        self.boards[acting] = self.afterstates[acting, direction]
+        self.scores[acting] += self.afterstate_scores[acting, direction]
+        self.move_counts[acting] += 1
+
+        self.__populate_random_cells(acting)
+        self.__update_valid_moves(acting)
+        self.is_terminated[acting] = self.valid_moves[acting] == Move.NOMOVE.value
+        self.rewards[:] = self.reward_kernel(
+            self.boards, self.scores - self.prev_scores, self.is_terminated
+        )
+
+    def reset(self, mask: NDArray[np.bool_] | None = None) -> None:
+        """
+        mask: optional np.ndarray of shape (N,), dtype=np.bool_, selecting boards to reset, defaults to all
+        Resets the selected boards to an initial state
+        """
+        if mask is None:
+            mask = np.ones(self.num_envs, dtype=np.bool_)
+        self.boards[mask] = 0
+        self.scores[mask] = 0
+        self.prev_scores[mask] = 0
+        self.move_counts[mask] = 0
+        self.is_terminated[mask] = False
+        self.__populate_random_cells(mask)
+        self.__populate_random_cells(mask)
+        self.prev_boards[mask] = self.boards[mask]
+        self.__update_valid_moves(mask)
+
+    def set_boards(
+        self, boards: NDArray[np.uint64], mask: NDArray[np.bool_] | None = None
+    ) -> None:
+        """
+        boards: packed boards, one per selected board or a single board for all of them
+        mask: optional np.ndarray of shape (N,), dtype=np.bool_, selecting boards to replace, defaults to all
+        Starts the selected games from the given boards, with their scores and move counts back at 0
+        """
+        if mask is None:
+            mask = np.ones(self.num_envs, dtype=np.bool_)
+        self.boards[mask] = boards
+        self.prev_boards[mask] = self.boards[mask]
+        self.scores[mask] = 0
+        self.prev_scores[mask] = 0
+        self.move_counts[mask] = 0
+        self.__update_valid_moves(mask)
+        self.is_terminated[mask] = self.valid_moves[mask] == Move.NOMOVE.value
+
+    def get_boards(self, packed=False) -> np.ndarray:
+        """
+        Returns the current boards as either packed 64-bit boards or unpacked arrays of shape (N, 16)
+        """
+        if packed:
+            return self.boards
+        return unpack_boards(self.boards)
+
+    def __update_valid_moves(self, mask: NDArray[np.bool_] | NDArray[np.intp]) -> None:
         """
-        row: uint16 or ndarray of shape (...) containing uint16 bitpacked rows.
-        Returns boolean array of the same shape indicating whether each row
-        has a valid left move.
+        mask: np.ndarray of shape (N,), dtype=np.bool_, or the indices of the selected boards
+        Recomputes the cached afterstates and the valid move bitflags of the selected boards
         """
-        row = row.astype(np.uint16)
+        moved, scores, legal = afterstates(self.boards[mask], self.look_up_table)
+        self.afterstates[mask] = moved
+        self.afterstate_scores[mask] = scores
+        self.valid_moves[mask] = (legal * MOVE_FLAGS).sum(axis=1, dtype=np.uint8)
 
-        t0 = (row >> 12) & 0xF
-        t1 = (row >> 8) & 0xF
-        t2 = (row >> 4) & 0xF
-        t3 = (row >> 0) & 0xF
+    def __populate_random_cells(
+        self, mask: NDArray[np.bool_] | NDArray[np.intp]
+    ) -> None:
+        """
+        mask: np.ndarray of shape (N,), dtype=np.bool_, or the indices of the selected boards
+        Selects an empty cell at random on every selected board and sets it to 1 90% of the time and 2 10% of the time
+        """
+        boards = self.boards[mask]
+        rows = row_indices(boards)
+        counts = self.look_up_table.empty_count[rows]
+        ends = counts.cumsum(axis=1, dtype=np.intp)
+        has_empty = ends[:, 3] > 0
 
-        c0 = (t0 == 0) & ((t1 | t2 | t3) != 0)
-        c1 = (t1 == 0) & ((t2 | t3) != 0)
-        c2 = (t2 == 0) & (t3 != 0)
+        # a uniform pick among the empty cells, counted row-major, then located through the row tables
+        nth = (self.rng.random(boards.size) * ends[:, 3]).astype(np.intp)
+        row = np.minimum((nth[:, None] >= ends).sum(axis=1), 3)
+        picked = np.arange(boards.size)
+        nth -= ends[picked, row] - counts[picked, row]
+        col = NTH_EMPTY_CELL[self.look_up_table.empty_mask[rows[picked, row]], nth]
 
-        m0 = (t0 != 0) & (t0 == t1)
-        m1 = (t1 != 0) & (t1 == t2)
-        m2 = (t2 != 0) & (t2 == t3)
+        # NOTE: Varying the rng for tile spawn, randomly, to avoid overfitting to fixed spawn rates
+        rolls = self.rng.random((2, boards.size))
+        val = np.where(rolls[0] < 0.88 + 0.04 * rolls[1], 1, 2).astype(np.uint64)
 
-        return c0 | c1 | c2 | m0 | m1 | m2
+        shifts = CELL_SHIFTS[4 * row + col]
+        boards[has_empty] |= val[has_empty] << shifts[has_empty]
+        self.boards[mask] = boards
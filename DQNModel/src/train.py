@@ -1,10 +1,13 @@
+import queue
+import threading
 from time import time
 
 import numpy as np
 
-from src.agent import DQNAgent
-from src.env_manager import CPPEnvManager, PyEnvManager
-from src.utils import unpack_64bit_state
+from src.dqn_agent import DQNAgent
+from src.codec import unpack_boards
+from src.env_manager import CPPEnvManager, EpisodeStats, PyEnvManager, StepBuffers
+from src.sim import Move
 
 
 def train_dqn(
@@ -15,69 +18,109 @@ def train_dqn(
     episode_count=float("inf"),
     save_every=1000,
     file_name="model",
+    log_every=100,
 ):
+    """
+    Trains on the C++ environments, every poll handles all ready messages at once:
+    one vectorized unpack, one batched forward pass for the envs awaiting a move and one bulk replay buffer insert
+    Finished episodes are recorded in an EpisodeStats with the scores the C++ simulators kept
+    """
     num_envs = env_manager.num_envs
 
     episode = 0
+    stats = EpisodeStats()
+    move_counts = np.zeros(num_envs, dtype=np.int64)
     start = time()
     step_count = 0
+    update_target = num_envs * update_every
+    save_target = save_every
     env_manager.reset_all()  # reset all environments at episode start
     # Load initial states and set up some book-keeping structures
     states = env_manager.get_initial_states()
-    needs_action = [True] * num_envs  # used to prevent reprocessing states
-    actions = [-1] * num_envs
+    boards = states["board"].copy()  # latest packed board of every env
+    moves = states["moves"].copy()
+    scores = states["score"].copy()
+    needs_action = np.ones(
+        num_envs, dtype=np.bool_
+    )  # used to prevent reprocessing states
+    actions = np.full(num_envs, -1, dtype=np.int32)
     while episode < episode_count:
-        step_count += num_envs
-        for i in np.arange(num_envs):
-            if needs_action[i]:
-                state = states[i]
-                action = agent.select_action(
-                    unpack_64bit_state(state["board"]), epsilon, state["moves"]
-                )
-                actions[states[i]["id"]] = action
-                needs_action[i] = False  # mark that state as processed
+        pending = np.flatnonzero(needs_action)
+        if pending.size > 0:
+            chosen = agent.select_actions_batch(
+                unpack_boards(boards[pending]), epsilon, moves[pending]
+            ).astype(np.int32)
+            chosen[chosen == Move.NOMOVE.value] = 0b00010000  # game ended, restart
+            actions[pending] = chosen
+            needs_action[pending] = False  # mark those states as processed
 
         env_manager.write_actions(actions)
 
         results = (
             env_manager.poll_results()
-        )  # returns list of (env_idx, next_state, reward, done, is_fresh)
-
-        for result in results:
-            env_idx, next_state, valid_moves, reward = result
-            action = -actions[env_idx]  # sent actions will be negated by write_actions
-            if action != 0b00010000:  # skip terminal states
-                agent.replay_buffer.add(
-                    unpack_64bit_state(states[env_idx]["board"]),
-                    action,
-                    reward,
-                    unpack_64bit_state(next_state),
-                    valid_moves == 0b00010000,
-                )
-            else:
-                episode += 1
-                print(f"episode: {episode}")
-            states[env_idx] = result
-            needs_action[env_idx] = True  # mark this env as needing an action
+        )  # every new (env_idx, board, moves, reward)
+        if len(results) == 0:
+            continue
 
-        if step_count % update_every * num_envs == 0:
+        env_ids = results["id"]
+        sent = -actions[env_ids]  # sent actions are negated by write_actions
+        live = sent != 0b00010000  # skip terminal states
+        if np.any(live):
+            agent.replay_buffer.add_batch(
+                unpack_boards(boards[env_ids[live]]),
+                sent[live],
+                results["reward"][live],
+                unpack_boards(results["board"][live]),
+                results["moves"][live] == 0b00010000,
+            )
+        move_counts[env_ids[live]] += 1
+        ended = env_ids[~live]
+        if ended.size > 0:
+            cells = unpack_boards(boards[ended])
+            stats.record(scores[ended], move_counts[ended], cells.max(axis=1))
+            move_counts[ended] = 0
+            episode = log_episodes(stats, episode, log_every)
+        boards[env_ids] = results["board"]
+        moves[env_ids] = results["moves"]
+        scores[env_ids] = results["score"]
+        needs_action[env_ids] = True  # mark these envs as needing an action
+
+        step_count += len(results)
+        if step_count >= update_target:
+            update_target += num_envs * update_every
             agent.update()
 
         if step_count >= num_envs * 1000:
             step_count = 0
+            update_target = num_envs * update_every
             agent.sync_target_network()
 
-        if episode % save_every == 0:
+        if episode >= save_target:
             q_net_filename = f"saved_models/{file_name}_policy_{episode}.weights.h5"
             target_net_filename = (
                 f"saved_models/{file_name}_target_{episode}.weights.h5"
             )
             agent.q_network.save_weights(q_net_filename)
             agent.target_network.save_weights(target_net_filename)
+            save_target += save_every
     end = time()
     print(f"{end-start}s to run {episode_count} episodes")
 
 
+def log_episodes(stats: EpisodeStats, logged: int, log_every: int) -> int:
+    """
+    Prints a summary of the recent episodes each time another log_every episodes finished
+    Returns the new episode count
+    """
+    if stats.count // log_every > logged // log_every:
+        summary = stats.summary()
+        print(
+            f"episodes: {summary['episodes']}, mean score: {summary['mean_score']:.1f}, "
+            f"mean length: {summary['mean_length']:.1f}, max tile: {summary['max_tile']}"
+        )
+    return stats.count
+
+
 def train_python_dqn(
     agent: DQNAgent,
     env_manager: PyEnvManager,
@@ -86,6 +129,7 @@ def train_python_dqn(
     episode_count=float("inf"),
     save_every=1000,
     file_name="model",
+    log_every=100,
 ):
     epsilon_end = 0.05
     epsilon_step_decay = 50_000_000
@@ -99,37 +143,20 @@ def train_python_dqn(
     gradient_updates = 0
     save_target = save_every
     num_envs = env_manager.num_envs
-    results = env_manager.reset_all()
-    states, valid_moves = results["state"], results["moves"]
+    buffers = StepBuffers(num_envs)  # filled in place by every step
+    env_manager.reset_all()
+    env_manager.poll_results(buffers)
     while episode < episode_count:
         actions = agent.select_actions_batch(
-            states, get_epsilon(total_steps), valid_moves
+            buffers.current_states, get_epsilon(total_steps), buffers.current_moves
         )
 
-        env_manager.write_actions(actions)
-        results = env_manager.poll_results()
-
-        for result in results:
-            env_idx, prev_state, reward, state, is_terminated, moves = (
-                result["id"],
-                result["prev_state"],
-                result["reward"],
-                result["state"],
-                result["is_terminated"],
-                result["moves"],
-            )
-            agent.replay_buffer.add(
-                prev_state, actions[env_idx], reward, state, is_terminated
-            )
-            if not is_terminated:
-                states[env_idx] = state
-                valid_moves[env_idx] = moves
-            else:
-                starting_state = env_manager.reset(env_idx)
-                states[env_idx] = starting_state[1]
-                valid_moves[env_idx] = starting_state[3]
-                episode += 1
-                print(f"episodes: {episode}")
+        # finished environments are reset inside step, current_states already holds their fresh games
+        env_manager.step(actions, buffers)
+        agent.replay_buffer.add_batch(
+            buffers.prev_states, actions, buffers.rewards, buffers.states, buffers.dones
+        )
+        episode = log_episodes(env_manager.stats, episode, log_every)
 
         if total_steps % (num_envs * update_every) == 0 and agent.update():
             gradient_updates += 1
@@ -145,5 +172,216 @@ def train_python_dqn(
             )
             agent.q_network.save_weights(q_net_filename)
             agent.target_network.save_weights(target_net_filename)
+            agent.replay_buffer.flush()
             save_target += save_every
         total_steps += num_envs
+
+
+class BatchPrefetcher:
+    """
+    Samples training batches on a background thread and stages them on the GPU ahead of the learner
+    The replay buffer is only touched while holding buffer_lock, which the actor shares for its writes
+    An exception raised while sampling is appended to errors and progress is notified before the thread exits
+    """
+
+    def __init__(
+        self,
+        agent: DQNAgent,
+        buffer_lock: threading.Lock,
+        depth: int = 4,
+        errors: list | None = None,
+        progress: threading.Condition | None = None,
+    ):
+        self.agent = agent
+        self.buffer_lock = buffer_lock
+        self.errors = errors if errors is not None else []
+        self.progress = progress if progress is not None else threading.Condition()
+        self.batches: queue.Queue = queue.Queue(maxsize=depth)
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.__run, daemon=True)
+        self.thread.start()
+
+    def get(self, timeout: float | None = None):
+        """
+        Returns the next (tensors, idxs) batch, raises queue.Empty on timeout
+        """
+        return self.batches.get(timeout=timeout)
+
+    def close(self) -> None:
+        self.stop_event.set()
+        self.thread.join()
+
+    def __run(self) -> None:
+        try:
+            while not self.stop_event.is_set():
+                with self.buffer_lock:
+                    ready = self.agent.replay_buffer.size >= self.agent.batch_size
+                    if ready:
+                        batch, idxs = self.agent.sample_batch()
+                if not ready:
+                    self.stop_event.wait(0.01)
+                    continue
+                staged = (self.agent.stage_batch(batch), idxs)
+                while not self.stop_event.is_set():
+                    try:
+                        self.batches.put(staged, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+        except BaseException as e:
+            self.errors.append(e)
+            with self.progress:
+                self.progress.notify_all()
+
+
+def train_python_dqn_pipelined(
+    agent: DQNAgent,
+    env_manager: PyEnvManager,
+    epsilon: float,
+    update_every=2,
+    replay_ratio: float | None = None,
+    max_staleness=8,
+    prefetch_depth=4,
+    episode_count=float("inf"),
+    save_every=1000,
+    file_name="model",
+    log_every=100,
+):
+    """
+    Same training loop as train_python_dqn, but gradient updates run on a learner thread fed by a BatchPrefetcher
+    while this thread keeps stepping the environments
+    replay_ratio is the target number of sampled transitions per environment transition, defaults to the
+    ratio train_python_dqn runs at (batch_size / (num_envs * update_every))
+    max_staleness is how many gradient updates the learner may fall behind that target before the actor waits for it,
+    the learner in turn waits whenever it is ahead of the target
+    """
+    epsilon_end = 0.05
+    epsilon_step_decay = 50_000_000
+
+    def get_epsilon(step):
+        eps = max(epsilon_end, epsilon - step / epsilon_step_decay)
+        return eps
+
+    num_envs = env_manager.num_envs
+    if replay_ratio is None:
+        replay_ratio = agent.batch_size / (num_envs * update_every)
+
+    buffer_lock = threading.Lock()
+    model_lock = threading.Lock()
+    progress = threading.Condition()
+    stop_event = threading.Event()
+    learner_errors = []  # exceptions raised on the learner or prefetcher threads
+    # steps taken once the buffer holds a full batch, updates are only owed from then on
+    counters = {"learn_steps": 0, "updates": 0}
+
+    def owed_updates():
+        return replay_ratio * counters["learn_steps"] / agent.batch_size
+
+    def learner():
+        try:
+            gradient_updates = 0
+            while not stop_event.is_set():
+                with progress:
+                    if not progress.wait_for(
+                        lambda: stop_event.is_set()
+                        or counters["updates"] < owed_updates(),
+                        timeout=0.1,
+                    ):
+                        continue
+                if stop_event.is_set():
+                    break
+                try:
+                    tensors, idxs = prefetcher.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                with model_lock:
+                    td_errors = agent.apply_batch(tensors)
+                    gradient_updates += 1
+                    if gradient_updates >= 50000:
+                        agent.sync_target_network()
+                        gradient_updates = 0
+                if idxs is not None:
+                    with buffer_lock:
+                        agent.replay_buffer.update_priorities(idxs, td_errors.numpy())
+                with progress:
+                    counters["updates"] += 1
+                    progress.notify_all()
+        except BaseException as e:
+            learner_errors.append(e)
+            with progress:
+                progress.notify_all()
+
+    prefetcher = BatchPrefetcher(
+        agent, buffer_lock, prefetch_depth, learner_errors, progress
+    )
+    learner_thread = threading.Thread(target=learner, daemon=True)
+    learner_thread.start()
+
+    def workers_alive():
+        return learner_thread.is_alive() and prefetcher.thread.is_alive()
+
+    episode = 0
+    total_steps = 0
+    save_target = save_every
+    buffers = StepBuffers(num_envs)  # filled in place by every step
+    env_manager.reset_all()
+    env_manager.poll_results(buffers)
+    try:
+        while episode < episode_count:
+            with progress:
+                # the timeout re-checks liveness in case a thread died without notifying
+                while not progress.wait_for(
+                    lambda: learner_errors
+                    or not workers_alive()
+                    or owed_updates() - counters["updates"] <= max_staleness,
+                    timeout=0.1,
+                ):
+                    pass
+            if learner_errors:
+                raise learner_errors[0]
+            if not workers_alive():
+                raise RuntimeError("learner or prefetcher thread exited unexpectedly")
+
+            actions = agent.select_actions_batch(
+                buffers.current_states, get_epsilon(total_steps), buffers.current_moves
+            )
+
+            env_manager.step(actions, buffers)
+
+            with buffer_lock:
+                agent.replay_buffer.add_batch(
+                    buffers.prev_states,
+                    actions,
+                    buffers.rewards,
+                    buffers.states,
+                    buffers.dones,
+                )
+                learning = agent.replay_buffer.size >= agent.batch_size
+            episode = log_episodes(env_manager.stats, episode, log_every)
+
+            if learning:
+                with progress:
+                    counters["learn_steps"] += num_envs
+                    progress.notify_all()
+
+            if total_steps >= save_target:
+                q_net_filename = (
+                    f"saved_models/{file_name}_{total_steps}_policy.weights.h5"
+                )
+                target_net_filename = (
+                    f"saved_models/{file_name}_{total_steps}_target.weights.h5"
+                )
+                with model_lock:
+                    agent.q_network.save_weights(q_net_filename)
+                    agent.target_network.save_weights(target_net_filename)
+                with buffer_lock:
+                    agent.replay_buffer.flush()
+                save_target += save_every
+            total_steps += num_envs
+    finally:
+        stop_event.set()
+        with progress:
+            progress.notify_all()
+        learner_thread.join()
+        prefetcher.close()
+    print(f"{counters['updates']} gradient updates over {total_steps} steps")
@@ -1,9 +1,12 @@
 import numpy as np
 
+from src.codec import lsb_first_to_boards, unpack_boards
+
 
 def unpack_64bit_state(packed_state: int) -> np.ndarray:
-    packed_state = int(packed_state)
-    unpacked = np.array(
-        [(packed_state >> 4 * i) & 0xF for i in range(16)], dtype=np.int8
-    )
-    return unpacked
+    """
+    Unpacks a single board in the lsb first layout (cell i at bit 4i), see src.codec for the layouts
+    Boards packed by the simulators are most significant cell first, use src.codec.unpack_boards for those
+    """
+    packed = lsb_first_to_boards(np.uint64(int(packed_state)))
+    return unpack_boards(packed).astype(np.int8)
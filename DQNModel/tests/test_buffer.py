@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from src.buffer import MemmapReplayBuffer, PackedReplayBuffer, ReplayBuffer
+
+NUM_LANES = 4
+CAPACITY = 64
+
+
+def random_boards(rng: np.random.Generator, n: int) -> np.ndarray:
+    return rng.integers(0, 12, (n, 16)).astype(np.float32)
+
+
+def fill(buffers, rng: np.random.Generator, steps: int) -> None:
+    """
+    Steps NUM_LANES fake environments that auto-reset, so every done transition is
+    followed in its lane by the first board of a new game
+    """
+    states = random_boards(rng, NUM_LANES)
+    for _ in range(steps):
+        actions = 1 << rng.integers(0, 4, NUM_LANES)
+        rewards = rng.random(NUM_LANES).astype(np.float32)
+        next_states = random_boards(rng, NUM_LANES)
+        dones = rng.random(NUM_LANES) < 0.2
+        for buffer in buffers:
+            buffer.add_batch(states, actions, rewards, next_states, dones)
+        states = np.where(dones[:, None], random_boards(rng, NUM_LANES), next_states)
+
+
+def assert_same_transitions(expected, actual) -> None:
+    for column, (want, got) in enumerate(zip(expected, actual)):
+        np.testing.assert_array_equal(
+            np.asarray(want, dtype=np.float64),
+            np.asarray(got, dtype=np.float64),
+            err_msg=f"column {column}",
+        )
+
+
+@pytest.fixture(params=["packed", "memmap"])
+def packed_buffer(request, tmp_path):
+    if request.param == "packed":
+        return PackedReplayBuffer(CAPACITY, (16,), NUM_LANES)
+    return MemmapReplayBuffer(str(tmp_path / "replay"), CAPACITY, (16,), NUM_LANES)
+
+
+@pytest.mark.parametrize("steps", [5, 40])
+def test_gather_matches_replay_buffer_across_episodes(packed_buffer, steps):
+    reference = ReplayBuffer(CAPACITY, (16,))
+    fill([reference, packed_buffer], np.random.default_rng(steps), steps)
+    assert packed_buffer.size == reference.size
+
+    idxs = np.arange(reference.size)
+    expected = reference.gather(idxs)
+    assert expected[4].any(), "no episode boundary was exercised"
+    assert_same_transitions(expected, packed_buffer.gather(idxs))
+
+
+def test_reopened_memmap_keeps_next_states(tmp_path):
+    path = str(tmp_path / "replay")
+    reference = ReplayBuffer(CAPACITY, (16,))
+    buffer = MemmapReplayBuffer(path, CAPACITY, (16,), NUM_LANES)
+    fill([reference, buffer], np.random.default_rng(0), 40)
+    buffer.flush()
+    del buffer
+
+    # reopening ends the unfinished trajectories but keeps their next states
+    reopened = MemmapReplayBuffer(path, CAPACITY, (16,), NUM_LANES)
+    idxs = np.arange(reference.size)
+    expected, actual = reference.gather(idxs), reopened.gather(idxs)
+    assert_same_transitions(expected[:4], actual[:4])
+    assert np.all(actual[4][expected[4]])
@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+
+from src.codec import (
+    boards_to_lsb_first,
+    boards_to_rows,
+    cells_to_tile_values,
+    log_values,
+    lsb_first_to_boards,
+    one_hot,
+    pack_boards,
+    row_indices,
+    rows_to_boards,
+    tile_values_to_cells,
+    unpack_boards,
+    unpack_boards_into,
+    unpack_rows,
+)
+
+# cells 0..15 hold 0, 1, ..., 15 so every nibble is distinct, cell (r, c) at bit 60 - 4(4r + c)
+KNOWN_CELLS = np.arange(16, dtype=np.uint8)
+KNOWN_BOARD = np.uint64(0x0123456789ABCDEF)
+KNOWN_ROWS = np.array([0x0123, 0x4567, 0x89AB, 0xCDEF], dtype=np.uint16)
+KNOWN_LSB_FIRST = np.uint64(0xFEDCBA9876543210)
+
+
+def random_cells(n: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 16, (n, 16)).astype(np.uint8)
+
+
+def test_known_board_layouts():
+    assert pack_boards(KNOWN_CELLS) == KNOWN_BOARD
+    np.testing.assert_array_equal(unpack_boards(KNOWN_BOARD), KNOWN_CELLS)
+    np.testing.assert_array_equal(boards_to_rows(KNOWN_BOARD), KNOWN_ROWS)
+    np.testing.assert_array_equal(row_indices(np.array([KNOWN_BOARD]))[0], KNOWN_ROWS)
+    assert rows_to_boards(KNOWN_ROWS) == KNOWN_BOARD
+    assert boards_to_lsb_first(KNOWN_BOARD) == KNOWN_LSB_FIRST
+    assert lsb_first_to_boards(KNOWN_LSB_FIRST) == KNOWN_BOARD
+
+
+def test_single_tile_position():
+    cells = np.zeros(16, dtype=np.uint8)
+    cells[6] = 3  # row 1, column 2
+    assert pack_boards(cells) == np.uint64(3) << np.uint64(60 - 4 * 6)
+    np.testing.assert_array_equal(boards_to_rows(pack_boards(cells)), [0, 0x0030, 0, 0])
+
+
+def test_packed_cells_round_trip():
+    cells = random_cells(1000)
+    boards = pack_boards(cells)
+    assert boards.shape == (1000,)
+    np.testing.assert_array_equal(unpack_boards(boards), cells)
+    np.testing.assert_array_equal(
+        unpack_boards(boards.reshape(10, 100)), cells.reshape(10, 100, 16)
+    )
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.float32])
+def test_unpack_boards_into(dtype):
+    cells = random_cells(257, seed=1)
+    out = np.full((257, 16), 99, dtype=dtype)
+    assert unpack_boards_into(pack_boards(cells), out) is out
+    np.testing.assert_array_equal(out, cells.astype(dtype))
+
+
+def test_packed_rows_round_trip():
+    cells = random_cells(1000, seed=2)
+    boards = pack_boards(cells)
+    rows = boards_to_rows(boards)
+    assert rows.dtype == np.uint16 and rows.shape == (1000, 4)
+    np.testing.assert_array_equal(rows, row_indices(boards))
+    np.testing.assert_array_equal(rows_to_boards(rows), boards)
+    np.testing.assert_array_equal(unpack_rows(rows), cells)
+
+
+def test_lsb_first_round_trip():
+    cells = random_cells(1000, seed=3)
+    boards = pack_boards(cells)
+    lsb_first = boards_to_lsb_first(boards)
+    # cell i at bit 4i
+    for i in (0, 5, 15):
+        np.testing.assert_array_equal(
+            (lsb_first >> np.uint64(4 * i)) & np.uint64(0xF), cells[:, i]
+        )
+    np.testing.assert_array_equal(lsb_first_to_boards(lsb_first), boards)
+
+
+def test_tile_values_round_trip():
+    cells = random_cells(1000, seed=4)
+    values = cells_to_tile_values(cells)
+    np.testing.assert_array_equal(values[cells == 0], 0)
+    np.testing.assert_array_equal(
+        values[cells > 0], 1 << cells[cells > 0].astype(np.int64)
+    )
+    np.testing.assert_array_equal(tile_values_to_cells(values), cells)
+    np.testing.assert_array_equal(
+        tile_values_to_cells([0, 2, 4, 2048] + [0] * 12)[:4], [0, 1, 2, 11]
+    )
+
+
+def test_network_encodings():
+    cells = random_cells(64, seed=5)
+    boards = pack_boards(cells)
+    encoded = one_hot(boards)
+    assert encoded.shape == (64, 16, 16)
+    np.testing.assert_array_equal(encoded.argmax(axis=-1), cells)
+    np.testing.assert_array_equal(encoded.sum(axis=-1), 1)
+    np.testing.assert_allclose(log_values(boards, scale=0.5), cells * 0.5)
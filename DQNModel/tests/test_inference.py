@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+tf = pytest.importorskip("tensorflow")
+
+from src.inference import NumpyDuelingDQN, export_dueling_dqn
+from src.model import DuelingDQN
+
+STATE_DIM = 16
+ACTION_DIM = 4
+
+# largest q-value error allowed, relative to the largest q-value, per kernel storage type
+TOLERANCES = {"float32": 1e-5, "float16": 5e-3, "int8": 5e-2}
+
+
+@pytest.fixture(scope="module")
+def model():
+    """
+    DuelingDQN with every weight random, including the biases and the layer norm's gamma and beta
+    that keras initializes to constants
+    """
+    tf.random.set_seed(0)
+    model = DuelingDQN(STATE_DIM, ACTION_DIM)
+    model(tf.zeros((1, STATE_DIM), dtype=tf.float32))
+    rng = np.random.default_rng(0)
+    model.set_weights(
+        [
+            rng.normal(0, 1 / np.sqrt(w.shape[0]) if w.ndim == 2 else 0.1, w.shape)
+            + (1 if w.ndim == 1 and i == 2 else 0)  # gamma stays around 1
+            for i, w in enumerate(model.get_weights())
+        ]
+    )
+    return model
+
+
+def boards() -> np.ndarray:
+    """
+    Random boards of a typical game, followed by edge cases: empty, full of the largest tile,
+    a single tile and a checkerboard of large tiles
+    """
+    rng = np.random.default_rng(1)
+    states = rng.integers(0, 12, (1024, STATE_DIM)).astype(np.float32)
+    states[rng.random(states.shape) < 0.4] = 0
+    single = np.zeros(STATE_DIM, dtype=np.float32)
+    single[5] = 1
+    checker = np.where(np.arange(STATE_DIM) % 2 == 0, 17, 1).astype(np.float32)
+    edges = np.stack(
+        [
+            np.zeros(STATE_DIM, dtype=np.float32),
+            np.full(STATE_DIM, 17, dtype=np.float32),
+            single,
+            checker,
+        ]
+    )
+    return np.concatenate([states, edges])
+
+
+@pytest.mark.parametrize("quantize", TOLERANCES)
+def test_numpy_network_matches_keras(model, quantize, tmp_path):
+    states = boards()
+    expected = model(tf.convert_to_tensor(states)).numpy()
+    path = str(tmp_path / "weights.npz")
+    export_dueling_dqn(model, path, quantize)
+    network = NumpyDuelingDQN.load(
+        path, max_batch=8
+    )  # grows its buffers on the first call
+    q_values = network(states).copy()
+
+    bound = TOLERANCES[quantize] * max(np.abs(expected).max(), 1)
+    np.testing.assert_allclose(q_values, expected, rtol=0, atol=bound)
+
+    # the move may only differ where the keras q-values of the two best moves are within the error
+    top_two = np.sort(expected, axis=1)[:, -2:]
+    clear = top_two[:, 1] - top_two[:, 0] > 2 * bound
+    np.testing.assert_array_equal(
+        np.argmax(q_values, axis=1)[clear], np.argmax(expected, axis=1)[clear]
+    )
+    if quantize == "float32":
+        assert clear.mean() > 0.99
+
+
+def test_single_state_matches_batch(model, tmp_path):
+    states = boards()[:16]
+    path = str(tmp_path / "weights.npz")
+    export_dueling_dqn(model, path)
+    network = NumpyDuelingDQN.load(path)
+    batch = network(states).copy()
+    for state, q_values in zip(states, batch):
+        np.testing.assert_allclose(
+            network(state[None])[0], q_values, rtol=1e-6, atol=1e-6
+        )
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from src.codec import pack_boards
+from src.reward import RewardSpec
+
+cpp = pytest.importorskip("src.PyBatchSimulator")
+
+SPECS = [
+    RewardSpec(),
+    RewardSpec(
+        score_scale=0.5,
+        max_tile_scale=1.3,
+        corner_scale=-0.7,
+        empty_scale=0.25,
+        terminal_scale=11.0,
+    ),
+]
+
+
+def cpp_spec(spec: RewardSpec):
+    return cpp.RewardSpec(**vars(spec))
+
+
+@pytest.mark.parametrize("spec", SPECS, ids=repr)
+def test_kernels_match_on_random_boards(spec):
+    rng = np.random.default_rng(0)
+    n = 4096
+    cells = rng.integers(0, 16, (n, 16))
+    cells[rng.random(cells.shape) < 0.4] = 0
+    # empty board, board full of the largest tile, a lone tile in a corner and off it
+    cells[:4] = 0
+    cells[1] = 15
+    cells[2, 0] = 9
+    cells[3, 5] = 9
+    boards = pack_boards(cells)
+    # usual merge scores, none, and the rare gains past the python log table
+    gained = rng.integers(0, 4096, n)
+    gained[::7] = 0
+    gained[::101] = rng.integers(1 << 16, 1 << 20, len(gained[::101]))
+    terminated = rng.random(n) < 0.1
+
+    expected = spec.compile()(boards, gained, terminated)
+    actual = cpp.rewards(boards, gained, terminated, cpp_spec(spec))
+    np.testing.assert_array_equal(actual, expected)
+
+
+@pytest.mark.parametrize("spec", SPECS, ids=repr)
+def test_batch_simulator_rewards_match(spec):
+    rng = np.random.default_rng(1)
+    num_envs = 64
+    sim = cpp.BatchSimulator(num_envs, 7, 1, cpp_spec(spec))
+    kernel = spec.compile()
+    _, moves, _, _ = sim.reset()
+    compared = 0
+    for _ in range(300):
+        # a random legal move for every env, games that are over restart
+        actions = np.zeros(num_envs, dtype=np.uint8)
+        for i, valid in enumerate(moves & 0xF):
+            legal = [1 << d for d in range(4) if valid >> d & 1]
+            actions[i] = rng.choice(legal) if legal else 0b00010000
+        before = sim.scores().copy()
+        boards, moves, rewards, dones = sim.step(actions)
+        moved = actions != 0b00010000
+        gained = sim.scores() - before
+        expected = kernel(boards[moved], gained[moved], dones[moved])
+        np.testing.assert_array_equal(rewards[moved], expected)
+        compared += moved.sum()
+    assert compared > 0
+
+
+def test_scores_start_at_zero_and_grow():
+    sim = cpp.BatchSimulator(8, 3)
+    sim.reset()
+    np.testing.assert_array_equal(sim.scores(), 0)
+    for _ in range(50):
+        sim.step(np.full(8, 0b0001, dtype=np.uint8))
+        sim.step(np.full(8, 0b0100, dtype=np.uint8))
+    assert sim.scores().dtype == np.int64
+    assert np.all(sim.scores() >= 0) and np.any(sim.scores() > 0)
@@ -0,0 +1,43 @@
+import numpy as np
+
+from src.sim import BatchSimulator, LookupTable, Move
+
+
+def first_move(valid_moves: np.ndarray, invalid: bool = False) -> np.ndarray:
+    """
+    Returns the lowest valid (or invalid) single move bit of every board, NOMOVE if there is none
+    """
+    flags = ~valid_moves & 0xF if invalid else valid_moves & 0xF
+    return (flags & -flags.astype(np.int16)).astype(np.uint8)
+
+
+def test_invalid_moves_leave_boards_untouched():
+    sim = BatchSimulator(256, LookupTable(), seed=0)
+    actions = first_move(sim.valid_moves, invalid=True)
+    invalid = actions != Move.NOMOVE.value
+    assert invalid.any()
+    boards, move_counts = sim.boards.copy(), sim.move_counts.copy()
+
+    sim.step(actions)
+    np.testing.assert_array_equal(sim.boards[invalid], boards[invalid])
+    np.testing.assert_array_equal(sim.move_counts[invalid], move_counts[invalid])
+    np.testing.assert_array_equal(sim.scores[invalid], 0)
+
+
+def test_valid_moves_spawn_one_tile():
+    sim = BatchSimulator(256, LookupTable(), seed=1)
+    for _ in range(20):
+        actions = first_move(sim.valid_moves)
+        moving = actions != Move.NOMOVE.value
+        afterstates = sim.afterstates[
+            np.arange(sim.num_envs), np.log2(np.maximum(actions, 1)).astype(np.intp)
+        ]
+        sim.step(actions)
+        spawned = sim.boards[moving] ^ afterstates[moving]
+        # exactly one nibble changed, from empty to a 2 or a 4
+        assert np.all(spawned != 0)
+        shift = (np.log2(spawned.astype(np.float64)).astype(np.uint64) // 4) * 4
+        np.testing.assert_array_equal(spawned >> shift << shift, spawned)
+        assert np.all(np.isin(spawned >> shift, [1, 2]))
+        np.testing.assert_array_equal(sim.move_counts[moving] > 0, True)
+        sim.reset(sim.is_terminated.copy())
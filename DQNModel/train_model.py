@@ -4,9 +4,20 @@ from argparse import ArgumentParser
 
 import tensorflow as tf
 
-from src.agent import DQNAgent
-from src.env_manager import CPPEnvManager, PyEnvManager
-from src.train import train_dqn, train_python_dqn
+from src.dqn_agent import DQNAgent
+from src.buffer import (
+    MemmapReplayBuffer,
+    PackedReplayBuffer,
+    PrioritizedReplayBuffer,
+    ReplayBuffer,
+)
+from src.env_manager import (
+    CPPBatchEnvManager,
+    CPPEnvManager,
+    PyEnvManager,
+    ShardedPyEnvManager,
+)
+from src.train import train_dqn, train_python_dqn, train_python_dqn_pipelined
 
 
 def main():
@@ -21,33 +32,179 @@ def main():
     parser.add_argument("--num-env", type=int, required=False, default=1)
     parser.add_argument("--epsilon", type=float, required=False, default=1.0)
     parser.add_argument("--env-type", type=str, required=False, default="py")
+    parser.add_argument(
+        "--num-workers",
+        type=int,
+        required=False,
+        default=0,
+        help="Split the py environments across this many worker processes, 0 steps them in this process",
+    )
+    parser.add_argument("--pin-workers", action="store_true")
+    parser.add_argument(
+        "--num-threads",
+        type=int,
+        required=False,
+        default=1,
+        help="Threads stepping the C++ simulators, only valid if env type is cpp-batch",
+    )
     parser.add_argument("--step-save-interval", type=int, required=False, default=10000)
     parser.add_argument("--ep-count", type=int, required=False, default=float("inf"))
     parser.add_argument("--output", type=str, required=False, default="model")
+    parser.add_argument(
+        "--buffer-type",
+        type=str,
+        required=False,
+        default="default",
+        help="Replay buffer storage, valid options: default, packed, mmap (packed and mmap not valid if env type is cpp)",
+    )
+    parser.add_argument(
+        "--buffer-path",
+        type=str,
+        required=False,
+        default="replay_buffer",
+        help="Directory of the memory-mapped replay buffer, only valid if buffer type is mmap",
+    )
+    parser.add_argument(
+        "--augment-symmetries",
+        action="store_true",
+        help="Train on every sampled transition under a random one of the 8 board rotations and reflections",
+    )
+    parser.add_argument(
+        "--prioritized",
+        action="store_true",
+        help="Sample the replay buffer with prioritized experience replay",
+    )
+    parser.add_argument(
+        "--pipelined",
+        action="store_true",
+        help="Run gradient updates on a learner thread fed by prefetched batches while the py envs step",
+    )
+    parser.add_argument(
+        "--replay-ratio",
+        type=float,
+        required=False,
+        default=None,
+        help="Sampled transitions per environment transition when pipelined, defaults to the sequential loop's ratio",
+    )
+    parser.add_argument(
+        "--max-staleness",
+        type=int,
+        required=False,
+        default=8,
+        help="Gradient updates the learner may lag behind the replay ratio before env stepping waits, only valid if pipelined",
+    )
     args = parser.parse_args()
 
     STATE_DIM = 16
     ACTION_DIM = 4
+    BUFFER_CAPACITY = 10_000_000
+
+    # checked before the replay buffer is allocated, which can take gigabytes or create files on disk
+    if args.env_type not in ("py", "cpp", "cpp-batch"):
+        print(
+            f'Environment type {args.env_type} not recognized, valid options: "py", "cpp" and "cpp-batch"'
+        )
+        return
+
+    # packed buffers store every env's transitions in its own lane and need all of them on every step,
+    # the cpp env only reports the envs that finished their move
+    if args.env_type == "cpp" and args.buffer_type in ("packed", "mmap"):
+        print(
+            f'error: buffer type {args.buffer_type} not compatible with env type cpp, use "default" or env type py or cpp-batch'
+        )
+        return
+
+    match (args.buffer_type):
+        case "default":
+            replay_buffer = ReplayBuffer(
+                BUFFER_CAPACITY, (STATE_DIM,), augment=args.augment_symmetries
+            )
+        case "packed":
+            replay_buffer = PackedReplayBuffer(
+                BUFFER_CAPACITY,
+                (STATE_DIM,),
+                num_lanes=args.num_env,
+                augment=args.augment_symmetries,
+            )
+        case "mmap":
+            replay_buffer = MemmapReplayBuffer(
+                args.buffer_path,
+                BUFFER_CAPACITY,
+                (STATE_DIM,),
+                num_lanes=args.num_env,
+                augment=args.augment_symmetries,
+            )
+            print(f"Replay buffer at {args.buffer_path} holds {replay_buffer.size}")
+        case _:
+            print(
+                f'Buffer type {args.buffer_type} not recognized, valid options: "default", "packed" and "mmap"'
+            )
+            return
+    if args.prioritized:
+        replay_buffer = PrioritizedReplayBuffer(replay_buffer)
 
     agent_2048 = DQNAgent(
         STATE_DIM,
         ACTION_DIM,
-        buffer_capacity=10_000_000,
         batch_size=512,
         lr=3e-5,
         gamma=0.99,
+        replay_buffer=replay_buffer,
     )
     match (args.env_type):
         case "py":
-            env_man = PyEnvManager(args.num_env)
-            train_python_dqn(
-                agent_2048,
-                env_man,
-                epsilon=args.epsilon,
-                save_every=args.step_save_interval,
-                episode_count=args.ep_count,
-                file_name=args.output,
-            )
+            if args.num_workers > 0:
+                env_man = ShardedPyEnvManager(
+                    args.num_env, args.num_workers, args.pin_workers
+                )
+            else:
+                env_man = PyEnvManager(args.num_env)
+            try:
+                if args.pipelined:
+                    train_python_dqn_pipelined(
+                        agent_2048,
+                        env_man,
+                        epsilon=args.epsilon,
+                        replay_ratio=args.replay_ratio,
+                        max_staleness=args.max_staleness,
+                        save_every=args.step_save_interval,
+                        episode_count=args.ep_count,
+                        file_name=args.output,
+                    )
+                else:
+                    train_python_dqn(
+                        agent_2048,
+                        env_man,
+                        epsilon=args.epsilon,
+                        save_every=args.step_save_interval,
+                        episode_count=args.ep_count,
+                        file_name=args.output,
+                    )
+            finally:
+                if args.num_workers > 0:
+                    env_man.close()
+        case "cpp-batch":
+            env_man = CPPBatchEnvManager(args.num_env, args.num_threads)
+            if args.pipelined:
+                train_python_dqn_pipelined(
+                    agent_2048,
+                    env_man,
+                    epsilon=args.epsilon,
+                    replay_ratio=args.replay_ratio,
+                    max_staleness=args.max_staleness,
+                    save_every=args.step_save_interval,
+                    episode_count=args.ep_count,
+                    file_name=args.output,
+                )
+            else:
+                train_python_dqn(
+                    agent_2048,
+                    env_man,
+                    epsilon=args.epsilon,
+                    save_every=args.step_save_interval,
+                    episode_count=args.ep_count,
+                    file_name=args.output,
+                )
         case "cpp":
             # currently broken... shared memory structures don't populate properly when launching via popen
             # training_sim = subprocess.Popen(
@@ -64,10 +221,6 @@ def main():
                 episode_count=args.ep_count,
                 file_name=args.output,
             )
-        case _:
-            print(
-                f'Environment type {args.env_type} not recognized, valid options: "py" and "cpp"'
-            )
 
 
 if __name__ == "__main__":
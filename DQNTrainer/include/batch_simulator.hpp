@@ -0,0 +1,63 @@
+#pragma once
+
+#include <array>
+#include <cstddef>
+#include <condition_variable>
+#include <cstdint>
+#include <functional>
+#include <memory>
+#include <mutex>
+#include <thread>
+#include <utility>
+#include <vector>
+
+#include "look_up_table.hpp"
+#include "reward.hpp"
+#include "simulator.hpp"
+
+// Owns num_envs simulators and their shared move table in the calling process, no shared memory or workers
+// Results are written into caller-owned arrays so stepping never allocates
+class BatchSimulator {
+    public:
+        // Seeds every simulator from seed, num_threads > 1 splits each step across the calling thread and
+        // num_threads - 1 workers that live as long as the simulator
+        BatchSimulator(size_t num_envs, uint32_t seed, size_t num_threads = 1, const RewardSpec& reward_spec = {});
+        ~BatchSimulator();
+        // the workers hold this, so the simulator stays where it was built
+        BatchSimulator(const BatchSimulator&) = delete;
+        BatchSimulator& operator=(const BatchSimulator&) = delete;
+
+        // Applies actions[i] to simulator i, NOMOVE (0b10000) restarts it, 0 and illegal moves leave it untouched
+        // Then writes every simulator's packed board, valid moves, reward and whether it has no moves left
+        void step(const uint8_t* actions, uint64_t* boards, uint8_t* moves, double* rewards, bool* dones);
+
+        // Restarts every simulator and writes its results like step
+        void reset(uint64_t* boards, uint8_t* moves, double* rewards, bool* dones);
+
+        // Writes the score of every simulator's current game
+        void scores(int64_t* out) const;
+
+        size_t size() const { return simulators.size(); }
+
+    private:
+        std::unique_ptr<std::array<RowEntry, MOVE_COUNT>> look_up_table;
+        std::vector<Simulator> simulators;
+        size_t num_threads;
+
+        // Worker pool, each step bumps generation and every worker runs its chunk of job, the last one to finish
+        // wakes the calling thread through work_done
+        std::mutex pool_mutex;
+        std::condition_variable work_ready;
+        std::condition_variable work_done;
+        const std::function<void(size_t, size_t)>* job{nullptr};
+        uint64_t generation{0};
+        size_t pending{0};
+        bool stopping{false};
+        std::vector<std::jthread> workers;
+
+        // Runs fn(begin, end) over [0, num_envs) split into one chunk per thread, chunk 0 on the calling thread
+        void parallelFor(const std::function<void(size_t, size_t)>& fn);
+        void workerLoop(size_t chunk_idx);
+        std::pair<size_t, size_t> chunkBounds(size_t chunk_idx) const;
+        void writeResults(size_t i, uint64_t* boards, uint8_t* moves, double* rewards, bool* dones) const;
+};
@@ -3,91 +3,112 @@
 #include <atomic>
 #include <cassert>
 #include <cstddef>
-#include <cstring>
+#include <cstdint>
 #include <type_traits>
 #include <optional>
 #include <vector>
 
+#include "wait_strategy.hpp"
 
-// Generic Lock-Free queue intended to be used for MPSC
+
+// Bounded lock-free MPSC queue, Vyukov style
+// Every slot carries a sequence number, a producer claims a position with a CAS on head and publishes its item by
+// advancing the slot's sequence, so the consumer never reads a slot whose write hasn't finished
+// Like LockQueue the slots live in a separate buffer passed to every call, since its address differs between processes
 template<typename T>
 class LockFreeQueue {
-    static_assert(std::is_trivially_copyable<T>::value, "LockFreeQueue elements must be trivially copyable"); 
+    static_assert(std::is_trivially_copyable<T>::value, "LockFreeQueue elements must be trivially copyable");
     public:
-        LockFreeQueue(size_t cap) : 
+        struct Slot {
+            std::atomic<size_t> sequence;
+            T item;
+        };
+
+        LockFreeQueue(size_t cap, Slot* buffer) :
             capacity(cap), mask(cap-1) {
                 assert((cap & (cap-1)) == 0); // force capacity to be a power of 2
-                tail.store(0,std::memory_order_relaxed);
-                head.store(0,std::memory_order_relaxed);
+                for (size_t i{0}; i < cap; ++i) {
+                    buffer[i].sequence.store(i, std::memory_order_relaxed);
+                }
+                head.store(0, std::memory_order_relaxed);
+                tail.store(0, std::memory_order_relaxed);
             }
 
         size_t size() const {
-            size_t t = tail.load(std::memory_order_acquire);
-            size_t h = head.load(std::memory_order_acquire);
-            return (h >= t) ? h-t : h-t+capacity;
+            return head.load(std::memory_order_acquire) - tail.load(std::memory_order_acquire);
         }
-        bool push(T* buffer, T item) noexcept {
-            size_t h = head.load(std::memory_order_relaxed);
-            while (true) {
-                size_t next = (h + 1) & mask;
-                // check for full queue
-                size_t t = tail.load(std::memory_order_acquire);
-                if (next == t) {
+        bool push(Slot* buffer, T item) noexcept {
+            size_t pos = head.load(std::memory_order_relaxed);
+            for (;;) {
+                Slot& slot = buffer[pos & mask];
+                size_t seq = slot.sequence.load(std::memory_order_acquire);
+                auto diff = static_cast<std::ptrdiff_t>(seq) - static_cast<std::ptrdiff_t>(pos);
+                if (diff == 0) {
+                    // slot is free for this position, try to claim it
+                    if (head.compare_exchange_weak(pos, pos + 1, std::memory_order_relaxed)) {
+                        slot.item = item;
+                        slot.sequence.store(pos + 1, std::memory_order_release);
+                        pushes.fetch_add(1, std::memory_order_seq_cst);
+                        if (consumer_waiting.load(std::memory_order_seq_cst)) {
+                            futex_wake(&pushes, 1);
+                        }
+                        return true;
+                    }
+                } else if (diff < 0) {
                     return false; // queue full
+                } else {
+                    pos = head.load(std::memory_order_relaxed); // another producer took it, retry
                 }
-
-                // try to claim the slot
-                if (head.compare_exchange_weak(
-                        h, next,
-                        std::memory_order_release,  // on success
-                        std::memory_order_relaxed   // on failure
-                    )) {
-                    // successfully reserved the slot at 'h'
-                    buffer[h] = item; 
-                    return true;
-                }
-
-                // CAS failed, h updated to latest value, retry
             }
         }
-        std::optional<T> pop(T* buffer) noexcept {
-            size_t t = tail.load(std::memory_order_relaxed);
-            if (t == head.load(std::memory_order_acquire)) {
-                return std::nullopt;
+        std::optional<T> pop(Slot* buffer) noexcept {
+            size_t pos = tail.load(std::memory_order_relaxed);
+            Slot& slot = buffer[pos & mask];
+            size_t seq = slot.sequence.load(std::memory_order_acquire);
+            if (seq != pos + 1) {
+                return std::nullopt; // empty, or the producer of this slot hasn't finished writing
             }
-            T val = buffer[t];
-            size_t next = (t + 1) & mask;
-            tail.store(next, std::memory_order_release);
+            T val = slot.item;
+            slot.sequence.store(pos + capacity, std::memory_order_release); // hand the slot to the next lap
+            tail.store(pos + 1, std::memory_order_release);
             return val;
         }
-        std::vector<T> popBatch(T* buffer) noexcept {
-            size_t t = tail.load(std::memory_order_relaxed);
-            size_t h = head.load(std::memory_order_acquire);
+        std::vector<T> popBatch(Slot* buffer) noexcept {
             std::vector<T> data;
-            if (t == h) {
-                return data;
-            }
-            constexpr auto size = sizeof(T);
-            if (t < h) {
-                auto read_size = h-t;
-                data.resize(read_size); 
-                memcpy(data.data(),buffer+t,read_size*size);
-            } else {
-               auto read_1 = capacity-t; 
-               auto read_2 = h;
-               data.resize(read_1+read_2);
-               memcpy(data.data(),buffer+t,read_1*size);
-               memcpy(data.data()+read_1,buffer,read_2*size);
+            data.reserve(size());
+            while (auto val = pop(buffer)) {
+                data.emplace_back(*val);
             }
-            tail.store(head, std::memory_order_release);
             return data;
         }
+        // Spins, then sleeps until the next slot is published
+        void waitNonEmpty(Slot* buffer) noexcept {
+            for (int i{0}; !ready(buffer); ++i) {
+                if (i < spin_limit()) {
+                    cpu_relax();
+                    continue;
+                }
+                uint32_t seen = pushes.load(std::memory_order_seq_cst);
+                consumer_waiting.store(1, std::memory_order_seq_cst);
+                if (!ready(buffer)) {
+                    futex_wait(&pushes, seen);
+                }
+                consumer_waiting.store(0, std::memory_order_relaxed);
+            }
+        }
 
 
     private:
         const size_t capacity;
         const size_t mask;
 
-        std::atomic<size_t> head;
-        std::atomic<size_t> tail;
-};
\ No newline at end of file
+        alignas(64) std::atomic<size_t> head;
+        alignas(64) std::atomic<size_t> tail;
+        alignas(64) std::atomic<uint32_t> pushes{0}; // futex word, bumped on every push
+        std::atomic<uint32_t> consumer_waiting{0};
+
+        bool ready(Slot* buffer) const noexcept {
+            size_t pos = tail.load(std::memory_order_relaxed);
+            return buffer[pos & mask].sequence.load(std::memory_order_acquire) == pos + 1;
+        }
+};
@@ -6,6 +6,12 @@
 struct RowEntry {
     uint16_t result;
     int score;
+    // per-row features, so legality and spawn queries on a board are four lookups
+    bool can_move_left;
+    bool can_move_right;
+    uint8_t empty_count;
+    uint8_t empty_mask; // bit i set when cell i is empty, first cell in the LSB
+    uint8_t max_tile;
 };
 
 // Each tile can have 16 different values, 4 tiles per row = 65536 rows
@@ -24,4 +30,6 @@ std::array<uint16_t,4> transposeBoard(std::array<uint16_t,4> board);
 
 // returns {row,score increase}
 std::pair<uint16_t,int> rowShiftLeft(uint16_t row);
+// returns the column of the n-th empty cell of a row, counting from the first cell
+uint8_t nthEmptyCell(uint8_t empty_mask, uint32_t n);
 std::array<RowEntry, MOVE_COUNT> generateLookupTable();
\ No newline at end of file
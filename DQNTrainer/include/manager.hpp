@@ -5,6 +5,7 @@
 #include <cstdint>
 #include <vector>
 
+#include "lock_free_queue.hpp"
 #include "lock_queue.hpp"
 #include "look_up_table.hpp"
 #include "shared_memory_structures.hpp"
@@ -14,7 +15,7 @@ namespace bp = boost::process::v1;
 
 class SimulationManager {
     public:
-        SimulationManager(uint8_t process_count, bool logging=false);
+        SimulationManager(uint8_t process_count, bool logging=false, Transport transport=Transport::Queue);
         ~SimulationManager();
 
         // Simulator managing functions
@@ -29,10 +30,14 @@ class SimulationManager {
         bip::managed_shared_memory shm;
         uint8_t process_count;
         bool logging;
+        Transport transport;
         ProcessControlFlags* control_flags = nullptr;
         Message* message_buffer = nullptr;
         LockQueue<Message>* message_queue = nullptr;
+        LockFreeQueue<Message>::Slot* lock_free_buffer = nullptr;
+        LockFreeQueue<Message>* lock_free_queue = nullptr;
         ResponseCell* DQN_move_array = nullptr;
+        EnvSlab* env_slab = nullptr;
         RowEntry* move_lookup_table = nullptr;
         
         // Initializing functions
@@ -0,0 +1,48 @@
+#pragma once
+
+#include <array>
+#include <cstdint>
+
+// Terms and scales of the training reward, same fields and defaults as RewardSpec in DQNModel/src/reward.py
+//     score_scale * log2(1 + merge score of the move, read off the move table)
+//   + max_tile_scale * log2(log2 value of the largest tile)
+//   + corner_scale if the largest tile sits in a corner
+//   + empty_scale * empty cells
+//   - terminal_scale if the game is over
+struct RewardSpec {
+    double score_scale = 1.0;
+    double max_tile_scale = 0.2;
+    double corner_scale = 0.1;
+    double empty_scale = 0.1;
+    double terminal_scale = 5.0;
+};
+
+// Reward features of a single 16-bit row
+struct RowFeatures {
+    uint8_t empty;      // number of empty cells
+    uint8_t max_tile;   // largest log2 value
+    uint8_t corner_max; // larger log2 value of the first and last cell
+};
+
+// Features of every possible row, built once per process
+const RowFeatures* rowFeatures();
+
+// RewardSpec compiled against the row features
+// Does the same arithmetic in the same order as the python kernel, so both simulators produce identical rewards
+class RewardKernel {
+    public:
+        explicit RewardKernel(const RewardSpec& spec = {});
+
+        // board is the board after the move and its spawned tile, gained the merge score of the move alone,
+        // so the spawned tile never counts towards the score term
+        double operator()(const std::array<uint16_t,4>& board, int64_t gained, bool terminated) const;
+        // Same as above for boards in the packed 64-bit layout
+        double operator()(uint64_t board, int64_t gained, bool terminated) const;
+
+        const RewardSpec& getSpec() const { return spec; }
+
+    private:
+        RewardSpec spec;
+        std::array<double,16> max_tile_terms;
+        const RowFeatures* features;
+};
@@ -1,6 +1,7 @@
 #pragma once
 
 #include "look_up_table.hpp"
+#include "lock_free_queue.hpp"
 #include "lock_queue.hpp"
 #include <boost/interprocess/creation_tags.hpp>
 #include <boost/interprocess/interprocess_fwd.hpp>
@@ -8,6 +9,11 @@
 #include <boost/interprocess/sync/interprocess_mutex.hpp>
 #include <boost/interprocess/managed_shared_memory.hpp>
 #include <boost/process/v1.hpp>
+#include <atomic>
+#include <cstddef>
+#include <memory>
+#include <new>
+#include <utility>
 #include <cstdint>
 #include <iostream>
 #include <bitset>
@@ -20,14 +26,47 @@ constexpr char MESSAGE_BUFFER_NAME[] = "DQN_message_buffer";
 constexpr char MESSAGE_QUEUE_NAME[] = "DQN_message_queue";
 constexpr char DQN_MOVE_ARRAY_NAME[] = "DQN_move_array";
 constexpr char MOVE_LOOKUP_TABLE_NAME[] = "move_lookup_table";
+constexpr char ENV_SLAB_NAME[] = "DQN_env_slab";
+constexpr char LOCK_FREE_BUFFER_NAME[] = "DQN_lock_free_buffer";
+constexpr char LOCK_FREE_QUEUE_NAME[] = "DQN_lock_free_queue";
+
+// The segment manager only aligns allocations to 16 bytes, structures with cache line aligned members are built inside
+// a named byte buffer with room to align them. Every process maps the segment page aligned, so the aligned address
+// sits at the same offset in every mapping
+template<typename T>
+T* align_in_buffer(unsigned char* raw) {
+    void* ptr = raw;
+    size_t space = sizeof(T) + alignof(T);
+    return static_cast<T*>(std::align(alignof(T), sizeof(T), ptr, space));
+}
+// name is a char array, or bip::anonymous_instance for an unnamed structure
+template<typename T, typename Name, typename... Args>
+T* construct_aligned(bip::managed_shared_memory& shm, Name name, Args&&... args) {
+    unsigned char* raw = shm.construct<unsigned char>(name)[sizeof(T) + alignof(T)]();
+    return new (align_in_buffer<T>(raw)) T(std::forward<Args>(args)...);
+}
+template<typename T>
+T* find_aligned(bip::managed_shared_memory& shm, const char* name) {
+    unsigned char* raw = shm.find<unsigned char>(name).first;
+    return raw ? align_in_buffer<T>(raw) : nullptr;
+}
+
+// How workers hand their messages to the DQN
+enum class Transport : uint8_t {
+    Queue = 0, // Messages pushed through the LockQueue, copied out by getMessageBatch
+    Slab = 1,  // Messages written in place into the EnvSlab, read by the DQN as NumPy views
+    LockFree = 2, // Messages pushed through the LockFreeQueue, copied out by getMessageBatch
+};
 
 
 struct ProcessControlFlags {
-   ProcessControlFlags(uint8_t process_count) : process_count(process_count) {}
+   ProcessControlFlags(uint8_t process_count, Transport transport = Transport::Queue) :
+       process_count(process_count), transport(transport) {}
    bip::interprocess_mutex mtx;
    bip::interprocess_condition cond; 
 
    uint8_t process_count;
+   Transport transport;
 
    bool manager_ready = false;
    bool workers_ready = false;
@@ -48,19 +87,40 @@ struct Message {
     uint64_t board;
     uint8_t moves;
     double reward;
+    int32_t score; // score of the game so far
 };
 #pragma pack(pop)
 
-#pragma pack(push, 1)
+// Not packed, ready is a futex word and must stay 4-byte aligned
 struct ResponseCell { 
     std::atomic<uint32_t> ready = 0; // 0 == not ready, 1 == ready
+    std::atomic<uint32_t> waiting = 0; // 1 while the worker sleeps on ready
     uint8_t move;
 };
-#pragma pack(pop)
 
 void write_slot(ResponseCell *s, uint8_t move);
+// Spins on the slot for a while, then sleeps on its futex until a move is written
 uint8_t wait_read_slot(ResponseCell *s);
 
+// Structure-of-arrays mirror of Message, entry i of every array belongs to worker i
+// A worker fills its entries and then sets its bit in ready, the entries stay untouched until the worker
+// reads its next move, so the DQN can read them in place between take_ready and sending that move
+struct EnvSlab {
+    static constexpr size_t MAX_ENVS = 256; // worker ids are uint8_t
+    static constexpr size_t READY_WORDS = MAX_ENVS / 64;
+
+    alignas(64) uint64_t boards[MAX_ENVS] = {};
+    alignas(64) double rewards[MAX_ENVS] = {};
+    alignas(64) int32_t scores[MAX_ENVS] = {};
+    alignas(64) uint8_t moves[MAX_ENVS] = {};
+    alignas(64) std::atomic<uint64_t> ready[READY_WORDS] = {};
+};
+
+// Writes a message into the slab entries of msg.id and marks them ready
+void publish_slot(EnvSlab *slab, const Message& msg);
+// Clears every ready bit and writes the ids that were set into ids in ascending order, returns how many were written
+size_t take_ready(EnvSlab *slab, uint8_t *ids, size_t env_count);
+
 struct SharedMemoryStructures {
     SharedMemoryStructures(bip::managed_shared_memory& shm) {
         pcf = shm.find<ProcessControlFlags>(CONTROL_FLAGS_NAME).first;
@@ -75,10 +135,22 @@ struct SharedMemoryStructures {
         if (!mq) {
             std::cerr << "Could not find mq\n";
         }
+        lfb = shm.find<LockFreeQueue<Message>::Slot>(LOCK_FREE_BUFFER_NAME).first;
+        if (!lfb) {
+            std::cerr << "Could not find lfb\n";
+        }
+        lfq = find_aligned<LockFreeQueue<Message>>(shm, LOCK_FREE_QUEUE_NAME);
+        if (!lfq) {
+            std::cerr << "Could not find lfq\n";
+        }
         mva = shm.find<ResponseCell>(DQN_MOVE_ARRAY_NAME).first;
         if (!mva) {
             std::cerr << "Could not find mva\n";
         }
+        es = find_aligned<EnvSlab>(shm, ENV_SLAB_NAME);
+        if (!es) {
+            std::cerr << "Could not find es\n";
+        }
         mlut = shm.find<RowEntry>(MOVE_LOOKUP_TABLE_NAME).first;
         if (!mlut) {
             std::cerr << "Could not find mlut\n";
@@ -89,6 +161,9 @@ struct SharedMemoryStructures {
     ProcessControlFlags* pcf = nullptr;
     Message* mb = nullptr;
     LockQueue<Message>* mq = nullptr;
+    LockFreeQueue<Message>::Slot* lfb = nullptr;
+    LockFreeQueue<Message>* lfq = nullptr;
     ResponseCell* mva = nullptr;
+    EnvSlab* es = nullptr;
     const RowEntry* mlut = nullptr;
 };
\ No newline at end of file
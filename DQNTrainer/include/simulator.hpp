@@ -5,6 +5,7 @@
 
 #include "rng.hpp"
 #include "look_up_table.hpp"
+#include "reward.hpp"
 #include "shared_memory_structures.hpp"
 
 using Move = uint8_t;
@@ -12,7 +13,7 @@ using Move = uint8_t;
 class Simulator {
     public:
         // Create a Simulator object and initializes the board to a valid 2048 starting state
-        Simulator(uint8_t id, uint32_t rng_seed, const RowEntry* MOVE_TABLE);
+        Simulator(uint8_t id, uint32_t rng_seed, const RowEntry* MOVE_TABLE, bool verbose = true, const RewardSpec& reward_spec = {});
         // Returns a bit-packed char representing available moves, from LSB to MSB -> LEFT, RIGHT, UP, DOWN, NO MOVES AVAILABLE
         Move getValidMoves() const;
         // Accepts a bit-packed char representing a move, it is assumed that the input is valid ie exactly one legal move
@@ -36,12 +37,13 @@ class Simulator {
         uint8_t id;
         Move current_moves;
         std::array<uint16_t,4> board; // represented as four bit packed rows, each tile is 4 bits representing the log2 value of the tile
-        std::array<uint16_t,4> prev_board; // stored for easy calculation of rewards 
+        std::array<uint16_t,4> prev_board;
         XorShift32 rng;
         const RowEntry* MOVE_TABLE = nullptr;
         int score{0};
         int prev_score{0};
         bool game_ended{false};
+        RewardKernel reward_kernel;
 
         // Shifts the entire board in a direction, merging tiles at most once
         void moveRight();
@@ -55,7 +57,6 @@ class Simulator {
         // Helpers
         inline uint8_t shiftAmt(uint8_t index) const { return 4*(3-index%4); }
         inline void setValue(uint8_t index, uint8_t val) { board[index/4] |= (val << shiftAmt(index)); } 
-        bool rowCanMoveLeft(uint16_t row) const;
         double getReward() const;
 
         // Converters
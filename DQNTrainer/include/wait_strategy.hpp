@@ -0,0 +1,37 @@
+#pragma once
+
+#include <atomic>
+#include <climits>
+#include <cstdint>
+#include <linux/futex.h>
+#include <sys/syscall.h>
+#include <thread>
+#include <unistd.h>
+
+// Iterations a waiter spins before sleeping on a futex, long enough to cover a typical hand-off between processes
+constexpr int SPIN_LIMIT = 1 << 12;
+
+// Spinning only pays off when the other side of the hand-off can run at the same time, on one core go straight to sleep
+inline int spin_limit() {
+    static const int limit = std::thread::hardware_concurrency() > 1 ? SPIN_LIMIT : 0;
+    return limit;
+}
+
+static_assert(sizeof(std::atomic<uint32_t>) == sizeof(uint32_t), "futex words must be plain 32-bit integers");
+
+// Sleeps while *word == expected, the word may live in shared memory so the process-shared futex operations are used
+inline void futex_wait(std::atomic<uint32_t>* word, uint32_t expected) {
+    syscall(SYS_futex, reinterpret_cast<uint32_t*>(word), FUTEX_WAIT, expected, nullptr, nullptr, 0);
+}
+// Wakes up to count waiters sleeping on word
+inline void futex_wake(std::atomic<uint32_t>* word, int count = INT_MAX) {
+    syscall(SYS_futex, reinterpret_cast<uint32_t*>(word), FUTEX_WAKE, count, nullptr, nullptr, 0);
+}
+
+inline void cpu_relax() {
+#if defined(__x86_64__) || defined(__i386__)
+    __builtin_ia32_pause();
+#else
+    std::this_thread::yield();
+#endif
+}
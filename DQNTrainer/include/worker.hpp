@@ -3,6 +3,7 @@
 #include <boost/interprocess/interprocess_fwd.hpp>
 #include <boost/interprocess/managed_shared_memory.hpp>
 #include <cstdint>
+#include "lock_free_queue.hpp"
 #include "lock_queue.hpp"
 #include "shared_memory_structures.hpp"
 #include "simulator.hpp"
@@ -33,5 +34,8 @@ class Worker {
         ProcessControlFlags* control_flags = nullptr;
         Message* message_buffer = nullptr;
         LockQueue<Message>* message_queue = nullptr;
+        LockFreeQueue<Message>::Slot* lock_free_buffer = nullptr;
+        LockFreeQueue<Message>* lock_free_queue = nullptr;
         ResponseCell* DQN_move_array = nullptr;
+        EnvSlab* env_slab = nullptr;
 };
\ No newline at end of file
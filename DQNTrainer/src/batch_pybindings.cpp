@@ -0,0 +1,114 @@
+#include <cstdint>
+#include <pybind11/numpy.h>
+#include <pybind11/pybind11.h>
+#include <stdexcept>
+#include "batch_simulator.hpp"
+#include "reward.hpp"
+
+namespace py = pybind11;
+
+
+// Python facing BatchSimulator, owns the result arrays and hands the same arrays back on every call
+struct PyBatchSimulator {
+    PyBatchSimulator(size_t num_envs, uint32_t seed, size_t num_threads, const RewardSpec& reward_spec) :
+        sim(num_envs, seed, num_threads, reward_spec),
+        boards(num_envs),
+        moves(num_envs),
+        rewards(num_envs),
+        dones(num_envs),
+        game_scores(num_envs) {
+        reset();
+    }
+    BatchSimulator sim;
+    py::array_t<uint64_t> boards;
+    py::array_t<uint8_t> moves;
+    py::array_t<double> rewards;
+    py::array_t<bool> dones;
+    py::array_t<int64_t> game_scores;
+
+    py::tuple step(py::array_t<uint8_t, py::array::c_style | py::array::forcecast> actions) {
+        if (actions.ndim() != 1 || static_cast<size_t>(actions.shape(0)) != sim.size()) {
+            throw std::invalid_argument("actions must be a 1-d array with one action per environment");
+        }
+        const uint8_t* a = actions.data();
+        auto [b, m, r, d] = pointers();
+        {
+            py::gil_scoped_release release;
+            sim.step(a, b, m, r, d);
+        }
+        return results();
+    }
+
+    py::tuple reset() {
+        auto [b, m, r, d] = pointers();
+        {
+            py::gil_scoped_release release;
+            sim.reset(b, m, r, d);
+        }
+        return results();
+    }
+
+    py::array_t<int64_t> scores() {
+        sim.scores(game_scores.mutable_data());
+        return game_scores;
+    }
+
+    std::tuple<uint64_t*, uint8_t*, double*, bool*> pointers() {
+        return {boards.mutable_data(), moves.mutable_data(), rewards.mutable_data(), dones.mutable_data()};
+    }
+    py::tuple results() const {
+        return py::make_tuple(boards, moves, rewards, dones);
+    }
+};
+
+// Rewards of a batch of packed boards through the C++ kernel, used to check it against the python one
+py::array_t<double> rewards(
+    py::array_t<uint64_t, py::array::c_style | py::array::forcecast> boards,
+    py::array_t<int64_t, py::array::c_style | py::array::forcecast> gained,
+    py::array_t<bool, py::array::c_style | py::array::forcecast> terminated,
+    const RewardSpec& spec) {
+    if (boards.ndim() != 1 || gained.size() != boards.size() || terminated.size() != boards.size()) {
+        throw std::invalid_argument("boards, gained and terminated must be 1-d arrays of the same length");
+    }
+    RewardKernel kernel(spec);
+    py::array_t<double> out(boards.size());
+    const uint64_t* b = boards.data();
+    const int64_t* g = gained.data();
+    const bool* t = terminated.data();
+    double* r = out.mutable_data();
+    for (py::ssize_t i{0}; i < boards.size(); ++i) {
+        r[i] = kernel(b[i], g[i], t[i]);
+    }
+    return out;
+}
+
+PYBIND11_MODULE(PyBatchSimulator, m) {
+    py::class_<RewardSpec>(m, "RewardSpec")
+        .def(py::init([](double score_scale, double max_tile_scale, double corner_scale, double empty_scale, double terminal_scale) {
+            return RewardSpec{score_scale, max_tile_scale, corner_scale, empty_scale, terminal_scale};
+        }), py::arg("score_scale") = 1.0, py::arg("max_tile_scale") = 0.2, py::arg("corner_scale") = 0.1,
+            py::arg("empty_scale") = 0.1, py::arg("terminal_scale") = 5.0)
+        .def_readwrite("score_scale", &RewardSpec::score_scale)
+        .def_readwrite("max_tile_scale", &RewardSpec::max_tile_scale)
+        .def_readwrite("corner_scale", &RewardSpec::corner_scale)
+        .def_readwrite("empty_scale", &RewardSpec::empty_scale)
+        .def_readwrite("terminal_scale", &RewardSpec::terminal_scale);
+
+    m.def("rewards", &rewards, py::arg("boards"), py::arg("gained"), py::arg("terminated"), py::arg("spec") = RewardSpec{},
+        "Rewards of packed boards through the C++ reward kernel");
+
+    py::class_<PyBatchSimulator>(m, "BatchSimulator")
+        .def(py::init<size_t, uint32_t, size_t, const RewardSpec&>(), py::arg("num_envs"), py::arg("seed") = 0, py::arg("num_threads") = 1,
+            py::arg("reward_spec") = RewardSpec{})
+        .def("step", &PyBatchSimulator::step, py::arg("actions"),
+            "Steps every environment, returns the reused (boards, moves, rewards, dones) arrays")
+        .def("reset", &PyBatchSimulator::reset,
+            "Restarts every environment, returns the reused (boards, moves, rewards, dones) arrays")
+        .def("scores", &PyBatchSimulator::scores,
+            "Returns the score of every environment's current game, in an array reused on every call")
+        .def_property_readonly("num_envs", [](const PyBatchSimulator& self) { return self.sim.size(); })
+        .def_readonly("boards", &PyBatchSimulator::boards)
+        .def_readonly("moves", &PyBatchSimulator::moves)
+        .def_readonly("rewards", &PyBatchSimulator::rewards)
+        .def_readonly("dones", &PyBatchSimulator::dones);
+};
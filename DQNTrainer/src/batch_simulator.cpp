@@ -0,0 +1,125 @@
+#include "batch_simulator.hpp"
+
+#include <algorithm>
+#include <bit>
+
+constexpr uint8_t RESTART = 0b00010000;
+
+// splitmix32 step, spreads one seed over the simulators and never yields the xorshift dead state 0
+static uint32_t mixSeed(uint32_t x) {
+    x += 0x9e3779b9u;
+    x = (x ^ (x >> 16)) * 0x85ebca6bu;
+    x = (x ^ (x >> 13)) * 0xc2b2ae35u;
+    x ^= x >> 16;
+    return x ? x : 1u;
+}
+
+BatchSimulator::BatchSimulator(size_t num_envs, uint32_t seed, size_t num_threads, const RewardSpec& reward_spec) :
+    look_up_table(std::make_unique<std::array<RowEntry, MOVE_COUNT>>(generateLookupTable())),
+    num_threads(std::max<size_t>(1, std::min(num_threads, num_envs))) {
+    simulators.reserve(num_envs);
+    for (size_t i{0}; i < num_envs; ++i) {
+        simulators.emplace_back(static_cast<uint8_t>(i), mixSeed(seed + static_cast<uint32_t>(i)), look_up_table->data(), false, reward_spec);
+    }
+    workers.reserve(this->num_threads - 1);
+    for (size_t t{1}; t < this->num_threads; ++t) {
+        workers.emplace_back(&BatchSimulator::workerLoop, this, t);
+    }
+}
+
+BatchSimulator::~BatchSimulator() {
+    {
+        std::lock_guard lock(pool_mutex);
+        stopping = true;
+    }
+    work_ready.notify_all();
+    workers.clear(); // joins, before the members the workers use are destroyed
+}
+
+std::pair<size_t, size_t> BatchSimulator::chunkBounds(size_t chunk_idx) const {
+    size_t n = simulators.size();
+    size_t chunk = (n + num_threads - 1) / num_threads;
+    size_t begin = std::min(chunk_idx * chunk, n);
+    return {begin, std::min(begin + chunk, n)};
+}
+
+void BatchSimulator::parallelFor(const std::function<void(size_t, size_t)>& fn) {
+    if (workers.empty()) {
+        fn(0, simulators.size());
+        return;
+    }
+    {
+        std::lock_guard lock(pool_mutex);
+        job = &fn;
+        pending = workers.size();
+        ++generation;
+    }
+    work_ready.notify_all();
+    auto [begin, end] = chunkBounds(0);
+    fn(begin, end);
+    std::unique_lock lock(pool_mutex);
+    work_done.wait(lock, [this] { return pending == 0; });
+    job = nullptr;
+}
+
+void BatchSimulator::workerLoop(size_t chunk_idx) {
+    uint64_t seen{0};
+    while (true) {
+        const std::function<void(size_t, size_t)>* fn;
+        {
+            std::unique_lock lock(pool_mutex);
+            work_ready.wait(lock, [&] { return stopping || generation != seen; });
+            if (stopping) {
+                return;
+            }
+            seen = generation;
+            fn = job;
+        }
+        auto [begin, end] = chunkBounds(chunk_idx);
+        (*fn)(begin, end);
+        bool last;
+        {
+            std::lock_guard lock(pool_mutex);
+            last = --pending == 0;
+        }
+        if (last) {
+            work_done.notify_one();
+        }
+    }
+}
+
+void BatchSimulator::step(const uint8_t* actions, uint64_t* boards, uint8_t* moves, double* rewards, bool* dones) {
+    parallelFor([&](size_t begin, size_t end) {
+        for (size_t i{begin}; i < end; ++i) {
+            // Simulator assumes legal moves, anything else would spawn into a full board so it is ignored
+            uint8_t action = actions[i];
+            if (action == RESTART || (std::has_single_bit(action) && (action & simulators[i].getValidMoves()))) {
+                simulators[i].makeMove(action);
+            }
+            writeResults(i, boards, moves, rewards, dones);
+        }
+    });
+}
+
+void BatchSimulator::reset(uint64_t* boards, uint8_t* moves, double* rewards, bool* dones) {
+    parallelFor([&](size_t begin, size_t end) {
+        for (size_t i{begin}; i < end; ++i) {
+            simulators[i].init();
+            writeResults(i, boards, moves, rewards, dones);
+        }
+    });
+}
+
+void BatchSimulator::scores(int64_t* out) const {
+    for (size_t i{0}; i < simulators.size(); ++i) {
+        out[i] = simulators[i].getScore();
+    }
+}
+
+void BatchSimulator::writeResults(size_t i, uint64_t* boards, uint8_t* moves, double* rewards, bool* dones) const {
+    auto msg = simulators[i].generateMessage();
+    boards[i] = msg.board;
+    moves[i] = msg.moves;
+    rewards[i] = msg.reward;
+    dones[i] = msg.moves == RESTART;
+}
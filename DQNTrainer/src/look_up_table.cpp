@@ -1,4 +1,6 @@
 #include "look_up_table.hpp"
+#include <algorithm>
+#include <bit>
 #include <cassert>
 
 std::array<uint8_t, 4> unpackRow(uint16_t row) {
@@ -57,8 +59,8 @@ std::pair<uint16_t,int> rowShiftLeft(uint16_t row) {
     // Combine
     for (int i{1}; i < 4; ++i) {
         if (r[i] != 0 && r[i] == r[i-1]) {
-            score += tile_score_lookup[r[i-1]];
             r[i-1] += 1;
+            score += tile_score_lookup[r[i-1]]; // the merge scores the value of the new tile
             r[i] = 0;
         }
     }
@@ -76,13 +78,32 @@ std::pair<uint16_t,int> rowShiftLeft(uint16_t row) {
     );
 }
 
+uint8_t nthEmptyCell(uint8_t empty_mask, uint32_t n) {
+    for (; n > 0; --n) {
+        empty_mask &= empty_mask - 1; // drop the lowest empty cell
+    }
+    return std::countr_zero(empty_mask);
+}
+
 std::array<RowEntry, MOVE_COUNT> generateLookupTable() {
     // Too many loop iterations to be done at compile time
     std::array<RowEntry, MOVE_COUNT> lookup_table;
     for (uint32_t i{0}; i < MOVE_COUNT; ++i) {
         auto [result, score_delta] = rowShiftLeft(i);
-        lookup_table[i].result = result;
-        lookup_table[i].score = score_delta;
+        auto cells = unpackRow(i);
+        RowEntry& entry = lookup_table[i];
+        entry.result = result;
+        entry.score = score_delta;
+        entry.can_move_left = result != i;
+        entry.can_move_right = reverseRow(rowShiftLeft(reverseRow(i)).first) != i;
+        entry.empty_count = 0;
+        entry.empty_mask = 0;
+        entry.max_tile = 0;
+        for (uint8_t j{0}; j < 4; ++j) {
+            entry.empty_count += cells[j] == 0;
+            entry.empty_mask |= (cells[j] == 0) << j;
+            entry.max_tile = std::max(entry.max_tile, cells[j]);
+        }
     }
     return lookup_table;
 };
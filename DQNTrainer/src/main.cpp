@@ -2,6 +2,8 @@
 
 #include <chrono>
 #include <csignal>
+#include <iostream>
+#include <string>
 #include <thread>
 
 std::atomic<bool> simulation_running = true;
@@ -19,13 +21,27 @@ int main(int argc, char** argv) {
     if (argc > 1) {
         process_count = std::stoi(argv[1]);
     }
+    Transport transport = Transport::Queue;
+    for (int i{2}; i < argc; ++i) {
+        std::string arg(argv[i]);
+        if (arg == "--transport=queue") {
+            transport = Transport::Queue;
+        } else if (arg == "--transport=slab") {
+            transport = Transport::Slab;
+        } else if (arg == "--transport=lockfree") {
+            transport = Transport::LockFree;
+        } else {
+            std::cerr << "error: unrecognized argument " << arg << ", valid options: --transport=queue (default), --transport=slab, --transport=lockfree\n";
+            return 1;
+        }
+    }
     std::signal(SIGINT, signal_handler);
     std::signal(SIGTERM, signal_handler);
     std::signal(SIGQUIT, signal_handler);
 
 	bip::shared_memory_object::remove(SHARED_MEMORY_NAME); // in case of hanging shared memory
 
-    SimulationManager manager(process_count, true);
+    SimulationManager manager(process_count, true, transport);
     global_manager = &manager;
     manager.startSimulation();
     while (simulation_running.load()) { 
@@ -10,10 +10,11 @@
 #include "look_up_table.hpp"
 #include "shared_memory_structures.hpp"
 
-SimulationManager::SimulationManager(uint8_t process_count, bool logging) :
+SimulationManager::SimulationManager(uint8_t process_count, bool logging, Transport transport) :
 	process_count(process_count),
-	shm(bip::create_only, SHARED_MEMORY_NAME, 1 << 20),
-	logging(logging) {}
+	shm(bip::create_only, SHARED_MEMORY_NAME, 1 << 21), // the move table takes 768KB
+	logging(logging),
+	transport(transport) {}
 
 SimulationManager::~SimulationManager() {
 	bip::shared_memory_object::remove(SHARED_MEMORY_NAME);
@@ -91,10 +92,13 @@ void SimulationManager::kill() {
 }
 
 void SimulationManager::populateSharedMemory() {
-	control_flags  = shm.construct<ProcessControlFlags>(CONTROL_FLAGS_NAME)(process_count);
+	control_flags  = shm.construct<ProcessControlFlags>(CONTROL_FLAGS_NAME)(process_count, transport);
 	message_buffer = shm.construct<Message>(MESSAGE_BUFFER_NAME)[std::bit_ceil(process_count+1u)]();
 	message_queue = shm.construct<LockQueue<Message>>(MESSAGE_QUEUE_NAME)(std::bit_ceil(process_count+1u));
+	lock_free_buffer = shm.construct<LockFreeQueue<Message>::Slot>(LOCK_FREE_BUFFER_NAME)[std::bit_ceil(process_count+1u)]();
+	lock_free_queue = construct_aligned<LockFreeQueue<Message>>(shm, LOCK_FREE_QUEUE_NAME, std::bit_ceil(process_count+1u), lock_free_buffer);
 	DQN_move_array = shm.construct<ResponseCell>(DQN_MOVE_ARRAY_NAME)[process_count]();
+	env_slab = construct_aligned<EnvSlab>(shm, ENV_SLAB_NAME);
 	auto look_up_table = generateLookupTable();
 	move_lookup_table = shm.construct<RowEntry>(MOVE_LOOKUP_TABLE_NAME)[MOVE_COUNT]();
 	memcpy(move_lookup_table, look_up_table.data(), sizeof(look_up_table));
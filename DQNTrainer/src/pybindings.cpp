@@ -4,6 +4,7 @@
 #include <pybind11/pybind11.h>
 #include <pybind11/stl.h>
 #include <stdexcept>
+#include "lock_free_queue.hpp"
 #include "lock_queue.hpp"
 #include "shared_memory_structures.hpp"
 
@@ -23,8 +24,14 @@ struct PySharedMemoryInterface {
         if (!message_buffer) { throw std::runtime_error("Couldn't find message buffer"); }
         message_queue = shm.find<LockQueue<Message>>(MESSAGE_QUEUE_NAME).first;
         if (!message_queue) { throw std::runtime_error("Couldn't find message buffer"); }
+        lock_free_buffer = shm.find<LockFreeQueue<Message>::Slot>(LOCK_FREE_BUFFER_NAME).first;
+        if (!lock_free_buffer) { throw std::runtime_error("Couldn't find lock-free buffer"); }
+        lock_free_queue = find_aligned<LockFreeQueue<Message>>(shm, LOCK_FREE_QUEUE_NAME);
+        if (!lock_free_queue) { throw std::runtime_error("Couldn't find lock-free queue"); }
         move_array= shm.find<ResponseCell>(DQN_MOVE_ARRAY_NAME).first;
         if (!move_array) { throw std::runtime_error("Couldn't find move array"); }
+        env_slab = find_aligned<EnvSlab>(shm, ENV_SLAB_NAME);
+        if (!env_slab) { throw std::runtime_error("Couldn't find env slab"); }
         process_count = control_flags->process_count;
         control_flags->DQN_connected = true;
         control_flags->cond.notify_all();
@@ -34,16 +41,24 @@ struct PySharedMemoryInterface {
     uint8_t process_count;
     Message* message_buffer; // pass to message queue because of shared memory nonsense
     LockQueue<Message>* message_queue; // pass to message queue because of shared memory nonsense
+    LockFreeQueue<Message>::Slot* lock_free_buffer;
+    LockFreeQueue<Message>* lock_free_queue;
     ResponseCell* move_array;
+    EnvSlab* env_slab;
 
     std::optional<Message> getMessage() {
+        if (control_flags->transport == Transport::LockFree) {
+            return lock_free_queue->pop(lock_free_buffer);
+        }
         return message_queue->pop(message_buffer);
     }
 
     // NOTE: Returns a RAW MEMORY BUFFER, must be cast in Python using a NumPy dtype
     py::array_t<char> getMessageBatch() {
         static constexpr auto size = sizeof(Message);
-        auto vec = message_queue->popBatch(message_buffer);
+        auto vec = control_flags->transport == Transport::LockFree
+            ? lock_free_queue->popBatch(lock_free_buffer)
+            : message_queue->popBatch(message_buffer);
         return py::array_t<char>(
             vec.size()*size,
             reinterpret_cast<char*>(vec.data())
@@ -53,19 +68,74 @@ struct PySharedMemoryInterface {
     void putResponse(int id, Move move) {
         write_slot(&move_array[id], move);
     }
+
+    // Sends every positive action to its environment and negates it in place to mark it as sent
+    void putResponses(py::array_t<int32_t, py::array::c_style> actions) {
+        if (actions.ndim() != 1 || actions.shape(0) > process_count) {
+            throw std::invalid_argument("actions must be a 1-d array with at most one action per environment");
+        }
+        auto a = actions.mutable_unchecked<1>();
+        for (py::ssize_t i{0}; i < a.shape(0); ++i) {
+            if (a(i) > 0) {
+                write_slot(&move_array[i], static_cast<Move>(a(i)));
+                a(i) = -a(i);
+            }
+        }
+    }
+
+    // Writes the ids of every environment with a new message in the slab into ids, returns how many were written
+    // The slab entries of those ids are valid until their next action is sent
+    size_t takeReady(py::array_t<uint8_t, py::array::c_style> ids) {
+        if (ids.ndim() != 1 || ids.shape(0) < process_count) {
+            throw std::invalid_argument("ids must be a 1-d array with room for every environment");
+        }
+        return take_ready(env_slab, ids.mutable_data(), process_count);
+    }
 };
 
+// NumPy view over one of the slab arrays, owner keeps the interface and its shared memory mapping alive
+template<typename T>
+py::array_t<T> slabView(py::object owner, T* data) {
+    auto& self = owner.cast<PySharedMemoryInterface&>();
+    py::array_t<T> view({static_cast<py::ssize_t>(self.process_count)}, {static_cast<py::ssize_t>(sizeof(T))}, data, owner);
+    view.attr("setflags")(py::arg("write") = false);
+    return view;
+}
+
 PYBIND11_MODULE(PySharedMemoryInterface, m) {
     py::class_<PySharedMemoryInterface>(m, "SharedMemoryInterface")
         .def(py::init<>())
         .def("getMessage", &PySharedMemoryInterface::getMessage)
         .def("getMessageBatch", &PySharedMemoryInterface::getMessageBatch)
-        .def("putResponse", &PySharedMemoryInterface::putResponse);
+        .def("putResponse", &PySharedMemoryInterface::putResponse)
+        .def("putResponses", &PySharedMemoryInterface::putResponses, py::arg("actions").noconvert())
+        .def("takeReady", &PySharedMemoryInterface::takeReady, py::arg("ids").noconvert())
+        .def_property_readonly("transport", [](const PySharedMemoryInterface& self) {
+            return self.control_flags->transport;
+        })
+        .def_property_readonly("boards", [](py::object self) {
+            return slabView(self, self.cast<PySharedMemoryInterface&>().env_slab->boards);
+        })
+        .def_property_readonly("moves", [](py::object self) {
+            return slabView(self, self.cast<PySharedMemoryInterface&>().env_slab->moves);
+        })
+        .def_property_readonly("rewards", [](py::object self) {
+            return slabView(self, self.cast<PySharedMemoryInterface&>().env_slab->rewards);
+        })
+        .def_property_readonly("scores", [](py::object self) {
+            return slabView(self, self.cast<PySharedMemoryInterface&>().env_slab->scores);
+        });
+
+    py::enum_<Transport>(m, "Transport")
+        .value("Queue", Transport::Queue)
+        .value("Slab", Transport::Slab)
+        .value("LockFree", Transport::LockFree);
 
     py::class_<Message>(m,"Message")
         .def(py::init<>())
         .def_readwrite("id", &Message::id)
         .def_readwrite("board", &Message::board)
         .def_readwrite("moves", &Message::moves)
-        .def_readwrite("reward", &Message::reward);
+        .def_readwrite("reward", &Message::reward)
+        .def_readwrite("score", &Message::score);
 };
\ No newline at end of file
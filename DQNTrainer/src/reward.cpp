@@ -0,0 +1,58 @@
+#include "reward.hpp"
+
+#include <algorithm>
+#include <cmath>
+#include <vector>
+
+#include "look_up_table.hpp"
+
+const RowFeatures* rowFeatures() {
+    static const std::vector<RowFeatures> features = [] {
+        std::vector<RowFeatures> table(MOVE_COUNT);
+        for (uint32_t row{0}; row < MOVE_COUNT; ++row) {
+            auto cells = unpackRow(static_cast<uint16_t>(row));
+            RowFeatures& f = table[row];
+            f = {0, 0, std::max(cells[0], cells[3])};
+            for (auto v : cells) {
+                f.empty += v == 0;
+                f.max_tile = std::max(f.max_tile, v);
+            }
+        }
+        return table;
+    }();
+    return features.data();
+}
+
+RewardKernel::RewardKernel(const RewardSpec& spec) : spec(spec), features(rowFeatures()) {
+    for (int v{0}; v < 16; ++v) {
+        max_tile_terms[v] = spec.max_tile_scale * std::log2(static_cast<double>(std::max(v, 1)));
+    }
+}
+
+double RewardKernel::operator()(const std::array<uint16_t,4>& board, int64_t gained, bool terminated) const {
+    int64_t empty = 0;
+    uint8_t largest = 0;
+    for (int i{0}; i < 4; ++i) {
+        const RowFeatures& f = features[board[i]];
+        empty += f.empty;
+        largest = std::max(largest, f.max_tile);
+    }
+    bool in_corner = std::max(features[board[0]].corner_max, features[board[3]].corner_max) == largest;
+
+    double reward = spec.score_scale * std::log2(1.0 + static_cast<double>(std::max<int64_t>(gained, 0)));
+    reward += max_tile_terms[largest];
+    reward += spec.corner_scale * in_corner;
+    reward += spec.empty_scale * static_cast<double>(empty);
+    reward -= spec.terminal_scale * terminated;
+    return reward;
+}
+
+double RewardKernel::operator()(uint64_t board, int64_t gained, bool terminated) const {
+    auto rows = [](uint64_t b) {
+        return std::array<uint16_t,4>{
+            static_cast<uint16_t>(b >> 48), static_cast<uint16_t>(b >> 32),
+            static_cast<uint16_t>(b >> 16), static_cast<uint16_t>(b)
+        };
+    };
+    return (*this)(rows(board), gained, terminated);
+}
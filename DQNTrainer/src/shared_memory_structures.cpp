@@ -1,14 +1,47 @@
 #include "shared_memory_structures.hpp"
 
+#include <bit>
+
 void write_slot(ResponseCell *s, uint8_t move) {
-    s->ready.store(0, std::memory_order_release);
     s->move = move;
-    s->ready.store(1, std::memory_order_release);
+    s->ready.store(1, std::memory_order_seq_cst);
+    if (s->waiting.load(std::memory_order_seq_cst)) {
+        futex_wake(&s->ready, 1);
+    }
 }
 uint8_t wait_read_slot(ResponseCell *s) {
-    while (s->ready.load(std::memory_order_acquire) == 0) {}
+    for (int i{0}; s->ready.load(std::memory_order_acquire) == 0; ++i) {
+        if (i < spin_limit()) {
+            cpu_relax();
+            continue;
+        }
+        s->waiting.store(1, std::memory_order_seq_cst);
+        if (s->ready.load(std::memory_order_seq_cst) == 0) {
+            futex_wait(&s->ready, 0);
+        }
+        s->waiting.store(0, std::memory_order_relaxed);
+    }
     uint8_t val = s->move;
-    s->ready.store(0);
+    s->ready.store(0, std::memory_order_release);
 
-    return s->move;
+    return val;
+}
+
+void publish_slot(EnvSlab *slab, const Message& msg) {
+    slab->boards[msg.id] = msg.board;
+    slab->moves[msg.id] = msg.moves;
+    slab->rewards[msg.id] = msg.reward;
+    slab->scores[msg.id] = msg.score;
+    slab->ready[msg.id / 64].fetch_or(uint64_t{1} << (msg.id % 64), std::memory_order_release);
+}
+size_t take_ready(EnvSlab *slab, uint8_t *ids, size_t env_count) {
+    size_t count = 0;
+    for (size_t word{0}; word * 64 < env_count; ++word) {
+        uint64_t bits = slab->ready[word].exchange(0, std::memory_order_acquire);
+        while (bits) {
+            ids[count++] = static_cast<uint8_t>(word * 64 + std::countr_zero(bits));
+            bits &= bits - 1;
+        }
+    }
+    return count;
 }
\ No newline at end of file
@@ -1,7 +1,6 @@
 #include "simulator.hpp"
 #include "look_up_table.hpp"
 #include <bitset>
-#include <cmath>
 #include <cstdint>
 #include <cstring>
 #include <iostream>
@@ -12,10 +11,15 @@ constexpr uint8_t UP     = 0b00000100;
 constexpr uint8_t DOWN   = 0b00001000;
 constexpr uint8_t NOMOVE = 0b00010000;
 
-Simulator::Simulator(uint8_t id, uint32_t rng_seed, const RowEntry* MOVE_TABLE) : id(id), rng(rng_seed), MOVE_TABLE(MOVE_TABLE) {
-    std::cout << "Initializing simulator!\n";
+Simulator::Simulator(uint8_t id, uint32_t rng_seed, const RowEntry* MOVE_TABLE, bool verbose, const RewardSpec& reward_spec) :
+    id(id), rng(rng_seed), MOVE_TABLE(MOVE_TABLE), reward_kernel(reward_spec) {
+    if (verbose) {
+        std::cout << "Initializing simulator!\n";
+    }
     init();
-    std::cout << "Sim ready!\n";
+    if (verbose) {
+        std::cout << "Sim ready!\n";
+    }
 }
 Move Simulator::makeMove(Move move) {
     // std::cout << "Received move: " << std::bitset<5>(move) << '\n';
@@ -40,48 +44,50 @@ int Simulator::getScore() const {
 
 void Simulator::moveRight() {
     for (auto& row : board) {
-        row = reverseRow(MOVE_TABLE[reverseRow(row)].result);
-        // score += MOVE_TABLE[row].score;
+        const RowEntry& entry = MOVE_TABLE[reverseRow(row)];
+        score += entry.score;
+        row = reverseRow(entry.result);
     }
 }
 void Simulator::moveDown() {
     board = transposeBoard(board);
     for (auto& row : board) {
-        row = reverseRow(MOVE_TABLE[reverseRow(row)].result);
-        // score += MOVE_TABLE[row].score;
+        const RowEntry& entry = MOVE_TABLE[reverseRow(row)];
+        score += entry.score;
+        row = reverseRow(entry.result);
     }
     board = transposeBoard(board);
 }
 void Simulator::moveLeft() {
     for (auto& row : board) {
+        score += MOVE_TABLE[row].score;
         row = MOVE_TABLE[row].result;
-        // score += MOVE_TABLE[row].score;
     }
 }
 void Simulator::moveUp() {
     board = transposeBoard(board);
     for (auto& row : board) {
+        score += MOVE_TABLE[row].score;
         row = MOVE_TABLE[row].result;
-        // score += MOVE_TABLE[row].score;
     }
     board = transposeBoard(board);
 }
 
 void Simulator::generateRandomTile() {
-    uint8_t empty[16];
     uint32_t count{0};
-    for (uint8_t i{0}; i < 4; ++i) {
-        for (uint8_t j{0}; j < 4; ++j) {
-            uint8_t cell = ((board[i] >> 4*(3-j)) & (0x000F)) == 0; 
-            empty[count] = (i << 4) | (j & 0x0F); // MS four bits row, LS four bits col
-            count += cell; // only advance when finding an empty tile
-        }
+    for (const auto& row : board) {
+        count += MOVE_TABLE[row].empty_count;
     }
     auto ind = rng.nextUInt(count);
     int rng_roll = rng.nextUInt(10);
     auto val = 1 << (int)(rng_roll == 9);
-    uint8_t row = ((empty[ind]>>4) & 0x0F); 
-    uint8_t col = (empty[ind]&0x0F);
+    // walk the rows to the one holding the ind-th empty cell, cells are counted row-major
+    uint8_t row{0};
+    while (row < 3 && ind >= MOVE_TABLE[board[row]].empty_count) {
+        ind -= MOVE_TABLE[board[row]].empty_count;
+        ++row;
+    }
+    uint8_t col = nthEmptyCell(MOVE_TABLE[board[row]].empty_mask, ind);
     board[row] |= (val << ((3-col) * 4)); 
 }
 
@@ -124,33 +130,16 @@ std::array<uint8_t,16> Simulator::convertBoardToUnpacked(const std::array<uint16
     }
     return converted;
 }
-bool Simulator::rowCanMoveLeft(uint16_t row) const {
-    uint8_t t0 = (row >> 12) & 0xF;
-    uint8_t t1 = (row >> 8) & 0xF;
-    uint8_t t2 = (row >> 4) & 0xF;
-    uint8_t t3 = (row >> 0) & 0xF;
-
-    return ((t0 == 0 && (t1|t2|t3)) |
-            (t1 == 0 && (t2|t3)) |
-            (t2 == 0 && t3) |
-            (t0 && t0 == t1) |
-            (t1 && t1 == t2) |
-            (t2 && t2 == t3));
-}
 Move Simulator::getValidMoves() const {
     Move valid_moves = 0;
     for (const auto& row : board) {
-        // left
-        valid_moves |= rowCanMoveLeft(row) << 0;
-        // right
-        valid_moves |= rowCanMoveLeft(reverseRow(row)) << 1;
+        valid_moves |= MOVE_TABLE[row].can_move_left << 0;
+        valid_moves |= MOVE_TABLE[row].can_move_right << 1;
     }
     auto temp = transposeBoard(board);
     for (const auto& row : temp) {
-        // up
-        valid_moves |= rowCanMoveLeft(row) << 2;
-        // down
-        valid_moves |= rowCanMoveLeft(reverseRow(row)) << 3;
+        valid_moves |= MOVE_TABLE[row].can_move_left << 2;
+        valid_moves |= MOVE_TABLE[row].can_move_right << 3;
     }
     // return moves or no moves flag if no available moves
     return valid_moves + ((valid_moves == 0) * 0b00010000);
@@ -160,41 +149,11 @@ Message Simulator::generateMessage() const {
         id,
         convertBoardToPacked(board),
         current_moves,
-        getReward()
+        getReward(),
+        score
     };
 }
 
 double Simulator::getReward() const {
-    // Slightly less naive reward function, now rewards total board value, empty cells, largest tile, and keeping largest tile in corners
-    double reward = 0.0; 
-    int score_delta = 0;
-    int empty_cells = 0;
-    
-    auto curr_board = convertBoardToUnpacked(board); 
-    auto prv_board = convertBoardToUnpacked(prev_board); 
-    uint8_t max_tile = 0;
-    uint8_t max_tile_ind = 0;
-    for(int i{0}; i < 16; ++i) {
-        auto curr = curr_board[i];
-        auto prev = prv_board[i];
-        score_delta += tile_score_lookup[curr]-tile_score_lookup[prev];
-        
-        if(curr == 0) { empty_cells++; };
-        if (curr > max_tile) {
-            max_tile = curr;
-            max_tile_ind = i;
-        } else if (curr == max_tile) {
-            if (i == 0 || i == 3 || i == 15 || i == 12) {
-                max_tile_ind = i;
-            }
-        }
-    }
-    reward += static_cast<double>(score_delta) / 1024.0;
-    reward += 0.1*empty_cells; // reward keeping empty space
-    reward += 0.2*(std::log2(max_tile)/11.0);    // reward having a large tile
-    if (max_tile_ind == 0 || max_tile_ind == 3 || max_tile_ind == 15 || max_tile_ind == 12) {
-        reward += 0.2;
-    }
-
-    return reward;
+    return reward_kernel(board, score - prev_score, current_moves == NOMOVE);
 }
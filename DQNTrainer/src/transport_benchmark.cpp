@@ -0,0 +1,152 @@
+// Round-trip benchmark of the worker -> DQN message queues
+// Every worker thread pushes a message and waits on its ResponseCell, the consumer thread drains the queue and
+// answers each message, the same hand-off Worker::simulate and the DQN do, minus the simulation and the model
+// All structures live in a shared memory segment so the process-shared mutex and futex paths are the ones measured
+#include <algorithm>
+#include <bit>
+#include <chrono>
+#include <cstdint>
+#include <iomanip>
+#include <iostream>
+#include <numeric>
+#include <string>
+#include <thread>
+#include <vector>
+
+#include <boost/interprocess/managed_shared_memory.hpp>
+
+#include "lock_free_queue.hpp"
+#include "lock_queue.hpp"
+#include "shared_memory_structures.hpp"
+#include "wait_strategy.hpp"
+
+namespace bip = boost::interprocess;
+using Clock = std::chrono::steady_clock;
+
+constexpr char BENCHMARK_MEMORY_NAME[] = "proj2048bench";
+constexpr size_t BENCHMARK_MEMORY_SIZE = 1 << 22;
+
+struct BenchmarkResult {
+    double messages_per_sec;
+    double mean_us;
+    double p50_us;
+    double p99_us;
+};
+
+// Mutex queue, the consumer polls it the way the DQN does and yields when it is empty
+struct MutexTransport {
+    static constexpr const char* name = "mutex";
+    MutexTransport(bip::managed_shared_memory& shm, size_t cap) :
+        buffer(shm.construct<Message>(bip::anonymous_instance)[cap]()),
+        queue(shm.construct<LockQueue<Message>>(bip::anonymous_instance)(cap)) {}
+    Message* buffer;
+    LockQueue<Message>* queue;
+
+    void push(const Message& msg) { queue->push(buffer, msg); }
+    std::vector<Message> popBatch() {
+        auto batch = queue->popBatch(buffer);
+        if (batch.empty()) { std::this_thread::yield(); }
+        return batch;
+    }
+};
+
+// Lock-free queue, the consumer spins and then sleeps on the queue's futex when it is empty
+struct LockFreeTransport {
+    static constexpr const char* name = "lockfree";
+    LockFreeTransport(bip::managed_shared_memory& shm, size_t cap) :
+        buffer(shm.construct<LockFreeQueue<Message>::Slot>(bip::anonymous_instance)[cap]()),
+        queue(construct_aligned<LockFreeQueue<Message>>(shm, bip::anonymous_instance, cap, buffer)) {}
+    LockFreeQueue<Message>::Slot* buffer;
+    LockFreeQueue<Message>* queue;
+
+    void push(const Message& msg) {
+        while (!queue->push(buffer, msg)) { cpu_relax(); }
+    }
+    std::vector<Message> popBatch() {
+        queue->waitNonEmpty(buffer);
+        return queue->popBatch(buffer);
+    }
+};
+
+template<typename TransportT>
+BenchmarkResult run_benchmark(size_t worker_count, size_t round_trips) {
+    bip::shared_memory_object::remove(BENCHMARK_MEMORY_NAME);
+    BenchmarkResult result{};
+    {
+        bip::managed_shared_memory shm(bip::create_only, BENCHMARK_MEMORY_NAME, BENCHMARK_MEMORY_SIZE);
+        // same sizing as the manager, room for one message per worker
+        TransportT transport(shm, std::bit_ceil(worker_count + 1));
+        ResponseCell* cells = shm.construct<ResponseCell>(bip::anonymous_instance)[worker_count]();
+        std::vector<std::vector<uint32_t>> latencies(worker_count, std::vector<uint32_t>(round_trips));
+
+        auto start = Clock::now();
+        {
+            std::vector<std::jthread> workers;
+            workers.reserve(worker_count);
+            for (size_t id{0}; id < worker_count; ++id) {
+                workers.emplace_back([&, id] {
+                    Message msg{static_cast<uint8_t>(id), id, 0b1111, 0.0};
+                    for (size_t i{0}; i < round_trips; ++i) {
+                        auto sent = Clock::now();
+                        transport.push(msg);
+                        msg.board += wait_read_slot(&cells[id]);
+                        latencies[id][i] = static_cast<uint32_t>(
+                            std::chrono::duration_cast<std::chrono::nanoseconds>(Clock::now() - sent).count());
+                    }
+                });
+            }
+            for (size_t answered{0}; answered < worker_count * round_trips;) {
+                for (const auto& msg : transport.popBatch()) {
+                    write_slot(&cells[msg.id], 1);
+                    ++answered;
+                }
+            }
+        }
+        double elapsed = std::chrono::duration<double>(Clock::now() - start).count();
+
+        std::vector<uint32_t> all;
+        all.reserve(worker_count * round_trips);
+        for (const auto& l : latencies) { all.insert(all.end(), l.begin(), l.end()); }
+        std::sort(all.begin(), all.end());
+        result.messages_per_sec = all.size() / elapsed;
+        result.mean_us = std::accumulate(all.begin(), all.end(), 0.0) / all.size() / 1000.0;
+        result.p50_us = all[all.size() / 2] / 1000.0;
+        result.p99_us = all[std::min(all.size() - 1, all.size() * 99 / 100)] / 1000.0;
+    }
+    bip::shared_memory_object::remove(BENCHMARK_MEMORY_NAME);
+    return result;
+}
+
+template<typename TransportT>
+void report(size_t worker_count, size_t round_trips) {
+    auto r = run_benchmark<TransportT>(worker_count, round_trips);
+    std::cout << std::left << std::setw(10) << TransportT::name
+              << std::right << std::setw(8) << worker_count
+              << std::setw(14) << static_cast<uint64_t>(r.messages_per_sec)
+              << std::setw(12) << r.mean_us
+              << std::setw(12) << r.p50_us
+              << std::setw(12) << r.p99_us << std::endl;
+}
+
+int main(int argc, char** argv) {
+    // usage: TransportBenchmark [round trips per worker] [max workers]
+    size_t round_trips = argc > 1 ? std::stoul(argv[1]) : 2000;
+    size_t max_workers = argc > 2 ? std::stoul(argv[2]) : EnvSlab::MAX_ENVS;
+    if (round_trips == 0 || max_workers == 0 || max_workers > EnvSlab::MAX_ENVS) {
+        std::cerr << "error: round trips must be positive and max workers in [1, " << EnvSlab::MAX_ENVS << "]\n";
+        return 1;
+    }
+
+    std::cout << std::fixed << std::setprecision(2);
+    std::cout << std::left << std::setw(10) << "transport"
+              << std::right << std::setw(8) << "workers"
+              << std::setw(14) << "msgs/sec"
+              << std::setw(12) << "mean us"
+              << std::setw(12) << "p50 us"
+              << std::setw(12) << "p99 us" << std::endl;
+    for (size_t workers{1}; workers <= max_workers; workers *= 2) {
+        report<MutexTransport>(workers, round_trips);
+        report<LockFreeTransport>(workers, round_trips);
+    }
+    return 0;
+}
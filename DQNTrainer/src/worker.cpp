@@ -17,7 +17,10 @@ Worker::Worker(
     control_flags(shm_structures.pcf),
     message_buffer(shm_structures.mb),
     message_queue(shm_structures.mq),
-    DQN_move_array(shm_structures.mva) {
+    lock_free_buffer(shm_structures.lfb),
+    lock_free_queue(shm_structures.lfq),
+    DQN_move_array(shm_structures.mva),
+    env_slab(shm_structures.es) {
         bip::scoped_lock<bip::interprocess_mutex> lock(control_flags->mtx);
         while (!control_flags->manager_ready) {
             control_flags->cond.wait(lock, [this]{ return control_flags->workers_ready; });
@@ -51,7 +54,17 @@ void Worker::simulate() {
     for (;;) {
         // queue will always have at least as many spaces, processes can only take one queue space at a time, thus this should never fail
         auto msg = simulator.generateMessage();
-        while (!message_queue->push(message_buffer, msg)) {} // spin-lock on attempting to push
+        switch (control_flags->transport) {
+            case Transport::Slab: { publish_slot(env_slab, msg); break; }
+            case Transport::LockFree: {
+                while (!lock_free_queue->push(lock_free_buffer, msg)) { cpu_relax(); }
+                break;
+            }
+            case Transport::Queue: {
+                while (!message_queue->push(message_buffer, msg)) {} // spin-lock on attempting to push
+                break;
+            }
+        }
         Move curr_move = wait_read_slot(&DQN_move_array[id]);
         simulator.makeMove(curr_move);
     }
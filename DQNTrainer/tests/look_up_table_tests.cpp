@@ -1,5 +1,6 @@
 #define DOCTEST_CONFIG_IMPLEMENT_WITH_MAIN
 #include <algorithm>
+#include <bit>
 #include <doctest/doctest.h>
 #include "look_up_table.hpp"
 
@@ -158,3 +159,41 @@ TEST_CASE("Slide left table lookup") {
     CHECK(MOVE_TABLE[0x1102].result == (4));
     CHECK(MOVE_TABLE[0x1221].result == (8));
 }
+
+TEST_CASE("Row features") {
+    auto MOVE_TABLE = generateLookupTable();
+    CHECK(MOVE_TABLE[0x0000].can_move_left == false);
+    CHECK(MOVE_TABLE[0x0000].can_move_right == false);
+    CHECK(MOVE_TABLE[0x0000].empty_count == 4);
+    CHECK(MOVE_TABLE[0x0000].empty_mask == 0b1111);
+    CHECK(MOVE_TABLE[0x0000].max_tile == 0);
+
+    // packed against one side only moves the other way
+    CHECK(MOVE_TABLE[0x1200].can_move_left == false);
+    CHECK(MOVE_TABLE[0x1200].can_move_right == true);
+    CHECK(MOVE_TABLE[0x0012].can_move_left == true);
+    CHECK(MOVE_TABLE[0x0012].can_move_right == false);
+    // a merge moves both ways
+    CHECK(MOVE_TABLE[0x1123].can_move_left == true);
+    CHECK(MOVE_TABLE[0x1123].can_move_right == true);
+    CHECK(MOVE_TABLE[0x1234].can_move_left == false);
+    CHECK(MOVE_TABLE[0x1234].can_move_right == false);
+
+    CHECK(MOVE_TABLE[0x1030].empty_count == 2);
+    CHECK(MOVE_TABLE[0x1030].empty_mask == 0b1010);
+    CHECK(MOVE_TABLE[0x1030].max_tile == 3);
+    CHECK(MOVE_TABLE[0xF000].max_tile == 15);
+
+    for (uint32_t row{0}; row < MOVE_COUNT; ++row) {
+        CHECK(MOVE_TABLE[row].can_move_left == (rowShiftLeft(row).first != row));
+        CHECK(MOVE_TABLE[row].empty_count == std::popcount(MOVE_TABLE[row].empty_mask));
+    }
+}
+
+TEST_CASE("Empty cell selection") {
+    CHECK(nthEmptyCell(0b1111, 0) == 0);
+    CHECK(nthEmptyCell(0b1111, 3) == 3);
+    CHECK(nthEmptyCell(0b1010, 0) == 1);
+    CHECK(nthEmptyCell(0b1010, 1) == 3);
+    CHECK(nthEmptyCell(0b0100, 0) == 2);
+}
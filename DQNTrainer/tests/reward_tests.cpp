@@ -0,0 +1,71 @@
+#define DOCTEST_CONFIG_IMPLEMENT_WITH_MAIN
+#include <array>
+#include <cmath>
+#include <doctest/doctest.h>
+#include "look_up_table.hpp"
+#include "reward.hpp"
+
+// Tests
+TEST_CASE("Row features") {
+    auto features = rowFeatures();
+    CHECK(features[0x0000].empty == 4);
+    CHECK(features[0x0000].max_tile == 0);
+
+    CHECK(features[packRow({3,2,1,0})].empty == 1);
+    CHECK(features[packRow({3,2,1,0})].max_tile == 3);
+
+    CHECK(features[packRow({1,5,4,2})].corner_max == 2);
+    CHECK(features[packRow({6,5,4,2})].corner_max == 6);
+};
+
+TEST_CASE("Reward terms") {
+    RewardSpec only_empty{0.0, 0.0, 0.0, 1.0, 0.0};
+    std::array<uint16_t,4> board = {packRow({1,0,0,0}), 0, 0, 0};
+    CHECK(RewardKernel(only_empty)(board, 0, false) == doctest::Approx(15.0));
+
+    RewardSpec only_score{1.0, 0.0, 0.0, 0.0, 0.0};
+    std::array<uint16_t,4> next = {packRow({2,0,0,0}), 0, 0, 0};
+    CHECK(RewardKernel(only_score)(next, 4, false) == doctest::Approx(std::log2(5.0)));
+    CHECK(RewardKernel(only_score)(next, -4, false) == doctest::Approx(0.0)); // never negative
+
+    RewardSpec only_corner{0.0, 0.0, 1.0, 0.0, 0.0};
+    std::array<uint16_t,4> corner = {0, 0, 0, packRow({0,0,0,5})};
+    std::array<uint16_t,4> middle = {0, packRow({0,5,0,0}), 0, packRow({0,0,0,4})};
+    CHECK(RewardKernel(only_corner)(corner, 0, false) == doctest::Approx(1.0));
+    CHECK(RewardKernel(only_corner)(middle, 0, false) == doctest::Approx(0.0));
+
+    RewardSpec only_terminal{0.0, 0.0, 0.0, 0.0, 5.0};
+    CHECK(RewardKernel(only_terminal)(board, 0, true) == doctest::Approx(-5.0));
+};
+
+TEST_CASE("Spawned tile does not count as merge score") {
+    auto table = generateLookupTable();
+    RewardKernel kernel;
+    // sliding left merges nothing, then a 2 or a 4 spawns in the same cell
+    std::array<uint16_t,4> prev = {packRow({0,3,0,0}), packRow({0,0,1,0}), 0, 0};
+    std::array<uint16_t,4> moved{};
+    int64_t gained = 0;
+    for (int i{0}; i < 4; ++i) {
+        moved[i] = table[prev[i]].result;
+        gained += table[prev[i]].score;
+    }
+    CHECK(gained == 0);
+    auto spawned_2 = moved, spawned_4 = moved;
+    spawned_2[3] = packRow({0,0,0,1});
+    spawned_4[3] = packRow({0,0,0,2});
+    CHECK(kernel(spawned_2, gained, false) == kernel(spawned_4, gained, false));
+
+    // merging two 2s scores the 4 it builds
+    auto [merged, score] = rowShiftLeft(packRow({1,1,0,0}));
+    CHECK(merged == packRow({2,0,0,0}));
+    CHECK(score == 4);
+};
+
+TEST_CASE("Packed and row boards agree") {
+    RewardKernel kernel;
+    std::array<uint16_t,4> next = {packRow({2,0,0,0}), packRow({3,2,0,0}), 0, packRow({4,1,0,1})};
+    auto pack = [](const std::array<uint16_t,4>& b) {
+        return (uint64_t(b[0]) << 48) | (uint64_t(b[1]) << 32) | (uint64_t(b[2]) << 16) | uint64_t(b[3]);
+    };
+    CHECK(kernel(next, 4, false) == kernel(pack(next), 4, false));
+};
@@ -1,9 +1,28 @@
 #define DOCTEST_CONFIG_IMPLEMENT_WITH_MAIN
+#include <bit>
 #include <doctest/doctest.h>
 #include "simulator.hpp"
 
 // Tests
 TEST_CASE("rowCanMoveLeft") {
-    Simulator test(1,1,nullptr);
+    auto MOVE_TABLE = generateLookupTable();
+    Simulator test(1,1,MOVE_TABLE.data(),false);
     // CHECK(test.rowCanMoveLeft(0b0010000100000000) == false);
-};
\ No newline at end of file
+};
+
+TEST_CASE("Fresh board") {
+    auto MOVE_TABLE = generateLookupTable();
+    for (uint32_t seed{1}; seed < 64; ++seed) {
+        Simulator test(1,seed,MOVE_TABLE.data(),false);
+        auto cells = test.convertCurrentBoardToUnpacked();
+        int tiles{0};
+        for (auto v : cells) {
+            tiles += v != 0;
+            CHECK(v <= 2);
+        }
+        // two spawned tiles always leave a move, and never the no moves flag
+        CHECK(tiles == 2);
+        CHECK(test.getValidMoves() != 0);
+        CHECK(test.getValidMoves() < 0b00010000);
+    }
+};